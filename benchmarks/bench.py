@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks of the hot paths: crawl, snippet construction, open, highlight, save and search
+
+    python benchmarks/bench.py --files 2000 --output before.json
+    python benchmarks/bench.py --files 2000 --output after.json
+    python benchmarks/bench.py --compare before.json after.json
+
+the corpus is generated from a seed, so two runs with the same options work on
+the same files, the Tk paths run on a real Text widget when a display is
+available (e.g. under xvfb-run) and on a recording stub otherwise
+"""
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from statistics import median
+from time import perf_counter, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLES = {
+    'python': 'def {name}(values, limit={n}):\n'
+              '    """sum the values below limit"""\n'
+              '    total = 0  # running total\n'
+              '    for value in values:\n'
+              '        if value < limit:\n'
+              '            total += value * {n}\n'
+              '    return "%s: %d" % ("{name}", total)\n\n',
+    'c': 'static int {name}(const int *values, size_t n) {{\n'
+         '    /* sum the values below {n} */\n'
+         '    int total = 0;\n'
+         '    for (size_t i = 0; i < n; i++) {{\n'
+         '        if (values[i] < {n}) total += values[i];\n'
+         '    }}\n'
+         '    printf("%s: %d\\n", "{name}", total);\n'
+         '    return total;\n'
+         '}}\n\n',
+    'html': '<div class="{name}" id="item-{n}">\n'
+            '  <!-- item {n} -->\n'
+            '  <a href="/items/{n}?ref={name}">{name}</a>\n'
+            '  <span style="color: #{n:06x}">{n}</span>\n'
+            '</div>\n',
+    'sql': 'SELECT id, name, count(*) AS {name}\n'
+           '  FROM items -- item {n}\n'
+           ' WHERE price < {n} AND name LIKE \'%{name}%\'\n'
+           ' GROUP BY id, name ORDER BY {name} DESC;\n\n',
+    'text': 'Note {n} about {name}: remember to check the values below {n} before the release.\n',
+}
+WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet')
+TAGS = ('work', 'home', 'db', 'web', 'tools', 'old', 'draft', 'ops')
+
+
+def make_body(lexer_alias, size, rng):
+    parts = []
+    length = 0
+    while length < size:
+        part = SAMPLES[lexer_alias].format(name='%s_%s' % (rng.choice(WORDS), rng.choice(WORDS)),
+                                           n=rng.randrange(1, 100000))
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts)
+
+
+def make_corpus(directory, files=1000, depth=3, fanout=4, size=2000, lexers=tuple(SAMPLES), seed=0):
+    """
+    write a synthetic snippet tree, returns the list of snippet files
+
+    files are spread over a tree of groups fanout wide and depth deep, sizes vary
+    around size, lexers are picked round robin
+    """
+    rng = random.Random(seed)
+    groups = ['']
+    level = ['']
+    for d in range(depth):
+        level = [os.path.join(group, 'group%d_%d' % (d, i)) for group in level for i in range(fanout)]
+        groups.extend(level)
+    filenames = []
+    for i in range(files):
+        group = os.path.join(directory, groups[rng.randrange(len(groups))])
+        if not os.path.exists(group):
+            os.makedirs(group)
+        lexer_alias = lexers[i % len(lexers)]
+        tags = rng.sample(TAGS, rng.randrange(0, 3))
+        filename = os.path.join(group, 'snippet%05d.pycsm' % i)
+        with open(filename, 'w') as f:
+            f.write(', '.join([lexer_alias] + tags) + '\n')
+            f.write(make_body(lexer_alias, int(size * rng.uniform(0.5, 1.5)), rng))
+        filenames.append(filename)
+    return filenames
+
+
+class RecordingText(object):
+    """
+    stands in for the Text widget when there is no display, counts the Tcl calls
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def tag_add(self, tag, *indices):
+        self.calls += 1
+
+    def tag_remove(self, tag, *indices):
+        self.calls += 1
+
+
+def measure(func, repeat=5, setup=None, memory=True):
+    """
+    time func repeat times (setup runs before every call and is not timed),
+    the peak memory is taken from an extra run under tracemalloc
+    """
+    runs = []
+    value = None
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        t = perf_counter()
+        value = func(arg) if setup is not None else func()
+        runs.append(perf_counter() - t)
+    result = dict(min=min(runs), median=median(runs), runs=runs)
+    if memory:
+        arg = setup() if setup is not None else None
+        gc.collect()
+        tracemalloc.start()
+        func(arg) if setup is not None else func()
+        result['peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    if isinstance(value, (int, float)):
+        result['value'] = value
+    return result
+
+
+def bench_crawl(base_dir, cache, repeat):
+    from pysnippetmanager.crawler import Crawler
+    from pysnippetmanager.index import SnippetIndex
+
+    def cold():
+        return sum(1 for item in Crawler(base_dir).crawl() if item[0] == 'snippet')
+
+    index_file = os.path.join(cache, 'bench_index.sqlite')
+
+    def warm():
+        index = SnippetIndex(base_dir, filename=index_file)
+        n = 0
+        for item in Crawler(base_dir, index=index).crawl():
+            if item[0] == 'snippet':
+                n += 1
+                if not item[4]:
+                    index.store(item[1], item[2], _Header(item[3]))
+        index.commit()
+        index.close()
+        return n
+
+    warm()  # fill the index
+
+    from pysnippetmanager.storage import FileBackend, SqliteBackend, migrate
+    database = os.path.join(cache, 'bench_snippets.sqlite')
+    if os.path.exists(database):
+        os.remove(database)
+    backend = SqliteBackend(database)
+    for result in migrate(FileBackend(base_dir), backend, history=False):
+        pass
+
+    def sqlite():
+        return sum(1 for item in backend.crawler().crawl() if item[0] == 'snippet')
+
+    return {'crawl.cold': measure(cold, repeat), 'crawl.indexed': measure(warm, repeat),
+            'crawl.sqlite': measure(sqlite, repeat)}
+
+
+class _Header(object):
+    def __init__(self, header):
+        from pysnippetmanager.metadata import parse_header
+        self.lexer_alias, self.tags = parse_header(header)
+        self.label = self.group = ''
+
+
+def bench_snippets(base_dir, filenames, repeat):
+    from pysnippetmanager.snippet import Snippet
+
+    def construct():
+        return len([Snippet(filename, base_dir=base_dir) for filename in filenames])
+
+    def body():
+        return sum(len(Snippet(filename, base_dir=base_dir).snippet) for filename in filenames[:200])
+
+    return {'snippet.construct': measure(construct, repeat), 'snippet.open_body': measure(body, repeat)}
+
+
+def bench_highlight(filenames, repeat, text_widget=None):
+    from pysnippetmanager.highlighter import Highlighter
+    from pysnippetmanager.lexers import get_lexer
+    from pysnippetmanager.metadata import parse_header, read_header, read_body
+    from pysnippetmanager.spans import apply_spans
+    results = {}
+    by_lexer = {}
+    for filename in filenames:
+        by_lexer.setdefault(parse_header(read_header(filename))[0], filename)
+    for lexer_alias, filename in sorted(by_lexer.items()):
+        text = read_body(filename) * 20
+        lexer = get_lexer(lexer_alias)
+
+        def full():
+            highlighter = Highlighter(lexer)
+            highlighter.update(text)
+            return len(highlighter.tags)
+
+        def fresh():
+            highlighter = Highlighter(lexer)
+            highlighter.update(text)
+            return highlighter
+
+        def edit(highlighter):
+            middle = len(text) // 2
+            start, end = highlighter.update(text[:middle] + 'x' + text[middle:])
+            return end - start
+
+        def retag(highlighter):
+            widget = text_widget if text_widget is not None else RecordingText()
+            apply_spans(widget, highlighter.text, 0, len(highlighter.text),
+                        highlighter.spans(0, len(highlighter.text)), set(highlighter.tags))
+            return getattr(widget, 'calls', 0)
+
+        results['highlight.full.%s' % lexer_alias] = measure(full, repeat)
+        results['highlight.edit.%s' % lexer_alias] = measure(edit, repeat, setup=fresh)
+        if text_widget is not None:
+            text_widget.delete('1.0', 'end')
+            text_widget.insert('1.0', text)
+        results['highlight.retag.%s' % lexer_alias] = measure(retag, repeat, setup=fresh)
+        results['highlight.retag.%s' % lexer_alias]['widget'] = 'tk' if text_widget is not None else 'stub'
+    return results
+
+
+def bench_save(base_dir, filenames, repeat):
+    from pysnippetmanager.saver import SaveQueue
+    from pysnippetmanager.snippet import Snippet
+    targets = filenames[:50]
+    counter = [0]
+
+    def edited():
+        snippets = []
+        for filename in targets:
+            snippet = Snippet(filename, base_dir=base_dir)
+            counter[0] += 1
+            snippet.snippet = snippet.snippet + '# edit %d\n' % counter[0]
+            snippets.append(snippet)
+        return snippets
+
+    def save(snippets):
+        for snippet in snippets:
+            snippet.save()
+        return len(snippets)
+
+    def queued(snippets):
+        queue = SaveQueue()
+        queue.start()
+        for snippet in snippets:
+            snippet.save(queue)
+        queue.flush()
+        queue.stop()
+        return queue.stats['written']
+
+    return {'save.sync': measure(save, repeat, setup=edited), 'save.queue': measure(queued, repeat, setup=edited)}
+
+
+def bench_search(base_dir, filenames, repeat):
+    from pysnippetmanager.metadata import parse_header, read_header
+    from pysnippetmanager.quick_open import QuickOpenIndex
+    from pysnippetmanager.search import SearchIndex
+    jobs = []
+    for filename in filenames:
+        lexer_alias, tags = parse_header(read_header(filename))
+        jobs.append((filename, filename, lexer_alias, tags, os.path.basename(filename), ''))
+
+    def build():
+        index = SearchIndex()
+        for job in jobs:
+            index.add_file(*job)
+        return len(index.postings)
+
+    index = SearchIndex()
+    for job in jobs:
+        index.add_file(*job)
+
+    def query():
+        return sum(len(index.search(q)) for q in ('alpha', 'values total', 'bra*', '*elt*', 'tag:db echo',
+                                                  'lang:python in:comment sum'))
+
+    paths = [os.path.relpath(filename, base_dir) for filename in filenames]
+
+    def quick_open_add():
+        quick_open = QuickOpenIndex()
+        for i, path in enumerate(paths):
+            quick_open.add(i, path)
+        return quick_open
+
+    quick_open = quick_open_add()
+    quick_open.index_pending()
+
+    def palette():
+        return sum(len(quick_open.search(q)) for q in ('s', 'sn', 'snip', 'g1s00', 'group2_3', 'zz'))
+
+    return {'search.build': measure(build, repeat), 'search.query': measure(query, repeat),
+            'quick_open.add': measure(quick_open_add, repeat),
+            'quick_open.index': measure(lambda: quick_open_add().index_pending(), repeat),
+            'quick_open.query': measure(palette, repeat)}
+
+
+def text_widget():
+    """
+    a real Text widget if Tk can open a display, None otherwise
+    """
+    try:
+        from tkinter import Tk, Text, TclError
+    except ImportError:
+        return None
+    try:
+        root = Tk()
+    except TclError:
+        return None
+    root.withdraw()
+    return Text(root)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    import pygments
+    work_dir = tempfile.mkdtemp(prefix='pysnippetmanager-bench-')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(work_dir, 'cache')
+    base_dir = os.path.join(work_dir, 'snippets')
+    benches = set(args.only or ('crawl', 'snippet', 'highlight', 'save', 'search'))
+    try:
+        t = perf_counter()
+        filenames = make_corpus(base_dir, args.files, args.depth, args.fanout, args.size,
+                                tuple(args.lexers), args.seed)
+        sys.stderr.write('corpus of %d files in %.1f s\n' % (len(filenames), perf_counter() - t))
+        results = {}
+        if 'crawl' in benches:
+            results.update(bench_crawl(base_dir, os.environ['XDG_CACHE_HOME'], args.repeat))
+        if 'snippet' in benches:
+            results.update(bench_snippets(base_dir, filenames, args.repeat))
+        if 'highlight' in benches:
+            results.update(bench_highlight(filenames, args.repeat, text_widget() if not args.stub else None))
+        if 'save' in benches:
+            results.update(bench_save(base_dir, filenames, args.repeat))
+        if 'search' in benches:
+            results.update(bench_search(base_dir, filenames, args.repeat))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return dict(meta=dict(commit=git_commit(), time=time(), python=platform.python_version(),
+                          pygments=pygments.__version__, platform=platform.platform(),
+                          corpus=dict(files=args.files, depth=args.depth, fanout=args.fanout, size=args.size,
+                                      lexers=args.lexers, seed=args.seed),
+                          repeat=args.repeat),
+                results=results)
+
+
+def compare(old_file, new_file):
+    """
+    print the median of every benchmark of two result files and their ratio
+    """
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print('%-32s %12s %12s %8s' % ('benchmark', 'old ms', 'new ms', 'new/old'))
+    for name in sorted(set(old['results']) | set(new['results'])):
+        a = old['results'].get(name, {}).get('median')
+        b = new['results'].get(name, {}).get('median')
+        ratio = '%8.2f' % (b / a) if a and b else '%8s' % '-'
+        print('%-32s %12s %12s %s' % (name, '%.2f' % (a * 1000) if a else '-', '%.2f' % (b * 1000) if b else '-',
+                                      ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the hot paths of pySnippetManager')
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--size', type=int, default=2000, help='average body size in chars')
+    parser.add_argument('--lexers', nargs='+', default=list(SAMPLES), choices=list(SAMPLES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=('crawl', 'snippet', 'highlight', 'save', 'search'))
+    parser.add_argument('--stub', action='store_true', help='use the recording stub even if Tk is available')
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    results = run(args)
+    data = json.dumps(results, indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,17 +13,34 @@ __email__ = "m.schroeder@tu-berlin.de"
 __status__ = "Alpha"
 __docformat__ = 'reStructuredText'
 
-try:
-    from tkinter import *
-except ImportError:
-    raise ModuleNotFoundError
+import sys
 
-from pysnippetmanager.app import App
 
+def run(argv=None):
+    """
+    start the gui, the window is shown before the snippets and lexers are loaded
 
-def run():
+    --profile-startup prints the duration of every startup phase to stderr,
+    --stats turns on the timers and counters of the stats window (F12), with a
+    command (list, search, cat, tag, reindex, export, import, detect, migrate) as
+    first argument the command line interface runs instead, without importing tkinter
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    from pysnippetmanager.cli import COMMANDS, main
+    if argv and (argv[0] in COMMANDS or argv[0] in ('-h', '--help', '--base-dir')):
+        return main(argv)
+    from pysnippetmanager.profiling import PhaseTimer, STATS
+    timer = PhaseTimer(enabled='--profile-startup' in argv)
+    STATS.enabled = '--stats' in argv
+    try:
+        from tkinter import Tk
+    except ImportError:
+        raise ModuleNotFoundError
+    from pysnippetmanager.app import App
+    timer.phase('imports')
     root = Tk()  # Tk()
-    App(root)
+    timer.phase('tk')
+    App(root, startup_timer=timer)
     root.mainloop()
 
 
@@ -31,4 +48,4 @@ if __name__ == "__main__":
     """
     the main code block
     """
-    run()
+    sys.exit(run())
@@ -1,6 +1,3 @@
-from pygments.lexers import get_all_lexers
-from pygments.styles import STYLE_MAP
-
 try:
     from tkinter import *
     from tkinter import messagebox
@@ -9,11 +6,27 @@ try:
 except ImportError:
     raise ModuleNotFoundError
 import os
-import re
-import fnmatch
+import threading
+from queue import Queue, Empty
 from pysnippetmanager.file_browser import FileBrowser
 from pysnippetmanager.text_editor import TextEditor
 from pysnippetmanager.snippet import Snippet
+from pysnippetmanager.lexers import all_lexers
+from pysnippetmanager.index import SnippetIndex
+from pysnippetmanager.tokenizer import TokenizerPool
+from pysnippetmanager.watcher import create_watcher
+from pysnippetmanager.search import SearchIndex, SearchIndexer
+from pysnippetmanager.utils import PaletteDialog, StringInputDialog
+from pysnippetmanager.quick_open import QuickOpenIndex
+from pysnippetmanager.profiling import PhaseTimer, STATS
+from pysnippetmanager.saver import SaveQueue
+from pysnippetmanager.tag_index import TagIndex
+from pysnippetmanager.tag_browser import TagBrowser
+from pysnippetmanager.detect import get_detector, needs_detection, set_lexer
+from pysnippetmanager.storage import open_backend
+from pysnippetmanager.archive import export_archive, import_archive
+from pysnippetmanager.stats_window import StatsWindow
+from functools import partial
 
 
 class App(object):
@@ -23,34 +36,80 @@ class App(object):
     frame = None
     snippets = {}
     groups = {}
+    filenames = {}  # normalized filename -> iid of the snippet
     last_dir = "~/"
     base_dir = "~/"
     lexer_options = None
     lexers = None
     lexer_option_menu = None
+    index = None
+    backend = None  # the storage backend of base_dir
+    watcher = None
+    crawl = None
+    search_index = None
+    search_indexer = None
+    quick_open_index = None
+    quick_open_budget = 8  # max time in ms a slice of quick open indexing may block the main loop
+    _quick_open_timer = None
+    startup_timer = None
+    save_queue = None
+    save_poll_interval = 50  # ms between two checks for finished writes
+    quit_timeout = 10  # s to wait for the queued writes when quitting
+    _save_timer = None
+    tag_index = None
+    tag_browser = None
+    tags_delay = 200  # ms between a tag change and the update of the tag sidebar
+    _tags_timer = None
+    starting = True  # the startup stages are still running
+    detector = None
+    stats_window = None
+    _crawl_t0 = None  # STATS start of the running crawl
+    detections = {}  # snippet -> future of the lexer detection of a new snippet
+    detect_results = None  # (filename, alias) of the bulk detection, filled by its thread
+    detect_poll_interval = 200  # ms between two checks for detected lexers
+    _detect_timer = None
+    _detect_thread = None
+    archive_results = []  # (filename, status, error) of the running import
+    archive_message = None  # the outcome of the running export
+    _archive_thread = None
+    archive_poll_interval = 200  # ms between two checks for a finished import or export
+    crawl_batch_size = 2000  # max snippets added to the tree per main loop turn
+    watch_interval = 500  # ms between two checks for file events
+    search_index_retry = 1000  # ms until a busy search indexer is asked again
+    _search_index_timer = None
     id = 0
 
-    def __init__(self, master):
-        self.init_lexers()
+    def __init__(self, master, startup_timer=None):
+        self.startup_timer = startup_timer or PhaseTimer()
+        self.lexers = {}
+        self.quick_open_index = QuickOpenIndex()
+        self.tag_index = TagIndex()
         self.master = master
         self.frame = Frame(master)
         self.frame2 = Frame(master, width=400)
+        self.frame3 = Frame(master, width=150)
         self.master.winfo_toplevel().title("pySnippetManager")
 
         self.text = TextEditor(self.frame)
+        self.text.tokenizer = TokenizerPool()
+        self.save_queue = SaveQueue()
+        self.save_queue.start()
         self.tree = FileBrowser(self.frame2, app=self)
+        self.tag_browser = TagBrowser(self.frame3, self.tag_filter_changed)
+        self.detections = {}
+        self.detect_results = Queue()
 
         # create a toolbar
         toolbar = Frame(master)
 
         # select lexer menu
         self.lexer_options = StringVar(toolbar)
-        self.lexer_option_menu = ttk.Combobox(toolbar, textvariable=self.lexer_options, values=list(self.lexers.keys()))
+        self.lexer_option_menu = ttk.Combobox(toolbar, textvariable=self.lexer_options, values=())
         self.lexer_option_menu.bind("<<ComboboxSelected>>", self.lexer_selected)
         self.lexer_option_menu.bind("<FocusOut>", self.lexer_selected)
         # select highlight style menu
         self.style_options = StringVar(toolbar)
-        self.style_option_menu = ttk.Combobox(toolbar, textvariable=self.style_options, values=list(STYLE_MAP.keys()))
+        self.style_option_menu = ttk.Combobox(toolbar, textvariable=self.style_options, values=())
         self.style_option_menu.bind("<<ComboboxSelected>>", self.style_selected)
         self.style_option_menu.bind("<FocusOut>", self.style_selected)
         self.style_option_menu.set(self.text.style_name)
@@ -58,18 +117,25 @@ class App(object):
         b_new = Button(toolbar, text="NEW", width=6, command=self.new)
         b_save = Button(toolbar, text="SAVE", width=6, command=self.save)
         b_rd = Button(toolbar, text="RESCAN DIR", width=10, command=self.crawler)
+        b_detect = Button(toolbar, text="DETECT", width=6, command=self.detect_lexers)
         b_quit = Button(toolbar, text="QUIT", width=6, command=self.quit)
+        l_search = Label(toolbar, text="Search")
+        self.search_entry = Entry(toolbar, width=30)
+        self.search_entry.bind("<Return>", self.search)
         l_lang = Label(toolbar, text="Lang")
         l_style = Label(toolbar, text="Style")
 
         b_new.pack(side=LEFT, padx=2, pady=2)
         b_save.pack(side=LEFT, padx=2, pady=2)
         b_rd.pack(side=LEFT, padx=2, pady=2)
+        b_detect.pack(side=LEFT, padx=2, pady=2)
         b_quit.pack(side=LEFT, padx=2, pady=2)
         l_lang.pack(side=LEFT, padx=2, pady=2)
         self.lexer_option_menu.pack(side=LEFT, padx=2, pady=2)
         l_style.pack(side=LEFT, padx=2, pady=2)
         self.style_option_menu.pack(side=LEFT, padx=2, pady=2)
+        l_search.pack(side=LEFT, padx=2, pady=2)
+        self.search_entry.pack(side=LEFT, padx=2, pady=2)
         toolbar.pack(side=TOP, fill=X)
 
         self.tree.pack(side=LEFT, fill=Y, expand=YES)
@@ -77,20 +143,66 @@ class App(object):
         self.text.pack(side=LEFT, fill=BOTH, expand=YES)
         self.text.insert("1.0", "")
 
+        self.tag_browser.pack(side=LEFT, fill=Y, expand=YES)
+        self.frame3.pack(side=LEFT, fill=Y, expand=NO)
         self.frame2.pack(side=LEFT, fill=Y, expand=NO)
         self.frame.pack(side=LEFT, fill=BOTH, expand=YES)
+        self.master.bind_all("<Control-p>", self.quick_open)
+        self.master.bind_all("<F12>", self.toggle_stats)
 
-        # init content
+        # init content once the empty window is shown
+        self.startup_timer.phase('window')
+        self.master.after(1, self.startup, self.startup_stages())
+
+    def startup_stages(self):
+        """
+        the startup work that is done after the window is shown, one stage per main loop turn
+        """
+        self.master.update_idletasks()
+        self.startup_timer.phase('window shown')
+        yield
+        self.text.load_style()
+        self.init_styles()
+        self.startup_timer.phase('style')
+        yield
+        self.tree.load_images()
+        self.startup_timer.phase('images')
+        yield
         self.read_config()
+        self.startup_timer.phase('config')
         self.crawler()
+        self.startup_timer.phase('crawl started')
+        yield
+        self.start_watcher()
+        self.startup_timer.phase('watcher')
+        yield
+        self.init_lexers()
+        self.startup_timer.phase('lexers')
+        self.starting = False
+        if self.crawl.done:
+            self.startup_timer.report()
+
+    def startup(self, stages):
+        """
+        run the next startup stage
+        """
+        for _ in stages:
+            self.master.after(1, self.startup, stages)
+            break
 
     def init_lexers(self):
         """
         get all available lexers
         """
-        self.lexers = {}
-        for lexer in get_all_lexers():
-            self.lexers[lexer[1][0]] = lexer
+        self.lexers = all_lexers()
+        self.lexer_option_menu.configure(values=list(self.lexers.keys()))
+
+    def init_styles(self):
+        """
+        get all available highlight styles
+        """
+        from pygments.styles import STYLE_MAP
+        self.style_option_menu.configure(values=list(STYLE_MAP.keys()))
 
     def read_config(self):
         """
@@ -108,45 +220,399 @@ class App(object):
         """
         crawl all files in the base directory
         """
-        for iid in self.snippets.keys():
-            self.tree.delete(iid)
-        for iid in self.groups.keys():
-            self.tree.delete(iid)
+        if self.crawl is not None:
+            self.crawl.stop()
+        self.tree.clear()
 
         self.snippets = {}
         self.groups = {}
+        self.filenames = {}
+        self.quick_open_index.clear()
+        self.tag_index.clear()
+        self.tags_changed()
         self.id = 0
+        self.backend = open_backend(self.base_dir)
+        if self.index is None:
+            self.index = SnippetIndex(self.base_dir)
+        if self.search_index is None:
+            self.search_index = SearchIndex(self.base_dir)
+            self.search_index.backend = self.backend
+            self.search_indexer = SearchIndexer(self.search_index)
+        self.crawl = self.backend.crawler(index=self.index)
+        self._crawl_t0 = STATS.start()
+        STATS.start_profile('rescan')
+        self.crawl.start()
+        self.apply_crawl_results(self.crawl)
+
+    def apply_crawl_results(self, crawl):
+        """
+        add the snippets and groups the crawler found so far to the tree
+        """
+        if crawl is not self.crawl:
+            # a newer crawl was started meanwhile
+            return None
+        t0 = STATS.start()
+        for item in crawl.get_results(max_items=self.crawl_batch_size):
+            if item[0] == 'group':
+                self.tree.add_group(self.group_of(item[1]))
+                continue
+            kind, filename, st, header, cached = item
+            snippet = Snippet(filename=filename, base_dir=self.base_dir, header=header, backend=self.backend)
+            if not cached:
+                self.index.store(filename, st, snippet)
+                STATS.count('crawl.headers_read')
+            self.add_snippet(snippet)
+            STATS.count('crawl.snippets')
+        STATS.stop('crawl.batch', t0)
+        if crawl.done:
+            self.index.commit()
+            STATS.stop('crawl', self._crawl_t0)
+            self._crawl_t0 = None
+            STATS.stop_profile('rescan')
+            self.update_search_index()
+            self.startup_timer.phase('crawl (%d snippets)' % len(self.snippets))
+            if not self.starting:
+                self.startup_timer.report()
+        else:
+            self.master.after(20, self.apply_crawl_results, crawl)
+
+    def update_search_index(self, retry=False):
+        """
+        (re)index all snippets whose file changed in the background, if the indexer
+        is still busy a follow-up run is scheduled, so the snippets added meanwhile get indexed
+        """
+        if retry:
+            self._search_index_timer = None
+        if not self.search_indexer.done:
+            if self._search_index_timer is None:
+                self._search_index_timer = self.master.after(self.search_index_retry, self.update_search_index, True)
+            return False
+        if self._search_index_timer is not None:
+            self.master.after_cancel(self._search_index_timer)
+            self._search_index_timer = None
+        self.search_indexer.start([(snippet.filename, snippet.filename, snippet.lexer_alias, snippet.tags,
+                                    snippet.label, snippet.group) for snippet in self.snippets.values()])
+        return True
+
+    def index_snippet(self, snippet):
+        """
+        update the search index after a snippet was saved
+        """
+        self.search_index.add(snippet.filename, snippet.snippet, snippet.lexer_alias, snippet.tags,
+                              snippet.label, snippet.group, self.backend.stat(snippet.filename))
+
+    def index_file(self, snippet):
+        """
+        update the search index from the file of a snippet that changed on disk
+        """
+        try:
+            self.search_index.add_file(snippet.filename, snippet.filename, snippet.lexer_alias, snippet.tags,
+                                       snippet.label, snippet.group)
+        except (OSError, UnicodeError):
+            self.search_index.remove(snippet.filename)
+
+    def toggle_stats(self, event=None):
+        """
+        open or close the stats window
+        """
+        if self.stats_window is not None:
+            self.stats_window.close()
+        else:
+            self.stats_window = StatsWindow(self.master, self)
+
+    def search(self, event=None):
+        """
+        show the snippets matching the query of the search box
+        """
+        PaletteDialog(self.master, self.search_results, self.tree.show_item,
+                      window_title="Search", query=self.search_entry.get())
+
+    def search_results(self, query):
+        """
+        (label, iid) of the snippets matching query
+        """
+        results = []
+        with STATS.timer('search.query'):
+            hits = self.search_index.search(query)
+        for score, doc_id in hits:
+            iid = self.filenames.get(os.path.normpath(doc_id))
+            if iid is not None:
+                snippet = self.snippets[iid]
+                results.append(('%s/%s  [%s]' % (snippet.group, snippet.label, snippet.lexer_alias), iid))
+        return results
+
+    def quick_open(self, event=None):
+        """
+        open a snippet by typing a part of its path
+        """
+        PaletteDialog(self.master, self.quick_open_results, self.tree.show_item, window_title="Quick Open")
+        return 'break'
+
+    def quick_open_results(self, query):
+        """
+        (label, iid) of the snippets whose path matches query
+        """
+        return [('%s/%s' % (self.snippets[iid].group, self.snippets[iid].label), iid)
+                for iid in self.quick_open_index.search(query)]
+
+    def schedule_quick_open_index(self):
+        if self._quick_open_timer is None:
+            self._quick_open_timer = self.master.after_idle(self.index_quick_open)
+
+    def index_quick_open(self):
+        """
+        index the paths added to the quick open index, in slices of quick_open_budget ms
+        """
+        self._quick_open_timer = None
+        if not self.quick_open_index.index_pending(self.quick_open_budget / 1000.):
+            self.schedule_quick_open_index()
+
+    def update_tags(self, snippet):
+        """
+        the tags of a snippet may have changed
+        """
+        iid = self.filenames.get(os.path.normpath(snippet.filename))
+        if iid is not None:
+            self.tag_index.add(iid, snippet.tags)
+            self.tags_changed()
+
+    def tags_changed(self):
+        """
+        update the tag sidebar and the tag filter once the changes have settled
+        """
+        if self._tags_timer is None:
+            self._tags_timer = self.master.after(self.tags_delay, self.refresh_tags)
+
+    def refresh_tags(self):
+        self._tags_timer = None
+        self.tag_browser.set_counts(self.tag_index.counts())
+        if self.tag_browser.selected_tags() or self.tree.filter is not None:
+            self.tag_browser.changed()
+
+    def tag_filter_changed(self, tags, mode):
+        """
+        show only the snippets with all (mode 'and') or any (mode 'or') of tags
+        """
+        if not tags:
+            if self.tree.filter is not None:
+                self.tree.set_filter(None)
+            return None
+        self.tree.set_filter(self.tag_index.match(tags, mode))
+
+    def clear_tag_filter(self):
+        self.tag_browser.clear_selection()
 
-        includes = ['*.pycsm']  # for files only
-        includes = r'|'.join([fnmatch.translate(x) for x in includes])
-        for root, subdirs, files in os.walk(self.base_dir):
-
-            files = [f for f in files if re.match(includes, f)]
-            for file in files:
-                if '.backup' in root:
-                    continue
-                self.snippets['%d' % self.id] = Snippet(filename=os.path.join(root, file),
-                                                        base_dir=self.base_dir)
-                self.tree.add_item(iid=self.id,
-                                   label=self.snippets['%d' % self.id].label,
-                                   lexer_alias=self.snippets['%d' % self.id].lexer_alias,
-                                   parent=self.snippets['%d' % self.id].group)
-                self.id += 1
-            for subdir in subdirs:
-                if subdir == '.backup':
-                    continue
-                self.tree.add_group(os.path.join(root, subdir).replace(os.path.expanduser(self.base_dir), ''))
+    def start_watcher(self):
+        """
+        watch the base directory for changes made outside of the app, a database is not watched
+        """
+        if not self.backend.on_disk:
+            return None
+        self.watcher = create_watcher(self.base_dir)
+        self.watcher.start()
+        self.master.after(self.watch_interval, self.apply_file_events)
+
+    def apply_file_events(self):
+        """
+        apply the changes reported by the watcher to the snippets and the tree,
+        the events are held back while an archive is imported
+        """
+        if self._archive_thread is not None:
+            self.master.after(self.watch_interval, self.apply_file_events)
+            return None
+        for event in self.watcher.get_events():
+            if event.kind == 'rescan':
+                # the watcher lost events, the tree is read again and the other events are stale
+                self.crawler()
+                break
+            if event.is_dir:
+                if event.kind == 'add':
+                    self.tree.add_group(self.group_of(event.path))
+                elif event.kind == 'delete':
+                    self.remove_group(self.group_of(event.path))
+                elif event.kind == 'move':
+                    self.move_group(event.path, event.dest_path)
+                continue
+            iid = self.filenames.get(os.path.normpath(event.path))
+            if event.kind in ('add', 'modify'):
+                if iid is None:
+                    iid = self.add_snippet(Snippet(filename=event.path, base_dir=self.base_dir,
+                                                   backend=self.backend))
+                elif self.snippets[iid] is not self.text.snippet:
+                    self.snippets[iid].reload()
+                    self.tree.update_item(iid, self.snippets[iid].lexer_alias)
+                    self.update_tags(self.snippets[iid])
+                self.index_file(self.snippets[iid])
+            elif event.kind == 'delete' and iid is not None:
+                self.remove_snippet(iid)
+            elif event.kind == 'move':
+                if iid is None:
+                    iid = self.add_snippet(Snippet(filename=event.dest_path, base_dir=self.base_dir,
+                                                   backend=self.backend))
+                else:
+                    self.search_index.remove(self.snippets[iid].filename)
+                    self.move_snippet(iid, event.dest_path)
+                self.index_file(self.snippets[iid])
+        self.master.after(self.watch_interval, self.apply_file_events)
+
+    def group_of(self, path):
+        """
+        the tree group of a directory
+        """
+        return path.replace(os.path.expanduser(self.base_dir), '')
+
+    def add_snippet(self, snippet):
+        """
+        add a snippet to the snippets and the tree, returns its iid
+        """
+        iid = '%d' % self.id
+        self.snippets[iid] = snippet
+        self.filenames[os.path.normpath(snippet.filename)] = iid
+        snippet.bind("after_save", partial(self.index_snippet, snippet))
+        snippet.bind("after_save", partial(self.update_tags, snippet))
+        self.quick_open_index.add(iid, '%s/%s' % (snippet.group, snippet.label))
+        self.schedule_quick_open_index()
+        self.tag_index.add(iid, snippet.tags)
+        self.tags_changed()
+        self.tree.add_item(iid=self.id,
+                           label=snippet.label,
+                           lexer_alias=snippet.lexer_alias,
+                           parent=snippet.group)
+        self.id += 1
+        return iid
+
+    def remove_snippet(self, iid):
+        """
+        remove a snippet from the snippets and the tree, an opened snippet stays in the editor
+        """
+        snippet = self.snippets.pop(iid)
+        self.filenames.pop(os.path.normpath(snippet.filename), None)
+        self.search_index.remove(snippet.filename)
+        self.quick_open_index.remove(iid)
+        self.tag_index.remove(iid)
+        self.tags_changed()
+        self.tree.remove_item(iid)
+
+    def move_snippet(self, iid, filename):
+        """
+        the file of a snippet was moved to filename
+        """
+        snippet = self.snippets[iid]
+        self.filenames.pop(os.path.normpath(snippet.filename), None)
+        snippet.set_filename(filename, self.base_dir)
+        self.filenames[os.path.normpath(snippet.filename)] = iid
+        self.quick_open_index.add(iid, '%s/%s' % (snippet.group, snippet.label))
+        self.schedule_quick_open_index()
+        self.tree.move_item(iid, snippet.label, snippet.group)
+
+    def remove_group(self, group_str):
+        """
+        remove a group with all its snippets
+        """
+        for iid, snippet in list(self.snippets.items()):
+            if snippet.group == group_str or snippet.group.startswith(group_str + '/'):
+                self.remove_snippet(iid)
+        self.tree.remove_group(group_str)
+
+    def move_group(self, path, dest_path):
+        """
+        the directory path was moved to dest_path
+        """
+        old_group = self.group_of(path)
+        new_group = self.group_of(dest_path)
+        groups = [group for group in self.groups
+                  if group == old_group or group.startswith(old_group + '/')]
+        moved = [(iid, snippet) for iid, snippet in self.snippets.items()
+                 if snippet.group == old_group or snippet.group.startswith(old_group + '/')]
+        for iid, snippet in moved:
+            self.remove_snippet(iid)
+        self.tree.remove_group(old_group)
+        for group in sorted(groups):
+            self.tree.add_group(new_group + group[len(old_group):])
+        for iid, snippet in moved:
+            filename = os.path.normpath(snippet.filename)
+            snippet.set_filename(os.path.normpath(dest_path) + filename[len(os.path.normpath(path)):],
+                                 self.base_dir)
+            self.add_snippet(snippet)
 
     def save(self):
         """
-        save the current Snippet
+        save the current Snippet, the file is written in the background
         """
         if self.text.snippet is not None:
-            self.text.snippet.save()
+            self.text.flush_highlight()
+            if self.text.snippet.save(self.save_queue) and self._save_timer is None:
+                self.update_save_state()
+                self._save_timer = self.master.after(self.save_poll_interval, self.apply_save_results)
+            snippet = self.text.snippet
+            if snippet.detect_lexer and snippet not in self.detections and snippet.snippet.strip():
+                self.detections[snippet] = self.get_detector().submit(snippet.snippet, snippet.label)
+                self.schedule_detection()
+
+    @property
+    def pending_saves(self):
+        """
+        the filenames of the snippets that are not written yet
+        """
+        return self.save_queue.pending
+
+    @property
+    def failed_saves(self):
+        """
+        filename -> error message of the snippets whose last write failed
+        """
+        return dict(self.save_queue.failed)
+
+    def apply_save_results(self):
+        """
+        finish the writes of the save queue on the Tk thread
+        """
+        self._save_timer = None
+        for snippet, error in self.save_queue.get_results():
+            if error is None:
+                snippet.trigger_event("after_save")
+            else:
+                # keep it dirty, the next save tries again
+                snippet.snippet_changed = True
+        self.update_save_state()
+        if self.save_queue.pending:
+            self._save_timer = self.master.after(self.save_poll_interval, self.apply_save_results)
+
+    def update_save_state(self):
+        """
+        show pending and failed saves in the window title
+        """
+        title = "pySnippetManager"
+        if self.save_queue.failed:
+            title += " - saving failed: %s" % ", ".join(os.path.basename(filename)
+                                                          for filename in sorted(self.save_queue.failed))
+        elif self.save_queue.pending:
+            title += " - saving"
+        self.master.winfo_toplevel().title(title)
 
     def quit(self):
         if messagebox.askokcancel("Quit", "Do you really wish to quit?"):
             self.save()
+            flushed = self.save_queue.flush(timeout=self.quit_timeout)
+            if self._save_timer is not None:
+                self.master.after_cancel(self._save_timer)
+                self._save_timer = None
+            self.apply_save_results()
+            if not flushed and not messagebox.askokcancel(
+                    "Quit", "These snippets are not saved yet:\n%s\n\nQuit anyway?" % "\n".join(
+                        sorted(self.save_queue.pending))):
+                # the writes go on, apply_save_results keeps polling them
+                return None
+            if self.save_queue.failed and not messagebox.askokcancel(
+                    "Quit", "Saving failed:\n%s\n\nQuit anyway?" % "\n".join(
+                        "%s: %s" % item for item in sorted(self.save_queue.failed.items()))):
+                return None
+            self.save_queue.stop()
+            self.text.tokenizer.shutdown()
+            if self.detector is not None:
+                self.detector.shutdown()
+            if self.watcher is not None:
+                self.watcher.stop()
             self.master.destroy()
 
     def close(self):
@@ -159,6 +625,9 @@ class App(object):
         """
         open a new Snippet
         """
+        if not self.backend.on_disk:
+            # there are no files to pick
+            return self.quick_open()
         filename = askopenfilename(initialdir=self.last_dir,
                                    filetypes=(("Snippet Files", "*.pycsm"),
                                               ("all files", "*.*")))
@@ -167,7 +636,7 @@ class App(object):
         if len(filename) == 0:
             return False
         self.last_dir = os.path.dirname(os.path.abspath(filename))
-        self.text.snippet = Snippet(filename=filename, base_dir=self.base_dir)
+        self.text.snippet = Snippet(filename=filename, base_dir=self.base_dir, backend=self.backend)
         self.lexer_option_menu.set(self.text.snippet.lexer_alias)
 
     def open_base_dir(self):
@@ -187,11 +656,17 @@ class App(object):
         """
         create a new Snippet
         """
-
-        filename = asksaveasfilename(initialdir=os.path.join(self.base_dir, subpath[1:]),
-                                     title="Select file",
-                                     filetypes=(("Snippet Files", "*.pycsm"),
-                                                ("all files", "*.*")))
+        if self.backend.on_disk:
+            filename = asksaveasfilename(initialdir=os.path.join(self.base_dir, subpath[1:]),
+                                         title="Select file",
+                                         filetypes=(("Snippet Files", "*.pycsm"),
+                                                    ("all files", "*.*")))
+        else:
+            name_dialog = StringInputDialog(self.master, "Name", window_title="Create new snippet")
+            name_dialog.wait_for_input()
+            filename = name_dialog.get_string()
+            if filename:
+                filename = os.path.join(self.backend.base_dir, subpath[1:], filename + '.pycsm')
         if filename is None:
             return False
         if len(filename) == 0:
@@ -199,24 +674,195 @@ class App(object):
         self.text.snippet = Snippet(filename=filename,
                                     lexer_alias='text',
                                     create=True,
-                                    base_dir=self.base_dir)
+                                    base_dir=self.base_dir,
+                                    backend=self.backend)
+        # the lexer is detected on the first save with content unless one is picked before
+        self.text.snippet.detect_lexer = True
         self.lexer_option_menu.set(self.text.snippet.lexer_alias)
         self.last_dir = os.path.dirname(os.path.abspath(filename))
-        self.snippets['%d' % self.id] = self.text.snippet
-        self.tree.add_item(iid=self.id,
-                           label=self.snippets['%d' % self.id].label,
-                           lexer_alias=self.snippets['%d' % self.id].lexer_alias,
-                           parent=self.snippets['%d' % self.id].group)
-        self.id += 1
+        self.add_snippet(self.text.snippet)
 
     def lexer_selected(self, event=None):
         """
 
         """
         if self.text.snippet is not None:
+            if self.lexer_option_menu.get() != self.text.snippet.lexer_alias:
+                self.text.snippet.detect_lexer = False
             self.text.snippet.lexer = self.lexer_option_menu.get()
             self.lexer_option_menu.set(self.text.snippet.lexer_alias)
 
+    def export_archive(self, group=''):
+        """
+        write the snippets of group and its subgroups to an archive in the background
+        """
+        if self._archive_thread is not None:
+            return False
+        filename = asksaveasfilename(initialdir=self.last_dir, title="Export archive",
+                                     filetypes=(("Archives", "*.tar.gz *.tar.xz *.tar.bz2 *.tar.zst *.tar *.zip"),
+                                                ("all files", "*.*")))
+        if not filename:
+            return False
+        backups = messagebox.askyesno("Export archive", "Include the backed up versions?")
+        group = group.rstrip('/')
+        snippets = [(snippet.filename, snippet.header) for snippet in self.snippets.values()
+                    if not group or snippet.group == group or snippet.group.startswith(group + '/')]
+        self.save()
+        self.save_queue.flush()
+
+        def run():
+            try:
+                n = export_archive(self.backend, filename, snippets, backups=backups)
+                self.archive_message = "%d snippets exported to %s" % (n, filename)
+            except (OSError, ValueError) as e:
+                self.archive_message = "exporting failed: %s" % e
+
+        self._archive_thread = threading.Thread(target=run, name='archive', daemon=True)
+        self._archive_thread.start()
+        self.master.after(self.archive_poll_interval, self.apply_archive_results)
+
+    def import_archive(self):
+        """
+        merge the snippets of an archive into the base directory in the background,
+        the tree is updated in one go once the import is done
+        """
+        if self._archive_thread is not None:
+            return False
+        filename = askopenfilename(initialdir=self.last_dir, title="Import archive",
+                                   filetypes=(("Archives", "*.tar.gz *.tgz *.tar.xz *.tar.bz2 *.tar.zst *.tar *.zip"),
+                                              ("all files", "*.*")))
+        if not filename:
+            return False
+        backups = messagebox.askyesno("Import archive", "Import the backed up versions as well?")
+        self.save()
+        self.save_queue.flush()
+
+        def run():
+            results = []
+            try:
+                for result in import_archive(self.backend, filename, backups=backups):
+                    results.append(result)
+            except (OSError, ValueError) as e:
+                results.append((filename, 'failed', str(e)))
+            self.archive_results = results
+
+        self._archive_thread = threading.Thread(target=run, name='archive', daemon=True)
+        self._archive_thread.start()
+        self.master.after(self.archive_poll_interval, self.apply_archive_results)
+
+    def apply_archive_results(self):
+        """
+        show the outcome of an export, merge the snippets of an import into the tree
+        """
+        if self._archive_thread.is_alive():
+            self.master.after(self.archive_poll_interval, self.apply_archive_results)
+            return None
+        self._archive_thread = None
+        if self.archive_message is not None:
+            messagebox.showinfo("Export archive", self.archive_message)
+            self.archive_message = None
+            return None
+        results, self.archive_results = self.archive_results, []
+        counts = {}
+        errors = []
+        for filename, status, error in results:
+            counts[status] = counts.get(status, 0) + 1
+            if error is not None:
+                errors.append('%s: %s' % (filename, error))
+            if status not in ('added', 'updated'):
+                continue
+            iid = self.filenames.get(os.path.normpath(filename))
+            if iid is None:
+                self.add_snippet(Snippet(filename=filename, base_dir=self.base_dir, backend=self.backend))
+            elif self.snippets[iid] is not self.text.snippet:
+                self.snippets[iid].reload()
+                self.tree.update_item(iid, self.snippets[iid].lexer_alias)
+                self.update_tags(self.snippets[iid])
+        self.update_search_index()
+        message = ", ".join("%d %s" % (count, status) for status, count in sorted(counts.items()))
+        if errors:
+            message += "\n\n" + "\n".join(errors[:20])
+        messagebox.showinfo("Import archive", message or "nothing to import")
+
+    def get_detector(self):
+        """
+        the lexer detector, created on first use, only call it on the Tk thread
+        """
+        if self.detector is None:
+            self.detector = get_detector()
+        return self.detector
+
+    def detect_lexers(self):
+        """
+        detect the lexers of all snippets without one in the background and rewrite their headers
+
+        the open snippet is left alone, its lexer is picked in the editor
+        """
+        if self._detect_thread is not None and self._detect_thread.is_alive():
+            return None
+        filenames = [snippet.filename for snippet in self.snippets.values()
+                     if snippet is not self.text.snippet and needs_detection(snippet.lexer_alias)]
+        # the detector is created here on the Tk thread, not by the detection thread
+        self._detect_thread = threading.Thread(target=self.run_detection, args=(self.get_detector(), filenames),
+                                               name='lexer detection', daemon=True)
+        self._detect_thread.start()
+        self.schedule_detection()
+
+    def run_detection(self, detector, filenames):
+        """
+        the bulk detection, runs in its own thread, the guesses run in the detector's worker processes,
+        it stops once the detector is shut down on quit
+        """
+        for filename, alias in detector.detect_files(filenames, self.backend):
+            if detector.closed:
+                break
+            if alias is None or alias == 'text':
+                continue
+            try:
+                set_lexer(filename, alias, self.backend)
+            except OSError:
+                continue
+            self.detect_results.put((filename, alias))
+        detector.dump()
+
+    def schedule_detection(self):
+        if self._detect_timer is None:
+            self._detect_timer = self.master.after(self.detect_poll_interval, self.apply_detections)
+
+    def apply_detections(self):
+        """
+        apply detected lexers on the Tk thread
+        """
+        self._detect_timer = None
+        running = self._detect_thread is not None and self._detect_thread.is_alive()
+        for snippet, future in list(self.detections.items()):
+            if not future.done():
+                continue
+            del self.detections[snippet]
+            if future.cancelled() or future.exception() is not None:
+                continue
+            alias = future.result()
+            if not snippet.detect_lexer or alias == 'text':
+                continue
+            snippet.detect_lexer = False
+            snippet.lexer = alias
+            if snippet is self.text.snippet:
+                self.lexer_option_menu.set(snippet.lexer_alias)
+            snippet.snippet_changed = True
+            if snippet.save(self.save_queue) and self._save_timer is None:
+                self._save_timer = self.master.after(self.save_poll_interval, self.apply_save_results)
+        while True:
+            try:
+                filename, alias = self.detect_results.get_nowait()
+            except Empty:
+                break
+            iid = self.filenames.get(os.path.normpath(filename))
+            if iid is not None and self.snippets[iid] is not self.text.snippet:
+                self.snippets[iid].reload()
+                self.tree.update_item(iid, self.snippets[iid].lexer_alias)
+        if self.detections or running:
+            self.schedule_detection()
+
     def style_selected(self, event=None):
         """
 
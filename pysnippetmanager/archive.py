@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+a snippet corpus as one archive file
+
+layout of the archive:
+    snippets/<group>/<label>.pycsm           header line and body of a snippet
+    backups/<group>/<label>.pycsm/<time>_<digest>   a backed up version, only with backups
+    manifest.jsonl                           one line per snippet: path, lexer, tags, size, sha1
+
+the versions of a snippet come right before the snippet itself and the manifest
+comes last, so both ends work on a stream with memory bounded by a few snippets
+"""
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import io
+import json
+import os
+import posixpath
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from pysnippetmanager.backup import content_hash
+from pysnippetmanager.metadata import parse_header
+
+SNIPPETS_DIR = 'snippets'
+BACKUPS_DIR = 'backups'
+MANIFEST = 'manifest.jsonl'
+# suffix -> tarfile stream mode
+TAR_MODES = (('.tar.gz', 'gz'), ('.tgz', 'gz'), ('.tar.xz', 'xz'), ('.tar.bz2', 'bz2'), ('.tar.zst', 'zst'),
+             ('.tar', ''))
+
+
+def archive_format(filename):
+    """
+    'zip' or the compression of a tar archive ('gz', 'xz', 'bz2', 'zst' or '') from the file name
+    """
+    name = filename.lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    for suffix, compression in TAR_MODES:
+        if name.endswith(suffix):
+            return compression
+    raise ValueError('unknown archive type %s, use .zip, .tar, .tar.gz, .tar.xz, .tar.bz2 or .tar.zst' % filename)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('.tar.zst archives need the zstandard package')
+    return zstandard
+
+
+class ArchiveWriter(object):
+    """
+    adds members to a tar stream or a zip file
+    """
+
+    def __init__(self, filename):
+        self.format = archive_format(filename)
+        self.file = open(filename, 'wb')
+        self.stream = None
+        if self.format == 'zip':
+            self.archive = zipfile.ZipFile(self.file, 'w', compression=zipfile.ZIP_DEFLATED)
+        elif self.format == 'zst':
+            self.stream = _zstandard().ZstdCompressor().stream_writer(self.file)
+            self.archive = tarfile.open(fileobj=self.stream, mode='w|')
+        else:
+            self.archive = tarfile.open(fileobj=self.file, mode='w|' + self.format)
+
+    def add(self, name, data, mtime=None):
+        mtime = time.time() if mtime is None else mtime
+        if self.format == 'zip':
+            info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self.archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = mtime
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def add_file(self, name, f):
+        """
+        add the content of an open binary file
+        """
+        f.seek(0)
+        if self.format == 'zip':
+            with self.archive.open(name, 'w') as member:
+                while True:
+                    chunk = f.read(1 << 20)
+                    if not chunk:
+                        break
+                    member.write(chunk)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = f.seek(0, os.SEEK_END)
+            info.mtime = time.time()
+            f.seek(0)
+            self.archive.addfile(info, f)
+
+    def close(self):
+        self.archive.close()
+        if self.stream is not None:
+            self.stream.close()
+        self.file.close()
+
+
+def iter_members(filename):
+    """
+    yield (name, data, mtime) of the file members of an archive in archive order,
+    raises ValueError for broken archives
+    """
+    try:
+        for member in _iter_members(filename):
+            yield member
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+        raise ValueError('%s is broken: %s' % (filename, e))
+
+
+def _iter_members(filename):
+    compression = archive_format(filename)
+    with open(filename, 'rb') as f:
+        if compression == 'zip':
+            with zipfile.ZipFile(f) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        yield info.filename, archive.read(info), time.mktime(info.date_time + (0, 0, -1))
+            return None
+        if compression == 'zst':
+            stream = _zstandard().ZstdDecompressor().stream_reader(f)
+            archive = tarfile.open(fileobj=stream, mode='r|')
+        else:
+            archive = tarfile.open(fileobj=f, mode='r|' + compression)
+        with archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info).read(), info.mtime
+
+
+def _member_name(*parts):
+    return posixpath.join(*[part.replace(os.sep, '/') for part in parts])
+
+
+def export_archive(backend, filename, snippets=None, backups=False):
+    """
+    write the snippets of backend to the archive filename, snippets is an iterable of
+    (path, header) and defaults to all snippets, with backups the backed up versions
+    are written as well
+
+    returns the number of exported snippets
+    """
+    if snippets is None:
+        snippets = ((item[1], item[3]) for item in backend.crawler().crawl() if item[0] == 'snippet')
+    writer = ArchiveWriter(filename)
+    count = 0
+    # the manifest is collected on disk and appended at the end
+    with tempfile.TemporaryFile() as manifest:
+        try:
+            for path, header in snippets:
+                rel = os.path.relpath(path, backend.base_dir)
+                try:
+                    body = backend.read_body(path)
+                    versions = backend.versions(path) if backups else []
+                    for version in reversed(versions):
+                        text = backend.read_version(path, version.digest)
+                        writer.add(_member_name(BACKUPS_DIR, rel, '%f_%s' % (version.time, version.digest)),
+                                   text.encode('utf-8'), version.time)
+                    st = backend.stat(path)
+                except (OSError, UnicodeError):
+                    continue
+                content = header + '\n' + body
+                writer.add(_member_name(SNIPPETS_DIR, rel), content.encode('utf-8'), st.st_mtime)
+                lexer_alias, tags = parse_header(header)
+                manifest.write((json.dumps(dict(path=rel.replace(os.sep, '/'), lexer=lexer_alias, tags=tags,
+                                                size=len(content), sha1=content_hash(content),
+                                                versions=len(versions))) + '\n').encode('utf-8'))
+                count += 1
+            writer.add_file(MANIFEST, manifest)
+        finally:
+            writer.close()
+    return count
+
+
+def read_manifest(filename):
+    """
+    the manifest entries of an archive
+    """
+    for name, data, mtime in iter_members(filename):
+        if name == MANIFEST:
+            return [json.loads(line) for line in data.decode('utf-8').splitlines() if line.strip()]
+    return []
+
+
+def _safe_rel(name, prefix):
+    """
+    the path below prefix/ of a member name, None for names that point elsewhere
+    """
+    rel = posixpath.normpath(name[len(prefix) + 1:])
+    if not name.startswith(prefix + '/') or rel.startswith('..') or posixpath.isabs(rel):
+        return None
+    return rel
+
+
+def _unchanged(backend, filename, content):
+    """
+    True if filename holds content already, the sizes are compared before the hashes
+    """
+    if backend.on_disk and backend.stat(filename).st_size != len(content.encode('utf-8')):
+        return False
+    current = backend.read_header(filename) + '\n' + backend.read_body(filename)
+    return content_hash(current) == content_hash(content)
+
+
+def _import_batch(backend, batch):
+    """
+    import a list of (filename, content, versions), the changed snippets are written with one write_many
+    """
+    results = []
+    writes = []
+    for filename, content, versions in batch:
+        try:
+            exists = backend.exists(filename)
+            if exists and _unchanged(backend, filename, content):
+                results.append((filename, 'skipped', None))
+                continue
+            for text, when in versions:
+                backend.record(filename, text, when)
+        except (OSError, UnicodeError) as e:
+            results.append((filename, 'failed', str(e)))
+            continue
+        writes.append((filename, content))
+        results.append((filename, 'updated' if exists else 'added', None))
+    failed = backend.write_many(writes)
+    return [(filename, 'failed', failed[filename]) if filename in failed else (filename, status, error)
+            for filename, status, error in results]
+
+
+def import_archive(backend, filename, backups=False, max_workers=4, batch_size=64):
+    """
+    merge the snippets of an archive into backend, snippets whose content is
+    the same are skipped, with backups the versions in the archive are added to
+    their history
+
+    the archive is read as a stream, the batches are compared and written in a
+    thread pool, yields (filename, 'added' | 'updated' | 'skipped' | 'failed', error)
+    """
+    pending = []
+    batch = []
+    versions = []  # the versions read since the last snippet
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import') as pool:
+        for name, data, mtime in iter_members(filename):
+            if name.startswith(BACKUPS_DIR + '/'):
+                rel = _safe_rel(name, BACKUPS_DIR)
+                if backups and rel is not None:
+                    directory, version = posixpath.split(rel)
+                    try:
+                        mtime = float(version.split('_', 1)[0])
+                    except ValueError:
+                        pass
+                    versions.append((directory, data.decode('utf-8', errors='replace'), mtime))
+                continue
+            rel = _safe_rel(name, SNIPPETS_DIR)
+            if rel is None:
+                continue
+            batch.append((os.path.join(backend.base_dir, *rel.split('/')), data.decode('utf-8', errors='replace'),
+                          [(text, when) for directory, text, when in versions if directory == rel]))
+            versions = []
+            if len(batch) >= batch_size:
+                pending.append(pool.submit(_import_batch, backend, batch))
+                batch = []
+            # keep the number of batches in memory bounded
+            while len(pending) > 2 * max_workers:
+                for result in pending.pop(0).result():
+                    yield result
+        if batch:
+            pending.append(pool.submit(_import_batch, backend, batch))
+        for future in pending:
+            for result in future.result():
+                yield result
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import json
+import os
+import re
+import threading
+import zlib
+from collections import namedtuple
+from datetime import datetime
+from difflib import SequenceMatcher
+from hashlib import sha1
+from time import time
+
+BACKUP_DIR = '.backup'
+OBJECTS_DIR = 'objects'
+
+Version = namedtuple('Version', ('time', 'digest', 'size'))
+
+
+def content_hash(text):
+    return sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def make_delta(base, text):
+    """
+    the line operations that turn base into text, ['=', i1, i2] copies base lines, ['+', lines] inserts
+
+    only the lines between the unchanged head and tail go through the SequenceMatcher
+    """
+    base_lines = base.splitlines(True)
+    lines = text.splitlines(True)
+    n = min(len(base_lines), len(lines))
+    head = 0
+    while head < n and base_lines[head] == lines[head]:
+        head += 1
+    tail = 0
+    while tail < n - head and base_lines[-1 - tail] == lines[-1 - tail]:
+        tail += 1
+    ops = [['=', 0, head]] if head else []
+    matcher = SequenceMatcher(None, base_lines[head:len(base_lines) - tail], lines[head:len(lines) - tail],
+                              autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(['=', head + i1, head + i2])
+        elif j2 > j1:
+            ops.append(['+', ''.join(lines[head + j1:head + j2])])
+    if tail:
+        ops.append(['=', len(base_lines) - tail, len(base_lines)])
+    return ops
+
+
+def apply_delta(base, ops):
+    base_lines = base.splitlines(True)
+    parts = []
+    for op in ops:
+        if op[0] == '=':
+            parts.extend(base_lines[op[1]:op[2]])
+        else:
+            parts.append(op[1])
+    return ''.join(parts)
+
+
+def select_versions(versions, keep_last, keep_daily, keep_weekly):
+    """
+    the versions a retention policy keeps, versions are sorted newest first
+
+    the newest keep_last versions, the newest version of each of the last keep_daily
+    days and of each of the last keep_weekly weeks that have versions
+    """
+    keep = set(versions[:keep_last])
+    days = {}
+    weeks = {}
+    for version in versions:
+        date = datetime.fromtimestamp(version.time)
+        day = date.date()
+        week = date.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days[day] = version
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks[week] = version
+    keep.update(days.values())
+    keep.update(weeks.values())
+    return [version for version in versions if version in keep]
+
+
+class BackupStore(object):
+    """
+    the versions of the snippets of one directory, kept in its .backup folder
+
+    every distinct content is stored once in objects/, zlib compressed and as a
+    line delta against the previously saved version where that is smaller, the
+    versions of a snippet are listed in <file name>.log, old versions are
+    thinned out by the retention policy
+
+    a version saved by the app goes into the log once the file is written, with
+    the modification time of the file, so a later backup can tell from a stat
+    whether the file still holds the latest version
+    """
+    directory = ''
+    keep_last = 10  # always keep the newest versions
+    keep_daily = 7  # newest version of each of the last days
+    keep_weekly = 8  # newest version of each of the last weeks
+    max_chain = 16  # max number of deltas between a version and a full copy
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.backup_dir = os.path.join(directory, BACKUP_DIR)
+        self.lock = threading.RLock()
+        self._last = {}  # file name -> (digest, text, chain length) of the latest version
+        self._imported = set()  # file names whose legacy copies were imported
+        self._disk = {}  # file name -> (mtime_ns, size) of a file known to hold the latest version
+        self._pending = {}  # file name -> Version that is logged once the file is written
+        self._logs = {}  # file name -> ((mtime_ns, size) of the log, versions newest first)
+        self._bases = {}  # digest -> digest of the delta base of the object, None for a full copy
+
+    def _log_file(self, name):
+        return os.path.join(self.backup_dir, name + '.log')
+
+    def _object_file(self, digest):
+        return os.path.join(self.backup_dir, OBJECTS_DIR, digest[:2], digest[2:] + '.z')
+
+    def _read_object(self, digest):
+        with open(self._object_file(digest), 'rb') as f:
+            obj = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        self._bases[digest] = obj['base']
+        return obj
+
+    def _write_object(self, digest, obj):
+        filename = self._object_file(digest)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(zlib.compress(json.dumps(obj).encode('utf-8')))
+        os.replace(filename + '.tmp', filename)
+        self._bases[digest] = obj['base']
+
+    def _base(self, digest):
+        if digest not in self._bases:
+            self._read_object(digest)
+        return self._bases[digest]
+
+    def _store(self, text, base=None):
+        """
+        store text unless it is stored already, returns (digest, chain length)
+        """
+        digest = content_hash(text)
+        if os.path.exists(self._object_file(digest)):
+            return digest, self._chain_length(digest)
+        if base is not None and base[2] < self.max_chain:
+            ops = make_delta(base[1], text)
+            inserted = sum(len(op[1]) for op in ops if op[0] == '+')
+            if inserted < len(text) // 2:
+                self._write_object(digest, dict(base=base[0], ops=ops))
+                return digest, base[2] + 1
+        self._write_object(digest, dict(base=None, text=text))
+        return digest, 0
+
+    def _chain_length(self, digest):
+        length = 0
+        digest = self._base(digest)
+        while digest is not None:
+            length += 1
+            digest = self._base(digest)
+        return length
+
+    def read(self, digest):
+        """
+        the content of a version
+        """
+        chain = []
+        obj = self._read_object(digest)
+        while obj['base'] is not None:
+            chain.append(obj['ops'])
+            obj = self._read_object(obj['base'])
+        text = obj['text']
+        for ops in reversed(chain):
+            text = apply_delta(text, ops)
+        return text
+
+    def versions(self, name):
+        """
+        the versions of the snippet file name, newest first
+
+        the log is read again only when its stat changed, e.g. after the command line appended to it
+        """
+        versions = []
+        with self.lock:
+            if name not in self._imported:
+                self._import_legacy(name)
+                self._imported.add(name)
+            try:
+                st = os.stat(self._log_file(name))
+                cached = self._logs.get(name)
+                if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size):
+                    return list(cached[1])
+                with open(self._log_file(name), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            versions.append(Version(*json.loads(line)))
+                        except (ValueError, TypeError):
+                            continue
+            except OSError:
+                return []
+            versions.sort(key=lambda version: version.time, reverse=True)
+            self._logs[name] = ((st.st_mtime_ns, st.st_size), versions)
+        return list(versions)
+
+    def _log_stat(self, name):
+        try:
+            st = os.stat(self._log_file(name))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _append(self, name, versions):
+        if not os.path.exists(self.backup_dir):
+            os.makedirs(self.backup_dir)
+        cached = self._logs.pop(name, None)
+        valid = cached is not None and cached[0] == self._log_stat(name)
+        with open(self._log_file(name), 'a', encoding='utf-8') as f:
+            for version in versions:
+                f.write(json.dumps(list(version)) + '\n')
+        if valid:
+            # nobody else wrote to the log since it was read, keep it without reading it again
+            updated = sorted(cached[1] + list(versions), key=lambda version: version.time, reverse=True)
+            self._logs[name] = (self._log_stat(name), updated)
+
+    def _latest(self, name, versions):
+        if name not in self._last:
+            if not versions:
+                return None
+            digest = versions[0].digest
+            self._last[name] = (digest, self.read(digest), self._chain_length(digest))
+        return self._last[name]
+
+    def backup(self, filename, text):
+        """
+        record text as the newest version of filename, returns the Version, call
+        written once text is in filename
+
+        the file on disk is recorded first unless it is known to hold the latest
+        version, so changes made outside of the app are kept as well
+        """
+        name = os.path.basename(filename)
+        with self.lock:
+            versions = self.versions(name)
+            if self._pending.pop(name, None) is not None:
+                # the previous write failed, continue from the logged version
+                self._last.pop(name, None)
+            base = self._latest(name, versions)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                st = None
+            if st is not None and self._disk.get(name) != (st.st_mtime_ns, st.st_size) and \
+                    versions and versions[0].time == st.st_mtime:
+                # written by the app with the latest version, e.g. before a restart
+                self._disk[name] = (st.st_mtime_ns, st.st_size)
+            if st is not None and self._disk.get(name) != (st.st_mtime_ns, st.st_size):
+                with open(filename, 'r', encoding='utf-8') as f:
+                    old = f.read()
+                digest = content_hash(old)
+                if base is None or base[0] != digest:
+                    digest, chain = self._store(old, base)
+                    base = (digest, old, chain)
+                    self._last[name] = base
+                    version = Version(st.st_mtime, digest, len(old))
+                    self._append(name, [version])
+                    versions.insert(0, version)
+            if base is not None and base[0] == content_hash(text):
+                return versions[0]
+            digest, chain = self._store(text, base)
+            self._last[name] = (digest, text, chain)
+            self._pending[name] = Version(time(), digest, len(text))
+            return self._pending[name]
+
+    def record(self, name, text, when):
+        """
+        add text as a version of the snippet file name saved at time when, for imports
+        """
+        with self.lock:
+            versions = self.versions(name)
+            base = self._latest(name, versions)
+            if base is not None and base[0] == content_hash(text):
+                return versions[0]
+            digest, chain = self._store(text, base)
+            self._last[name] = (digest, text, chain)
+            version = Version(when, digest, len(text))
+            self._append(name, [version])
+            return version
+
+    def written(self, filename):
+        """
+        the latest version was written to filename, it goes into the log with the
+        modification time of the file and the next backup does not have to read it
+        """
+        st = os.stat(filename)
+        name = os.path.basename(filename)
+        with self.lock:
+            self._disk[name] = (st.st_mtime_ns, st.st_size)
+            version = self._pending.pop(name, None)
+            if version is None:
+                return None
+            self._append(name, [version._replace(time=st.st_mtime)])
+            if len(self.versions(name)) > 2 * (self.keep_last + self.keep_daily + self.keep_weekly):
+                self._prune(name)
+
+    def restore(self, filename, digest):
+        """
+        write a version back to filename, the current content is backed up before
+        """
+        from pysnippetmanager.saver import atomic_write
+        text = self.read(digest)
+        with self.lock:
+            self.backup(filename, text)
+            atomic_write(filename, text)
+            self.written(filename)
+        return text
+
+    def _prune(self, name):
+        versions = self.versions(name)
+        keep = select_versions(versions, self.keep_last, self.keep_daily, self.keep_weekly)
+        with open(self._log_file(name) + '.tmp', 'w', encoding='utf-8') as f:
+            for version in reversed(keep):
+                f.write(json.dumps(list(version)) + '\n')
+        os.replace(self._log_file(name) + '.tmp', self._log_file(name))
+        self._logs[name] = (self._log_stat(name), keep)
+        kept = set(keep)
+        self._collect_garbage(set(version.digest for version in versions if version not in kept))
+
+    def collect_garbage(self):
+        """
+        delete the objects no version of any snippet in the directory refers to
+        """
+        with self.lock:
+            self._collect_garbage()
+
+    def _collect_garbage(self, dropped=None):
+        """
+        delete the objects no version refers to, with dropped only those of the
+        dropped digests and their delta bases
+        """
+        candidates = None
+        if dropped is not None:
+            candidates = set()
+            for digest in dropped:
+                while digest is not None and digest not in candidates:
+                    candidates.add(digest)
+                    try:
+                        digest = self._base(digest)
+                    except (OSError, ValueError):
+                        break
+        roots = [version.digest for version in self._pending.values()]
+        for entry in os.listdir(self.backup_dir):
+            if entry.endswith('.log'):
+                roots.extend(version.digest for version in self.versions(entry[:-4]))
+        used = set()
+        for digest in roots:
+            while digest is not None and digest not in used:
+                used.add(digest)
+                try:
+                    digest = self._base(digest)
+                except (OSError, ValueError):
+                    break
+        if candidates is not None:
+            for digest in candidates - used:
+                try:
+                    os.remove(self._object_file(digest))
+                except OSError:
+                    pass
+                self._bases.pop(digest, None)
+            return None
+        objects_dir = os.path.join(self.backup_dir, OBJECTS_DIR)
+        if not os.path.exists(objects_dir):
+            return None
+        for prefix in os.listdir(objects_dir):
+            for entry in os.listdir(os.path.join(objects_dir, prefix)):
+                if prefix + entry[:-2] not in used:
+                    os.remove(os.path.join(objects_dir, prefix, entry))
+
+    def _import_legacy(self, name):
+        """
+        move the plain copies older versions made (<label>_YYYYmmdd_HHMMSS.pycsm) into the store
+        """
+        label, ext = os.path.splitext(name)
+        pattern = re.compile(re.escape(label) + r'_(\d{8}_\d{6})' + re.escape(ext) + '$')
+        try:
+            entries = sorted(entry for entry in os.listdir(self.backup_dir) if pattern.match(entry))
+        except OSError:
+            return None
+        if not entries:
+            return None
+        base = None
+        new = []
+        for entry in entries:
+            path = os.path.join(self.backup_dir, entry)
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            digest, chain = self._store(text, base)
+            base = (digest, text, chain)
+            stamp = datetime.strptime(pattern.match(entry).group(1), '%Y%m%d_%H%M%S').timestamp()
+            new.append(Version(stamp, digest, len(text)))
+        self._append(name, new)
+        for entry in entries:
+            os.remove(os.path.join(self.backup_dir, entry))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(directory):
+    """
+    the shared BackupStore of a directory
+    """
+    directory = os.path.abspath(os.path.expanduser(directory))
+    with _stores_lock:
+        if directory not in _stores:
+            _stores[directory] = BackupStore(directory)
+        return _stores[directory]
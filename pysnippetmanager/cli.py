@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+the command line interface, never imports tkinter
+
+every command writes one JSON object per line to stdout, so the output can be
+streamed into other tools while the base directory is still being crawled
+"""
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+from pysnippetmanager.index import SnippetIndex
+from pysnippetmanager.metadata import parse_header
+from pysnippetmanager.storage import open_backend
+
+COMMANDS = ('list', 'search', 'cat', 'tag', 'reindex', 'export', 'import', 'detect', 'migrate')
+CONFIG_FILE = '~/.pySnippetManager'
+
+
+def default_base_dir():
+    """
+    the base directory the gui uses, read from its config file
+    """
+    try:
+        with open(os.path.expanduser(CONFIG_FILE), 'r') as f:
+            return f.readline().strip() or None
+    except OSError:
+        return None
+
+
+class Output(object):
+    """
+    writes JSON lines, stops quietly when the reader goes away (e.g. piped into head)
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.count = 0
+
+    def write(self, obj):
+        self.stream.write(json.dumps(obj, ensure_ascii=False) + '\n')
+        self.count += 1
+        if self.count % 256 == 0:
+            self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+def normalize_group(group):
+    """
+    a group as a path relative to the base directory with / as separator, '' for the top
+    """
+    group = os.path.normpath(group.replace(os.sep, '/').strip('/') or '.').replace(os.sep, '/')
+    return '' if group == '.' else group
+
+
+def group_of(path, base_dir):
+    return normalize_group(os.path.relpath(os.path.dirname(path), open_backend(base_dir).base_dir))
+
+
+def describe(path, header, base_dir):
+    lexer_alias, tags = parse_header(header)
+    return dict(path=path, group=group_of(path, base_dir),
+                label=os.path.splitext(os.path.basename(path))[0], lexer=lexer_alias, tags=tags)
+
+
+def iter_snippets(base_dir, use_index=True, rebuild=False):
+    """
+    crawl base_dir, yields (path, stat, header), the headers are taken from the
+    header index where possible and the index is updated at the end, with
+    rebuild every header is read and stored again
+    """
+    index = SnippetIndex(base_dir) if use_index or rebuild else None
+    if rebuild:
+        index.entries = {}
+    for item in open_backend(base_dir).crawler(index=index).crawl():
+        if item[0] != 'snippet':
+            continue
+        kind, path, st, header, cached = item
+        if index is not None and not cached:
+            lexer_alias, tags = parse_header(header)
+            index.store(path, st, _Header(path, base_dir, lexer_alias, tags))
+        yield path, st, header
+    if index is not None:
+        index.commit()
+        index.close()
+
+
+class _Header(object):
+    """
+    the header fields SnippetIndex.store needs, without creating a Snippet and its lexer
+    """
+
+    def __init__(self, path, base_dir, lexer_alias, tags):
+        self.lexer_alias = lexer_alias
+        self.tags = tags
+        self.label = os.path.splitext(os.path.basename(path))[0]
+        self.group = group_of(path, base_dir)
+
+
+def matches(info, args):
+    if args.lang and info['lexer'] not in args.lang:
+        return False
+    if args.tag:
+        tags = set(info['tags'])
+        if args.any_tag:
+            if not tags.intersection(args.tag):
+                return False
+        elif not tags.issuperset(args.tag):
+            return False
+    if args.group and info['group'] != args.group and not info['group'].startswith(args.group + '/'):
+        return False
+    return True
+
+
+def resolve(path, base_dir):
+    """
+    a snippet file from a path, a path relative to the base directory or group/label
+    """
+    backend = open_backend(base_dir)
+    candidates = [path, os.path.join(backend.base_dir, path.lstrip('/'))]
+    for candidate in candidates:
+        for filename in (candidate, candidate + '.pycsm'):
+            if backend.exists(filename):
+                return filename
+    raise OSError('no snippet %s' % path)
+
+
+def paths_of(args):
+    """
+    the paths given on the command line, read from stdin (one path or JSON line per line) if there are none
+    """
+    if args.paths and args.paths != ['-']:
+        for path in args.paths:
+            yield path
+        return None
+    for line in sys.stdin:
+        line = line.strip()
+        if line.startswith('{'):
+            yield json.loads(line)['path']
+        elif line:
+            yield line
+
+
+def cmd_list(args, out):
+    for path, st, header in iter_snippets(args.base_dir, not args.no_index):
+        info = describe(path, header, args.base_dir)
+        if matches(info, args):
+            info.update(size=st.st_size, mtime=st.st_mtime)
+            out.write(info)
+
+
+def cmd_export(args, out):
+    if args.archive:
+        return export_to_archive(args, out)
+    for path, st, header in iter_snippets(args.base_dir, not args.no_index):
+        info = describe(path, header, args.base_dir)
+        if matches(info, args):
+            try:
+                info['body'] = open_backend(args.base_dir).read_body(path)
+            except OSError:
+                continue
+            out.write(info)
+
+
+def export_to_archive(args, out):
+    from pysnippetmanager.archive import export_archive
+    t = perf_counter()
+
+    def snippets():
+        for path, st, header in iter_snippets(args.base_dir, not args.no_index):
+            if matches(describe(path, header, args.base_dir), args):
+                yield path, header
+
+    try:
+        n = export_archive(open_backend(args.base_dir), args.archive, snippets(), backups=args.backups)
+    except (OSError, ValueError) as e:
+        raise SystemExit(str(e))
+    out.write(dict(archive=args.archive, snippets=n, seconds=round(perf_counter() - t, 3)))
+
+
+def cmd_import(args, out):
+    from pysnippetmanager.archive import import_archive, read_manifest
+    if not os.path.isfile(args.archive):
+        raise SystemExit('no archive %s' % args.archive)
+    if args.manifest:
+        for entry in read_manifest(args.archive):
+            out.write(entry)
+        return None
+    t = perf_counter()
+    counts = dict(added=0, updated=0, skipped=0, failed=0)
+    try:
+        for filename, status, error in import_archive(open_backend(args.base_dir), args.archive,
+                                                      backups=args.backups, max_workers=args.jobs):
+            counts[status] += 1
+            if error is not None:
+                out.write(dict(path=filename, error=error))
+            elif status != 'skipped' and args.verbose:
+                out.write(dict(path=filename, status=status))
+    except ValueError as e:
+        raise SystemExit(str(e))
+    counts['seconds'] = round(perf_counter() - t, 3)
+    out.write(counts)
+
+
+def cmd_cat(args, out):
+    for path in paths_of(args):
+        try:
+            filename = resolve(path, args.base_dir)
+            backend = open_backend(args.base_dir)
+            header = backend.read_header(filename)
+            body = backend.read_body(filename)
+        except OSError as e:
+            out.write(dict(path=path, error=str(e)))
+            continue
+        if args.raw:
+            out.stream.write(body)
+        else:
+            info = describe(filename, header, args.base_dir)
+            info['body'] = body
+            out.write(info)
+
+
+def cmd_tag(args, out):
+    backend = open_backend(args.base_dir)
+    for path in paths_of(args):
+        try:
+            filename = resolve(path, args.base_dir)
+            # the header is rewritten as it is, a lexer alias pygments does not know stays
+            lexer_alias, old_tags = parse_header(backend.read_header(filename))
+            if args.set is not None:
+                tags = list(args.set)
+            else:
+                tags = [tag for tag in old_tags if tag not in (args.remove or [])]
+                tags += [tag for tag in (args.add or []) if tag not in tags]
+            if tags != old_tags:
+                backend.write(filename, ', '.join([lexer_alias] + tags) + '\n' + backend.read_body(filename))
+        except (OSError, UnicodeError) as e:
+            out.write(dict(path=path, error=str(e)))
+            continue
+        out.write(dict(path=filename, tags=tags))
+
+
+def cmd_detect(args, out):
+    from pysnippetmanager.detect import LexerDetector, needs_detection, set_lexer
+    from pysnippetmanager.index import cache_dir
+    old = {}
+    for path, st, header in iter_snippets(args.base_dir, not args.no_index):
+        lexer_alias, tags = parse_header(header)
+        if args.all or needs_detection(lexer_alias):
+            old[path] = lexer_alias
+    backend = open_backend(args.base_dir)
+    detector = LexerDetector(os.path.join(cache_dir(), 'lexer_guesses.json'), max_workers=args.jobs)
+    try:
+        for path, alias in detector.detect_files(list(old), backend):
+            if alias is None:
+                out.write(dict(path=path, error='not readable'))
+                continue
+            changed = alias != old[path] and alias != 'text'
+            if changed and not args.dry_run:
+                try:
+                    set_lexer(path, alias, backend)
+                except OSError as e:
+                    out.write(dict(path=path, error=str(e)))
+                    continue
+            out.write(dict(path=path, old=old[path], lexer=alias, changed=changed))
+    finally:
+        detector.shutdown()
+
+
+def update_search_index(base_dir, full=False):
+    """
+    bring the search index up to date, returns (search index, number of documents, number indexed)
+    """
+    from pysnippetmanager.search import SearchIndex
+    index = SearchIndex(base_dir)
+    index.backend = open_backend(base_dir)
+    if full:
+        index.prune(set())
+    jobs = []
+    for path, st, header in iter_snippets(base_dir, rebuild=full):
+        lexer_alias, tags = parse_header(header)
+        jobs.append((path, path, lexer_alias, tags, os.path.splitext(os.path.basename(path))[0],
+                     group_of(path, base_dir)))
+    index.prune(set(job[0] for job in jobs))
+    indexed = 0
+    for job in jobs:
+        try:
+            indexed += index.add_file(*job)
+        except OSError:
+            index.remove(job[0])
+    if indexed or full:
+        index.dump()
+    return index, len(jobs), indexed
+
+
+def cmd_search(args, out):
+    index, n, indexed = update_search_index(args.base_dir)
+    for score, path in index.search(' '.join(args.query), limit=args.limit):
+        lexer_alias, tags, label, group = index.docs[path][2:6]
+        out.write(dict(path=path, score=round(score, 4), group=normalize_group(group), label=label, lexer=lexer_alias,
+                       tags=list(tags)))
+
+
+def cmd_reindex(args, out):
+    t = perf_counter()
+    index, n, indexed = update_search_index(args.base_dir, full=args.full)
+    out.write(dict(snippets=n, indexed=indexed, seconds=round(perf_counter() - t, 3)))
+
+
+def cmd_migrate(args, out):
+    from pysnippetmanager.storage import migrate
+    t = perf_counter()
+    source = open_backend(args.base_dir)
+    target = open_backend(args.target)
+    if os.path.abspath(os.path.expanduser(args.target)) == source.base_dir:
+        raise SystemExit('the target is the base directory')
+    n = failed = 0
+    for filename, error in migrate(source, target, history=not args.no_history):
+        n += 1
+        if error is not None:
+            failed += 1
+            out.write(dict(path=filename, error=error))
+    out.write(dict(source=source.base_dir, target=target.base_dir, snippets=n - failed, failed=failed,
+                   seconds=round(perf_counter() - t, 3)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pysnippetmanager',
+                                     description='work with the snippets without the gui, '
+                                                 'the output is one JSON object per line')
+    base_dir_help = 'the snippet directory, defaults to the one the gui uses'
+    parser.add_argument('--base-dir', default=None, help=base_dir_help)
+    # --base-dir works after the command as well, without overwriting one given before it
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--base-dir', default=argparse.SUPPRESS, help=base_dir_help)
+    commands = parser.add_subparsers(dest='command')
+
+    def add_command(name, **kwargs):
+        return commands.add_parser(name, parents=[common], **kwargs)
+
+    def add_filters(p):
+        p.add_argument('--tag', action='append', help='only snippets with this tag, can be repeated')
+        p.add_argument('--any-tag', action='store_true', help='any instead of all of the --tag tags')
+        p.add_argument('--lang', action='append', help='only snippets with this lexer, can be repeated')
+        p.add_argument('--group', default=None, help='only snippets in this group and below')
+        p.add_argument('--no-index', action='store_true', help='read every header instead of using the index')
+
+    p = add_command('list', help='list the snippets')
+    add_filters(p)
+    p.set_defaults(func=cmd_list)
+
+    p = add_command('export', help='list the snippets together with their bodies')
+    add_filters(p)
+    p.add_argument('--archive', default=None, help='write the snippets to this .zip, .tar, .tar.gz, .tar.xz, '
+                                                   '.tar.bz2 or .tar.zst file instead')
+    p.add_argument('--backups', action='store_true', help='put the backed up versions into the archive as well')
+    p.set_defaults(func=cmd_export)
+
+    p = add_command('import', help='merge the snippets of an archive into the base directory, '
+                                   'snippets with the same content are skipped')
+    p.add_argument('archive')
+    p.add_argument('--backups', action='store_true', help='import the backed up versions as well')
+    p.add_argument('--jobs', type=int, default=4, help='number of threads comparing and writing snippets')
+    p.add_argument('--manifest', action='store_true', help='only print the manifest of the archive')
+    p.add_argument('--verbose', action='store_true', help='print every added or updated snippet')
+    p.set_defaults(func=cmd_import)
+
+    p = add_command('search', help='full text search, tag:, lang: and in: filters work as in the gui')
+    p.add_argument('query', nargs='+')
+    p.add_argument('--limit', type=int, default=50)
+    p.set_defaults(func=cmd_search)
+
+    p = add_command('cat', help='print snippets, the paths are read from stdin if none are given')
+    p.add_argument('paths', nargs='*')
+    p.add_argument('--raw', action='store_true', help='print the bodies as they are')
+    p.set_defaults(func=cmd_cat)
+
+    p = add_command('tag', help='change the tags of snippets, the paths are read from stdin if none '
+                                'are given')
+    p.add_argument('paths', nargs='*')
+    p.add_argument('--add', action='append', help='add a tag, can be repeated')
+    p.add_argument('--remove', action='append', help='remove a tag, can be repeated')
+    p.add_argument('--set', nargs='*', help='replace all tags')
+    p.set_defaults(func=cmd_tag)
+
+    p = add_command('detect', help='detect the lexers of snippets without one and rewrite their headers')
+    p.add_argument('--all', action='store_true', help='detect the lexers of all snippets')
+    p.add_argument('--dry-run', action='store_true', help='only report the detected lexers')
+    p.add_argument('--jobs', type=int, default=None, help='number of worker processes')
+    p.add_argument('--no-index', action='store_true', help='read every header instead of using the index')
+    p.set_defaults(func=cmd_detect)
+
+    p = add_command('migrate', help='copy all snippets to another storage, a directory or a '
+                                    '.sqlite/.sqlite3/.db database file')
+    p.add_argument('target')
+    p.add_argument('--no-history', action='store_true', help='leave the backed up versions behind')
+    p.set_defaults(func=cmd_migrate)
+
+    p = add_command('reindex', help='update the header and search indices')
+    p.add_argument('--full', action='store_true', help='rebuild the indices from scratch')
+    p.set_defaults(func=cmd_reindex)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.base_dir is None:
+        args.base_dir = default_base_dir()
+    if args.base_dir is None:
+        parser.error('no base directory, use --base-dir')
+    if getattr(args, 'group', None) is not None:
+        args.group = normalize_group(args.group)
+    out = Output()
+    try:
+        args.func(args, out)
+        out.close()
+    except BrokenPipeError:
+        # the reader is gone, keep python from complaining about stdout on exit
+        sys.stdout = open(os.devnull, 'w')
+    return 0
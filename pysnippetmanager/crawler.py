@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import fnmatch
+import os
+import re
+import threading
+from time import monotonic
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from queue import Queue, Empty
+
+from pysnippetmanager.backup import BACKUP_DIR
+from pysnippetmanager.metadata import read_header
+from pysnippetmanager.profiling import STATS
+
+INCLUDES = ['*.pycsm']  # for files only
+
+
+class Crawler(object):
+    """
+    walks the base directory with os.scandir and reads the snippet headers in a thread pool
+
+    yields ('group', path) for every directory and ('snippet', path, stat, header, cached)
+    for every snippet file, cached is True when the header came from the index
+    """
+    base_dir = ''
+    index = None
+    max_workers = 8
+    batch_size = 500
+    batch_interval = 0.1  # max seconds a found item waits before its batch is handed out
+    profile_section = 'rescan'  # the STATS section the crawl belongs to, its threads join a capture of it
+    done = False
+
+    def __init__(self, base_dir, index=None, max_workers=None, batch_size=None):
+        self.base_dir = base_dir
+        self.index = index
+        if max_workers is not None:
+            self.max_workers = max_workers
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.match = re.compile(r'|'.join([fnmatch.translate(x) for x in INCLUDES])).match
+        self.results = Queue()
+        self.done = False
+        self._stop = threading.Event()
+        self.thread = None
+
+    def walk(self):
+        """
+        yield ('group', path) and ('file', path, stat), .backup directories are never entered
+        """
+        stack = [os.path.expanduser(self.base_dir)]
+        while stack and not self._stop.is_set():
+            root = stack.pop()
+            try:
+                it = os.scandir(root)
+            except OSError:
+                continue
+            subdirs = []
+            descend = []
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if entry.name != BACKUP_DIR:
+                                subdirs.append(entry.path)
+                                if not entry.is_symlink():
+                                    descend.append(entry.path)
+                        elif self.match(entry.name):
+                            yield 'file', entry.path, entry.stat()
+                    except OSError:
+                        continue
+            for path in sorted(subdirs):
+                yield 'group', path
+            stack.extend(sorted(descend, reverse=True))
+
+    def crawl(self):
+        """
+        crawl the base directory, headers that are not in the index are read in the
+        thread pool while the walk goes on
+        """
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='crawler') as pool:
+            for item in self.walk():
+                if item[0] == 'file':
+                    header = None
+                    if self.index is not None:
+                        header = self.index.lookup(item[1], item[2])
+                    if header is None:
+                        pending.append((item[1], item[2], pool.submit(self._read_header, item[1])))
+                    else:
+                        pending.append((item[1], item[2], header))
+                else:
+                    pending.append(item)
+                while len(pending) > 4 * self.max_workers:
+                    result = self._resolve(pending.popleft())
+                    if result is not None:
+                        yield result
+            while pending:
+                result = self._resolve(pending.popleft())
+                if result is not None:
+                    yield result
+
+    def _read_header(self, path):
+        with STATS.profile_worker(self.profile_section):
+            return read_header(path)
+
+    @staticmethod
+    def _resolve(item):
+        if item[0] == 'group':
+            return item
+        path, st, header = item
+        if not isinstance(header, Future):
+            return 'snippet', path, st, header, True
+        try:
+            return 'snippet', path, st, header.result(), False
+        except OSError:
+            # vanished or unreadable
+            return None
+
+    def start(self):
+        """
+        crawl in a background thread, fetch the results with get_results
+        """
+        self.thread = threading.Thread(target=self.run, name='crawler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        batch = []
+        last = monotonic()
+        try:
+            with STATS.profile_worker(self.profile_section):
+                for item in self.crawl():
+                    batch.append(item)
+                    if len(batch) >= self.batch_size or monotonic() - last > self.batch_interval:
+                        self.results.put(batch)
+                        batch = []
+                        last = monotonic()
+        finally:
+            self.results.put(batch)
+            self.results.put(None)
+
+    def get_results(self, max_items=None):
+        """
+        the batches that arrived since the last call joined to one list, call from the Tk thread
+        """
+        items = []
+        while max_items is None or len(items) < max_items:
+            try:
+                batch = self.results.get_nowait()
+            except Empty:
+                break
+            if batch is None:
+                self.done = True
+                break
+            items.extend(batch)
+        return items
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+automatic lexer detection for new and untagged snippets
+
+cheap rules (modeline, shebang, file name) are tried first, only if none of them
+matches pygments.lexers.guess_lexer runs on a bounded prefix of the text. guess_lexer
+imports every lexer module and asks each of them, so it runs in worker processes and
+its results are cached by the hash of the prefix
+"""
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+
+from pysnippetmanager.index import cache_dir
+from pysnippetmanager.lexers import canonical_alias
+from pysnippetmanager.metadata import parse_header
+
+PREFIX_SIZE = 4096  # number of chars guess_lexer looks at
+TAIL_SIZE = 1024  # number of bytes read from the end of a file for modelines
+MODELINE_LINES = 5  # modelines are searched in this many lines at the start and the end
+
+VIM_MODELINE = re.compile(r'(?:^|\s)(?:vi|vim|ex)(?:[<=>]?\d+)?:.*?\b(?:ft|filetype|syn|syntax)=([\w+#-]+)')
+EMACS_MODELINE = re.compile(r'-\*-(.+?)-\*-')
+SHEBANG = re.compile(r'#!\s*(\S+)(.*)')
+
+# interpreter and editor mode names that are no pygments alias
+NAMES = {
+    'sh': 'bash', 'ksh': 'bash', 'dash': 'bash', 'shell-script': 'bash',
+    'node': 'javascript', 'nodejs': 'javascript', 'js': 'javascript',
+    'python': 'python', 'pypy': 'python', 'rscript': 'r', 'tclsh': 'tcl', 'wish': 'tcl',
+    'gawk': 'awk', 'mawk': 'awk', 'pwsh': 'powershell', 'c++': 'cpp', 'makefile': 'make',
+}
+
+
+def _alias_of(name):
+    """
+    the lexer alias for an interpreter, vim filetype or emacs mode name
+    """
+    name = name.strip().lower()
+    if name.endswith('-mode'):
+        name = name[:-5]
+    return canonical_alias(NAMES.get(name, name))
+
+
+def modeline_lexer(text):
+    """
+    the lexer named in a vim or emacs modeline in the first or last lines of text
+    """
+    lines = text[:PREFIX_SIZE].splitlines()[:MODELINE_LINES] + text[-PREFIX_SIZE:].splitlines()[-MODELINE_LINES:]
+    for line in lines:
+        match = VIM_MODELINE.search(line)
+        if match is not None and _alias_of(match.group(1)):
+            return _alias_of(match.group(1))
+        match = EMACS_MODELINE.search(line)
+        if match is None:
+            continue
+        fields = match.group(1)
+        if ':' not in fields:
+            # -*- python -*-
+            alias = _alias_of(fields)
+        else:
+            # -*- mode: python; coding: utf-8 -*-, a coding line alone names no mode
+            modes = [value for key, value in (field.split(':', 1) for field in fields.split(';') if ':' in field)
+                     if key.strip().lower() == 'mode']
+            alias = _alias_of(modes[0]) if modes else None
+        if alias:
+            return alias
+    return None
+
+
+def shebang_lexer(text):
+    """
+    the lexer for the interpreter of a #! line
+    """
+    match = SHEBANG.match(text[:256])
+    if match is None:
+        return None
+    interpreter = os.path.basename(match.group(1))
+    if interpreter == 'env':
+        args = [arg for arg in match.group(2).split() if not arg.startswith('-') and '=' not in arg]
+        if not args:
+            return None
+        interpreter = os.path.basename(args[0])
+    # python3.8 -> python3 -> python
+    for name in (interpreter, re.sub(r'[\d.]+$', '', interpreter)):
+        alias = _alias_of(name)
+        if alias:
+            return alias
+    return None
+
+
+def filename_lexer(name, text=''):
+    """
+    the lexer for a label like foo.py, None if the label has no extension
+    """
+    if not name or '.' not in name.strip('.'):
+        return None
+    from pygments.lexers import find_lexer_class_for_filename
+    from pygments.util import ClassNotFound
+    try:
+        cls = find_lexer_class_for_filename(name, text[:PREFIX_SIZE])
+    except ClassNotFound:
+        return None
+    if cls is None or not cls.aliases:
+        return None
+    return cls.aliases[0]
+
+
+def rule_lexer(text, name=None):
+    """
+    the lexer found by the cheap rules, None if none matches
+    """
+    return modeline_lexer(text) or shebang_lexer(text) or filename_lexer(name, text)
+
+
+def guess_prefix(prefix):
+    """
+    the alias guess_lexer picks for prefix, runs in the worker processes
+    """
+    from pygments.lexers import guess_lexer
+    from pygments.util import ClassNotFound
+    try:
+        lexer = guess_lexer(prefix)
+    except ClassNotFound:
+        return 'text'
+    return lexer.aliases[0] if lexer.aliases else 'text'
+
+
+def detect_lexer(text, name=None):
+    """
+    the lexer alias for text, 'text' if nothing fits, without cache and worker processes
+    """
+    return rule_lexer(text, name) or guess_prefix(text[:PREFIX_SIZE])
+
+
+def prefix_key(prefix):
+    return hashlib.sha1(prefix.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+def read_sample(filename, backend=None):
+    """
+    the start of the body of a snippet file and, for longer files, its last bytes for modelines
+    """
+    if backend is not None and not backend.on_disk:
+        body = backend.read_body(filename)
+        if len(body) > PREFIX_SIZE + TAIL_SIZE:
+            return body[:PREFIX_SIZE] + '\n' + body[-TAIL_SIZE:]
+        return body
+    with open(filename, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        data = f.read(PREFIX_SIZE)
+        end = f.seek(0, os.SEEK_END)
+        if end - start > PREFIX_SIZE + TAIL_SIZE:
+            f.seek(end - TAIL_SIZE)
+            data += b'\n' + f.read()
+    return data.decode('utf-8', errors='replace')
+
+
+def needs_detection(lexer_alias):
+    """
+    True for snippets without a real lexer, 'text' or an alias pygments does not know
+    """
+    return canonical_alias(lexer_alias) in (None, 'text')
+
+
+def set_lexer(filename, lexer_alias, backend):
+    """
+    rewrite the header of a snippet with a new lexer, the tags and the body are kept
+    """
+    old_alias, tags = parse_header(backend.read_header(filename))
+    backend.write(filename, ', '.join([lexer_alias] + tags) + '\n' + backend.read_body(filename))
+
+
+class LexerDetector(object):
+    """
+    detects lexers, the guesses of guess_lexer are cached by the hash of the prefix
+    and run in a pool of worker processes that is started on first use
+
+    after shutdown no more guesses are submitted, pending ones are cancelled
+    """
+    filename = None
+    max_entries = 20000
+    executor = None
+    max_workers = None
+    max_pending = 64  # guesses detect_files keeps in flight at once
+    closed = False
+    guesses = {}  # prefix hash -> alias
+    changed = False
+    stats = {}
+
+    def __init__(self, filename=None, max_workers=None):
+        self.filename = filename
+        self.max_workers = max_workers
+        self.guesses = {}
+        self.lock = threading.Lock()
+        self.stats = dict(rules=0, hits=0, guessed=0)
+        self.load()
+
+    def load(self):
+        import pygments
+        if self.filename is None:
+            return None
+        try:
+            with open(self.filename, 'r') as f:
+                cache = json.load(f)
+            if cache['pygments'] == pygments.__version__:
+                self.guesses = cache['guesses']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def dump(self):
+        import pygments
+        if self.filename is None or not self.changed:
+            return None
+        with self.lock:
+            guesses = dict(list(self.guesses.items())[-self.max_entries:])
+            self.changed = False
+        try:
+            if not os.path.exists(os.path.dirname(self.filename)):
+                os.makedirs(os.path.dirname(self.filename))
+            with open(self.filename, 'w') as f:
+                json.dump(dict(pygments=pygments.__version__, guesses=guesses), f)
+        except OSError:
+            pass
+
+    def _pool(self):
+        with self.lock:
+            if self.closed:
+                raise CancelledError('the detector is shut down')
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def _store(self, key, future):
+        if future.cancelled() or future.exception() is not None:
+            return None
+        with self.lock:
+            self.guesses[key] = future.result()
+            self.stats['guessed'] += 1
+            self.changed = True
+
+    def submit(self, text, name=None):
+        """
+        a future of the lexer alias for text, already done if a rule or the cache answers
+        """
+        alias = rule_lexer(text, name)
+        if alias is not None:
+            self.stats['rules'] += 1
+        else:
+            prefix = text[:PREFIX_SIZE]
+            key = prefix_key(prefix)
+            with self.lock:
+                alias = self.guesses.get(key)
+            if alias is not None:
+                self.stats['hits'] += 1
+            else:
+                try:
+                    future = self._pool().submit(guess_prefix, prefix)
+                except RuntimeError:
+                    # shut down between _pool and submit
+                    raise CancelledError('the detector is shut down')
+                future.add_done_callback(lambda f: self._store(key, f))
+                return future
+        future = Future()
+        future.set_result(alias)
+        return future
+
+    def detect(self, text, name=None):
+        """
+        the lexer alias for text, blocks until a guess is done
+        """
+        return self.submit(text, name).result()
+
+    def detect_files(self, filenames, backend=None):
+        """
+        detect the lexers of many snippet files at once, yields (filename, alias or None on
+        read errors) in the order of filenames, the guesses run in parallel in the pool
+
+        at most max_pending guesses are in flight, the iteration ends once the detector is shut down
+        """
+        futures = deque()
+        try:
+            for filename in filenames:
+                if self.closed:
+                    return None
+                try:
+                    sample = read_sample(filename, backend)
+                except OSError:
+                    futures.append((filename, None))
+                else:
+                    label = os.path.splitext(os.path.basename(filename))[0]
+                    futures.append((filename, self.submit(sample, label)))
+                while futures and (len(futures) > self.max_pending or futures[0][1] is None or futures[0][1].done()):
+                    filename, future = futures.popleft()
+                    yield filename, self._outcome(future)
+            while futures:
+                filename, future = futures.popleft()
+                yield filename, self._outcome(future)
+        except CancelledError:
+            return None
+
+    @staticmethod
+    def _outcome(future):
+        """
+        the alias of a finished guess, None if it failed, raises CancelledError if it was cancelled
+        """
+        if future is None:
+            return None
+        return None if future.exception() is not None else future.result()
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.dump()
+
+
+def get_detector():
+    """
+    a LexerDetector with its cache in the cache directory
+    """
+    return LexerDetector(os.path.join(cache_dir(), 'lexer_guesses.json'))
@@ -11,16 +11,33 @@ try:
 except ImportError:
     raise ModuleNotFoundError
 import os
-from PIL import Image, ImageTk
 from pysnippetmanager.utils import StringInputDialog
 DIR_IMG = os.path.dirname(os.path.abspath(__file__)) + '/../img/folder.png'
 FILE_IMG = os.path.dirname(os.path.abspath(__file__)) + '/../img/file.png'
 
 
 class FileBrowser(ttk.Treeview):
-    dir_img = None
+    """
+    the snippet tree
+
+    in lazy mode groups start collapsed with a placeholder child, their children
+    are inserted from the model when a group is opened and removed again when it
+    is closed, max_rows limits the number of materialised rows by closing the
+    groups that were opened first
+
+    in filter mode only the snippets of a set of iids and their groups are shown
+    """
+    dir_img = ''  # loaded by load_images
+    file_img = ''
     popup_active = False
     app = {}
+    lazy = True
+    max_rows = 5000  # max number of materialised rows in lazy mode, None for no limit
+    subgroups = {}  # group -> list of the child groups
+    items = {}  # group -> {iid: (label, lexer_alias)} of the snippets in the group
+    item_parent = {}  # iid -> group
+    expanded = {}  # materialised group -> number of inserted child rows, in the order they were opened
+    filter = None  # set of the iids shown in filter mode, None shows all snippets
 
     def __init__(self, *args, **kwargs):
         if "columns" not in kwargs:
@@ -33,23 +50,78 @@ class FileBrowser(ttk.Treeview):
             self.app = kwargs['app']
             del (kwargs['app'])
 
+        if 'lazy' in kwargs:
+            self.lazy = kwargs['lazy']
+            del (kwargs['lazy'])
+
+        if 'max_rows' in kwargs:
+            self.max_rows = kwargs['max_rows']
+            del (kwargs['max_rows'])
+
         super(FileBrowser, self).__init__(*args, **kwargs)
         self.heading('#0', text="Name")
         self.heading('lexer', text="Lexer")
         self.column('lexer', stretch=True, width=100)
         self.column('#0', stretch=True, width=300)
         self.bind("<<TreeviewSelect>>", self.select, "+")
+        self.bind("<<TreeviewOpen>>", self.open_group, "+")
+        self.bind("<<TreeviewClose>>", self.close_group, "+")
         self.bind("<Button-3>", self.mouse_right, "+")
-        # images
+        self.clear()
+
+    def load_images(self):
+        """
+        load the tree icons, PIL is only imported here to keep it off the startup path
+        """
+        from PIL import Image, ImageTk
         self.dir_img = ImageTk.PhotoImage(Image.open(DIR_IMG))
         self.file_img = ImageTk.PhotoImage(Image.open(FILE_IMG))
 
+    def clear(self):
+        """
+        remove everything from the tree and the model
+        """
+        self.delete(*self.get_children())
+        self.subgroups = {}
+        self.items = {}
+        self.item_parent = {}
+        self.expanded = {'': 0}
+        self.filter = None
+
     def add_item(self, iid, label, lexer_alias, parent=''):
         """
         add a new item to the snippet tree
         """
         self.add_group(parent)
-        self.insert(parent, "end", iid, text=label, open=True, values=(lexer_alias,), image=self.file_img)
+        iid = '%s' % iid
+        self.items.setdefault(parent, {})[iid] = (label, lexer_alias)
+        self.item_parent[iid] = parent
+        if self.filter is not None:
+            if iid in self.filter:
+                self.insert_filtered(iid)
+        elif not self.lazy:
+            self.insert(parent, "end", iid, text=label, open=True, values=(lexer_alias,), image=self.file_img)
+        elif parent in self.expanded:
+            self.insert(parent, "end", iid, text=label, values=(lexer_alias,), image=self.file_img)
+            self.expanded[parent] += 1
+            self.limit_rows()
+
+    def update_item(self, iid, lexer_alias):
+        """
+        show a new lexer for a snippet
+        """
+        parent = self.item_parent[iid]
+        self.items[parent][iid] = (self.items[parent][iid][0], lexer_alias)
+        if self.exists(iid):
+            self.item(iid, values=(lexer_alias,))
+
+    def move_item(self, iid, label, parent=''):
+        """
+        move a snippet to another group
+        """
+        lexer_alias = self.items[self.item_parent[iid]][iid][1]
+        self.remove_item(iid)
+        self.add_item(iid, label, lexer_alias, parent)
 
     def add_group(self, group_str):
         if group_str == '':
@@ -60,15 +132,177 @@ class FileBrowser(ttk.Treeview):
             gparent = '' if gparent == '/' else gparent
             self.add_group(gparent)
             self.app.groups[group_str] = [glabel, gparent]
-            self.insert(self.app.groups[group_str][1], "end",
-                        group_str,
-                        text=glabel,
-                        open=True, values=(), image=self.dir_img)
+            self.subgroups.setdefault(gparent, []).append(group_str)
+            if self.filter is not None:
+                pass
+            elif not self.lazy:
+                self.insert(self.app.groups[group_str][1], "end",
+                            group_str,
+                            text=glabel,
+                            open=True, values=(), image=self.dir_img)
+            elif gparent in self.expanded:
+                self.insert_group(group_str)
+                self.expanded[gparent] += 1
+                self.limit_rows()
             # self.tree.image = self.dir_img
             return gparent
         else:
             return self.app.groups[group_str][1]
 
+    def insert_group(self, group_str):
+        """
+        insert a collapsed group with a placeholder child
+        """
+        glabel, gparent = self.app.groups[group_str]
+        self.insert(gparent, "end", group_str, text=glabel, open=False, values=(), image=self.dir_img)
+        self.insert(group_str, "end", group_str + '/', text='...')
+
+    def open_group(self, event=None):
+        """
+        materialise the children of the opened group
+        """
+        group_str = self.focus()
+        if not self.lazy or self.filter is not None or group_str not in self.app.groups or \
+                group_str in self.expanded:
+            return None
+        self.delete(*self.get_children(group_str))
+        for child in self.subgroups.get(group_str, []):
+            self.insert_group(child)
+        for iid, (label, lexer_alias) in self.items.get(group_str, {}).items():
+            self.insert(group_str, "end", iid, text=label, values=(lexer_alias,), image=self.file_img)
+        self.expanded[group_str] = len(self.subgroups.get(group_str, [])) + len(self.items.get(group_str, {}))
+        self.limit_rows()
+
+    def close_group(self, event=None):
+        """
+        drop the children of the closed group
+        """
+        group_str = self.focus()
+        if self.lazy and self.filter is None and group_str in self.expanded and group_str != '':
+            self.collapse(group_str)
+
+    def collapse(self, group_str):
+        """
+        close a group and remove all its materialised rows
+        """
+        for group in list(self.expanded.keys()):
+            if group == group_str or group.startswith(group_str + '/'):
+                del self.expanded[group]
+        self.delete(*self.get_children(group_str))
+        self.insert(group_str, "end", group_str + '/', text='...')
+        self.item(group_str, open=False)
+
+    def limit_rows(self):
+        """
+        close the groups that were opened first until at most max_rows rows are materialised
+        """
+        if self.max_rows is None or self.filter is not None:
+            return None
+        focus = self.focus()
+        for group in list(self.expanded.keys()):
+            if sum(self.expanded.values()) <= self.max_rows:
+                break
+            if group == '' or group not in self.expanded or focus == group or focus.startswith(group + '/'):
+                continue
+            self.collapse(group)
+
+    def remove_item(self, iid):
+        """
+        remove a snippet from the snippet tree
+        """
+        parent = self.item_parent.pop(iid, '')
+        self.items.get(parent, {}).pop(iid, None)
+        if self.exists(iid):
+            self.delete(iid)
+            if parent in self.expanded:
+                self.expanded[parent] -= 1
+
+    def remove_group(self, group_str):
+        """
+        remove a group and everything below it
+        """
+        if group_str not in self.app.groups:
+            return None
+        gparent = self.app.groups[group_str][1]
+        if group_str in self.subgroups.get(gparent, []):
+            self.subgroups[gparent].remove(group_str)
+        if self.exists(group_str):
+            self.delete(group_str)
+            if gparent in self.expanded:
+                self.expanded[gparent] -= 1
+        for group in list(self.app.groups.keys()):
+            if group == group_str or group.startswith(group_str + '/'):
+                del self.app.groups[group]
+                self.subgroups.pop(group, None)
+                self.expanded.pop(group, None)
+                for iid in self.items.pop(group, {}):
+                    self.item_parent.pop(iid, None)
+
+    def set_filter(self, iids):
+        """
+        show only the snippets in iids (at most max_rows of them), None shows all snippets again
+        """
+        self.delete(*self.get_children())
+        self.expanded = {'': 0}
+        self.filter = None if iids is None else set(iids)
+        if self.filter is not None:
+            shown = sorted((iid for iid in self.filter if iid in self.item_parent),
+                           key=lambda iid: (self.item_parent[iid], self.items[self.item_parent[iid]][iid][0]))
+            for iid in shown[:self.max_rows]:
+                self.insert_filtered(iid)
+        elif self.lazy:
+            for group in self.subgroups.get('', []):
+                self.insert_group(group)
+            for iid, (label, lexer_alias) in self.items.get('', {}).items():
+                self.insert('', "end", iid, text=label, values=(lexer_alias,), image=self.file_img)
+            self.expanded[''] = len(self.subgroups.get('', [])) + len(self.items.get('', {}))
+        else:
+            for group_str, (glabel, gparent) in self.app.groups.items():
+                self.insert(gparent, "end", group_str, text=glabel, open=True, values=(), image=self.dir_img)
+            for group_str, items in self.items.items():
+                for iid, (label, lexer_alias) in items.items():
+                    self.insert(group_str, "end", iid, text=label, open=True, values=(lexer_alias,),
+                                image=self.file_img)
+
+    def insert_filtered(self, iid):
+        """
+        insert a snippet in filter mode together with the open groups above it
+        """
+        parent = self.item_parent[iid]
+        chain = []
+        group = parent
+        while group != '' and not self.exists(group):
+            chain.append(group)
+            group = self.app.groups[group][1]
+        for group in reversed(chain):
+            glabel, gparent = self.app.groups[group]
+            self.insert(gparent, "end", group, text=glabel, open=True, values=(), image=self.dir_img)
+        label, lexer_alias = self.items[parent][iid]
+        self.insert(parent, "end", iid, text=label, values=(lexer_alias,), image=self.file_img)
+
+    def show_item(self, iid):
+        """
+        materialise, select and scroll to a snippet
+        """
+        if iid not in self.item_parent:
+            return False
+        if self.filter is not None and iid not in self.filter:
+            self.app.clear_tag_filter()
+        chain = []
+        group = self.item_parent[iid]
+        while group != '':
+            chain.append(group)
+            group = self.app.groups[group][1]
+        for group in reversed(chain):
+            if self.lazy and group not in self.expanded:
+                self.focus(group)
+                self.open_group()
+            self.item(group, open=True)
+        self.selection_set(iid)
+        self.focus(iid)
+        self.see(iid)
+        return True
+
     def select(self, event=None):
         """
         todo move code to app
@@ -112,8 +346,8 @@ class FileBrowser(ttk.Treeview):
             subpath = dir_dialog.get_string()
             # create folder
             directory = os.path.join(self.app.base_dir, iid[1:], subpath)
-            if not os.path.exists(directory):
-                os.makedirs(directory)
+            if os.path.join(iid, subpath) not in self.app.groups:
+                self.app.backend.make_group(directory)
                 self.add_group(os.path.join(iid, subpath))
             return 'break'
 
@@ -122,6 +356,16 @@ class FileBrowser(ttk.Treeview):
             self.popup_active = False
             self.app.new(iid)
 
+        def _export_archive(event=None):
+            self.master.unbind("<ButtonRelease-1>")
+            self.popup_active = False
+            self.app.export_archive(iid)
+
+        def _import_archive(event=None):
+            self.master.unbind("<ButtonRelease-1>")
+            self.popup_active = False
+            self.app.import_archive()
+
         def _close_menu(event=None):
             self.master.unbind("<ButtonRelease-1>")
             self.popup_active = False
@@ -139,11 +383,16 @@ class FileBrowser(ttk.Treeview):
                 rmenu.add_command(label=' new file', command=_new_file)
                 rmenu.add_separator()
                 rmenu.add_command(label=' new folder', command=_new_folder)
+                rmenu.add_separator()
+                rmenu.add_command(label=' export archive', command=_export_archive)
         else:
             # no item selected
             iid = '/'
             rmenu.add_command(label=' new file', command=_new_file)
             rmenu.add_separator()
             rmenu.add_command(label=' new folder', command=_new_folder)
+            rmenu.add_separator()
+            rmenu.add_command(label=' export archive', command=_export_archive)
+            rmenu.add_command(label=' import archive', command=_import_archive)
         self.popup_active = True
         do_popup()
@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+from bisect import bisect_left, bisect_right
+
+from pygments.token import Error, Whitespace, _TokenType
+
+try:
+    from re import _parser as sre_parse, _compiler as sre_compile
+except ImportError:
+    import sre_parse
+    import sre_compile
+
+_TAG_NAMES = {}
+_OPENERS = {}  # (lexer class, state) -> [(rule index, opener match, reach match)]
+_RULES = {}  # (lexer class, state) -> state_rules
+
+
+def tag_name(token):
+    """
+    the Tk tag name of a pygments token type
+    """
+    try:
+        return _TAG_NAMES[token]
+    except KeyError:
+        _TAG_NAMES[token] = str(token)
+        return _TAG_NAMES[token]
+
+
+def is_incremental(lexer):
+    """
+    True if the lexer can be restarted from a saved state stack
+    """
+    from pygments.lexer import RegexLexer
+    return type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+
+
+def _compile(state, items, flags):
+    return sre_compile.compile(sre_parse.SubPattern(state, list(items)), flags)
+
+
+_REPEATS = tuple(getattr(sre_parse, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_parse, name))
+_ZERO_WIDTH = (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT)
+_LINE_ENDS = (sre_parse.AT_END, sre_parse.AT_END_LINE)
+
+
+def _matches_newline(items, flags):
+    """
+    True if the parsed pattern items can match a text that contains a newline
+    """
+    for op, av in items:
+        if op in _ZERO_WIDTH:
+            continue
+        if op in _REPEATS:
+            found = av[1] > 0 and _matches_newline(av[2], flags)
+        elif op is sre_parse.SUBPATTERN:
+            found = _matches_newline(av[-1], flags)
+        elif op is sre_parse.BRANCH:
+            found = any(_matches_newline(branch, flags) for branch in av[1])
+        else:
+            try:
+                found = _compile(items.state, [(op, av)], flags).match('\n') is not None
+            except Exception:
+                found = True
+        if found:
+            return True
+    return False
+
+
+def _prefixes(items, state):
+    """
+    pattern items that match the start of what the items match as far as it goes, lazy repeats
+    take as much as they can, e.g. /(?:[*](?:.|\\n)*(?:[*]/?)?)? for /[*](.|\\n)*?[*]/
+    """
+    started = _started(items, state)
+    if started is None:
+        return []
+    return [(sre_parse.BRANCH, (None, [sre_parse.SubPattern(state, started), sre_parse.SubPattern(state, [])]))]
+
+
+def _started(items, state):
+    """
+    like _prefixes, but the start has to be there, None for a pattern that has no such start,
+    the alternatives that get somewhere come before the empty one as re takes the first that matches
+    """
+    if not items:
+        return None
+    op, av = items[0]
+    if op is sre_parse.MIN_REPEAT:
+        op = sre_parse.MAX_REPEAT
+    alternatives = [[(op, av)] + _prefixes(items[1:], state)]
+    if op in _REPEATS:
+        if av[0] > 1:
+            alternatives.append([(sre_parse.MAX_REPEAT, (1, av[1], av[2]))] + _prefixes(av[2], state))
+        alternatives.append(_started(av[2], state))
+    elif op is sre_parse.SUBPATTERN:
+        inner = _started(av[-1], state)
+        if inner is not None:
+            alternatives.append([(op, (None,) + av[1:-1] + (sre_parse.SubPattern(state, inner),))])
+    elif op is sre_parse.BRANCH:
+        inner = [sre_parse.SubPattern(state, found) for found in (_started(branch, state) for branch in av[1])
+                 if found is not None]
+        if inner:
+            alternatives.append([(op, (None, inner))])
+    return [(sre_parse.BRANCH, (None, [sre_parse.SubPattern(state, alternative)
+                                       for alternative in alternatives if alternative is not None]))]
+
+
+def _opener(items, flags, prefix=(), followed=False, empty=False):
+    """
+    prefix and the items of a parsed pattern in front of its first unbounded repeat that can
+    run across lines and has to be followed by more of the pattern, None if there is no such
+    repeat. a line end does not count, .*?$ stops at the first one
+
+    for a repeat in front of which nothing has to match yet the opener ends in the first pass
+    of the repeat ((\\w+\\s+)+\\(), or if that can not be told takes the whole repeat (^\\s*...),
+    with empty it may be empty
+    """
+    opener = list(prefix)
+    for i, (op, av) in enumerate(items):
+        rest = items[i + 1:]
+        more = followed or any(op is not sre_parse.AT or av not in _LINE_ENDS for op, av in rest)
+        if op in _REPEATS and av[1] == sre_parse.MAXREPEAT and _matches_newline(av[2], flags) and \
+                (more or rest and list(av[2]) != [(sre_parse.ANY, None)]):
+            if empty or _compile(items.state, opener, flags).match('') is None:
+                return opener
+            inner = _opener(av[2], flags, opener, True)
+            if inner is not None and _compile(items.state, inner, flags).match('') is None:
+                return inner
+        elif op is sre_parse.SUBPATTERN:
+            inner = _opener(av[-1], flags, opener, more, empty)
+            if inner is not None:
+                return inner
+        elif op is sre_parse.BRANCH:
+            inner = [found for found in (_opener(branch, flags, (), more, empty) for branch in av[1]) if found]
+            if inner:
+                branches = [sre_parse.SubPattern(items.state, found) for found in inner]
+                return opener + [(sre_parse.BRANCH, (None, branches))]
+        opener.append((op, av))
+    return None
+
+
+def opener_of(match):
+    """
+    for the match method of a lexer rule whose regex can run across lines (a block comment,
+    a multi-line string) the match methods of the part in front of it and of how far the
+    rule gets, e.g. /[*] for /[*](.|\\n)*?[*]/, None for all other rules. the opener is None
+    for a rule that starts with the repeat, e.g. the rest of a string
+
+    if the opener matches where the rule fails, the rule may match once a closing
+    delimiter is typed further down, so the tokens there depend on the text behind them
+    """
+    regex = getattr(match, '__self__', None)
+    if regex is None or not isinstance(regex.pattern, str):
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+        opener = _opener(parsed, regex.flags)
+        if opener is None:
+            opener = _opener(parsed, regex.flags, empty=True)
+        if opener is None or any(op is sre_parse.GROUPREF for op, av in opener):
+            return None
+        opener = _compile(parsed.state, opener, regex.flags)
+        reach = _compile(parsed.state, _prefixes(list(parsed), parsed.state), regex.flags)
+    except Exception:
+        return None
+    if opener.match('') is not None:
+        return None, reach.match
+    return opener.match, reach.match
+
+
+def state_openers(lexer, state):
+    """
+    [(rule index, opener match, reach match)] of the rules of a lexer state that can run across lines,
+    the root state skips rules without an opener, they would open at every position
+    """
+    key = (type(lexer), state)
+    if key not in _OPENERS:
+        openers = []
+        for i, (rexmatch, action, new_state) in enumerate(lexer._tokens[state]):
+            found = opener_of(rexmatch)
+            if found is not None and (found[0] is not None or state != 'root'):
+                openers.append((i,) + found)
+        _OPENERS[key] = openers
+    return _OPENERS[key]
+
+
+def state_rules(lexer, state):
+    """
+    the rules of a lexer state as (match, action, new state, [(opener, reach)] of the rules in
+    front of it) together with the [(opener, reach)] of all its rules
+    """
+    key = (type(lexer), state)
+    if key not in _RULES:
+        openers = state_openers(lexer, state)
+        rules = [(rexmatch, action, new_state, [(opener, reach) for j, opener, reach in openers if j < i])
+                 for i, (rexmatch, action, new_state) in enumerate(lexer._tokens[state])]
+        _RULES[key] = rules, [(opener, reach) for j, opener, reach in openers]
+    return _RULES[key]
+
+
+def changed_region(old, new):
+    """
+    find the region that differs between two strings
+
+    returns (start, old_end, new_end), old[start:old_end] was replaced by new[start:new_end]
+    """
+    n = min(len(old), len(new))
+    start = 0
+    step = 4096
+    while start < n:
+        end = min(start + step, n)
+        if old[start:end] != new[start:end]:
+            while old[start] == new[start]:
+                start += 1
+            break
+        start = end
+    old_end = len(old)
+    new_end = len(new)
+    while old_end > start and new_end > start:
+        size = min(step, old_end - start, new_end - start)
+        if old[old_end - size:old_end] != new[new_end - size:new_end]:
+            while old[old_end - 1] == new[new_end - 1]:
+                old_end -= 1
+                new_end -= 1
+            break
+        old_end -= size
+        new_end -= size
+    return start, old_end, new_end
+
+
+class Highlighter(object):
+    """
+    incremental syntax highlighter
+
+    keeps the token stream of the last pass together with the lexer state at
+    every line start (checkpoints), an edit is relexed from the checkpoint
+    before the change until the state matches the previous pass again, or from
+    the line of a comment or string further up that was left open and runs into it
+    """
+    lexer = None
+    text = ''
+    starts = []  # start offset of every token
+    tags = []  # tag name of every token
+    cp_pos = []  # offsets of the checkpoints
+    cp_tok = []  # index of the first token at each checkpoint
+    cp_stack = []  # lexer state stack at each checkpoint
+    opens = []  # offsets where a rule that spans lines was opened but did not match, see opener_of
+    reaches = []  # how far the rule of each open can run
+    lexed = 0  # number of tokens the last run lexed
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.incremental = is_incremental(lexer)
+        self.reset()
+
+    def reset(self):
+        """
+        forget the last pass
+        """
+        self.text = ''
+        self.starts = []
+        self.tags = []
+        self.cp_pos = []
+        self.cp_tok = []
+        self.cp_stack = []
+        self.opens = []
+        self.reaches = []
+
+    def adopt(self, text, starts, tags, cp_pos=(), cp_tok=(), cp_stack=(), opens=(), reaches=()):
+        """
+        take over the result of a pass that was lexed elsewhere
+        """
+        self.text = text
+        self.starts = list(starts)
+        self.tags = list(tags)
+        self.cp_pos = list(cp_pos)
+        self.cp_tok = list(cp_tok)
+        self.cp_stack = list(cp_stack)
+        self.opens = list(opens)
+        self.reaches = list(reaches)
+
+    def update(self, text):
+        """
+        relex text, returns the (start, end) offsets of the region whose tokens changed
+        """
+        steps = self.run(text)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as result:
+                return result.value
+
+    def run(self, text):
+        """
+        relex text in slices
+
+        generator that yields after every slice of work and returns the (start, end)
+        offsets of the changed region, the last pass is only replaced when the generator
+        runs to the end, so an unfinished run can be dropped at any time
+        """
+        if text == self.text:
+            return 0, 0
+        if not self.incremental:
+            region = yield from self._update_full(text)
+            return region
+        if not self.cp_pos:
+            result = yield from self._lex(text, 0, ('root',))
+            self.text = text
+            self.starts, self.tags, self.cp_pos, self.cp_tok, self.cp_stack, self.opens, self.reaches, _ = result
+            self.lexed = len(self.starts)
+            return 0, len(text)
+        region = yield from self._update_incremental(text)
+        return region
+
+    def spans(self, start=0, end=None):
+        """
+        iterate over the (start, end, tag) of all tokens overlapping the region
+        """
+        if end is None:
+            end = len(self.text)
+        starts = self.starts
+        tags = self.tags
+        i = max(bisect_right(starts, start) - 1, 0)
+        n = len(starts)
+        while i < n and starts[i] < end:
+            token_end = starts[i + 1] if i + 1 < n else len(self.text)
+            yield starts[i], token_end, tags[i]
+            i += 1
+
+    def _update_full(self, text):
+        """
+        relex the complete text and compare the result with the last pass
+        """
+        starts = []
+        tags = []
+        for pos, token, value in self.lexer.get_tokens_unprocessed(text):
+            if value:
+                starts.append(pos)
+                tags.append(tag_name(token))
+                if not len(starts) % 256:
+                    yield
+        self.lexed = len(starts)
+        old_starts = self.starts
+        old_tags = self.tags
+        start, old_end, new_end = changed_region(self.text, text)
+        delta = len(text) - len(self.text)
+        # unchanged tokens in front of the edit
+        n = min(len(starts), len(old_starts)) - 1
+        i = 0
+        while i < n and starts[i + 1] <= start and starts[i + 1] == old_starts[i + 1] and tags[i] == old_tags[i]:
+            i += 1
+        # unchanged tokens behind the edit
+        j = len(starts) - 1
+        k = len(old_starts) - 1
+        while j > i and k > 0 and old_starts[k] >= old_end and old_starts[k] + delta == starts[j] \
+                and tags[j] == old_tags[k]:
+            j -= 1
+            k -= 1
+        self.text = text
+        self.starts = starts
+        self.tags = tags
+        if not starts:
+            return 0, len(text)
+        end = starts[j + 1] if j + 1 < len(starts) else len(text)
+        return starts[i], end
+
+    def _update_incremental(self, text):
+        """
+        relex only the region between the checkpoint before the edit and the
+        point where the lexer state matches the last pass again
+        """
+        old_text = self.text
+        start, old_end, new_end = changed_region(old_text, text)
+        delta = len(text) - len(old_text)
+        # restart one checkpoint early, rules may look ahead into the next line
+        line_start = text.rfind('\n', 0, start) + 1
+        ci = max(bisect_right(self.cp_pos, line_start) - 2, 0)
+        restart = self.cp_pos[ci]
+        for i in range(bisect_left(self.opens, restart)):
+            if self.reaches[i] >= restart:
+                # a construct opened further up runs into the edit which may close it, relex from its line
+                ci = max(bisect_right(self.cp_pos, self.opens[i]) - 1, 0)
+                restart = self.cp_pos[ci]
+                break
+        starts, tags, cp_pos, cp_tok, cp_stack, opens, reaches, sync = yield from self._lex(
+            text, restart, self.cp_stack[ci], resync=(new_end, delta, ci + 1))
+        n_before = bisect_left(self.opens, restart)
+        self.lexed = len(starts)
+        tok_restart = self.cp_tok[ci]
+        if sync is None:
+            self.starts = self.starts[:tok_restart] + starts
+            self.tags = self.tags[:tok_restart] + tags
+            self.cp_pos = self.cp_pos[:ci] + cp_pos
+            self.cp_tok = self.cp_tok[:ci] + [t + tok_restart for t in cp_tok]
+            self.cp_stack = self.cp_stack[:ci] + cp_stack
+            self.opens = self.opens[:n_before] + opens
+            self.reaches = self.reaches[:n_before] + reaches
+            end = len(text)
+        else:
+            tok_sync = self.cp_tok[sync]
+            shift = tok_restart + len(starts) - tok_sync
+            end = self.cp_pos[sync] + delta
+            self.starts = self.starts[:tok_restart] + starts + [s + delta for s in self.starts[tok_sync:]]
+            self.tags = self.tags[:tok_restart] + tags + self.tags[tok_sync:]
+            self.cp_tok = self.cp_tok[:ci] + [t + tok_restart for t in cp_tok] + \
+                [t + shift for t in self.cp_tok[sync:]]
+            self.cp_pos = self.cp_pos[:ci] + cp_pos + [p + delta for p in self.cp_pos[sync:]]
+            self.cp_stack = self.cp_stack[:ci] + cp_stack + self.cp_stack[sync:]
+            n_behind = bisect_left(self.opens, end - delta)
+            self.opens = self.opens[:n_before] + opens + [p + delta for p in self.opens[n_behind:]]
+            self.reaches = self.reaches[:n_before] + reaches + [p + delta for p in self.reaches[n_behind:]]
+        self.text = text
+        return restart, end
+
+    def _lex(self, text, pos, stack, resync=None):
+        """
+        run the state machine of a RegexLexer from pos with the given state stack,
+        yields at every line start, also collects the offsets where the opener of a rule
+        that spans lines matches but the rule does not, as long as the rule can run into
+        the next line from there
+
+        with resync=(new_end, delta, first_checkpoint) lexing stops at the first line
+        start behind new_end whose state equals the checkpoint of the last pass
+        """
+        lexer = self.lexer
+        statestack = list(stack)
+        statetokens, openers = state_rules(lexer, statestack[-1])
+        starts = []
+        tags = []
+        cp_pos = []
+        cp_tok = []
+        cp_stack = []
+        opens = []
+        reaches = []
+
+        def opened(pos, reach):
+            # one open per line is enough to restart there, keep the furthest reach
+            same_line = opens and opens[-1] >= cp_pos[-1]
+            if same_line and reaches[-1] == len(text):
+                return None
+            end = reach(text, pos).end()
+            if same_line:
+                reaches[-1] = max(reaches[-1], end)
+            elif text.find('\n', pos, end) >= 0:
+                opens.append(pos)
+                reaches.append(end)
+
+        old_pos = self.cp_pos
+        old_stack = self.cp_stack
+        sync = None
+        last_cp = -1
+        while 1:
+            if (pos == 0 or text[pos - 1] == '\n') and pos != last_cp:
+                last_cp = pos
+                state = tuple(statestack)
+                if resync is not None and pos >= resync[0] and cp_pos:
+                    j = bisect_left(old_pos, pos - resync[1], resync[2])
+                    if j < len(old_pos) and old_pos[j] == pos - resync[1] and old_stack[j] == state:
+                        sync = j
+                        break
+                cp_pos.append(pos)
+                cp_tok.append(len(starts))
+                cp_stack.append(state)
+                yield
+            for rule in statetokens:
+                m = rule[0](text, pos)
+                if m:
+                    rexmatch, action, new_state, before = rule
+                    for opener, reach in before:
+                        if opener is None or opener(text, pos):
+                            opened(pos, reach)
+                    if action is not None:
+                        if type(action) is _TokenType:
+                            if m.end() > pos:
+                                starts.append(pos)
+                                tags.append(tag_name(action))
+                        else:
+                            for token_pos, token, value in action(lexer, m):
+                                if value:
+                                    starts.append(token_pos)
+                                    tags.append(tag_name(token))
+                    pos = m.end()
+                    if new_state is not None:
+                        if isinstance(new_state, tuple):
+                            for state in new_state:
+                                if state == '#pop':
+                                    if len(statestack) > 1:
+                                        statestack.pop()
+                                elif state == '#push':
+                                    statestack.append(statestack[-1])
+                                else:
+                                    statestack.append(state)
+                        elif isinstance(new_state, int):
+                            if abs(new_state) >= len(statestack):
+                                del statestack[1:]
+                            else:
+                                del statestack[new_state:]
+                        elif new_state == '#push':
+                            statestack.append(statestack[-1])
+                        statetokens, openers = state_rules(lexer, statestack[-1])
+                    break
+            else:
+                if pos >= len(text):
+                    break
+                for opener, reach in openers:
+                    if opener is None or opener(text, pos):
+                        opened(pos, reach)
+                if text[pos] == '\n':
+                    # at EOL, reset state to "root"
+                    statestack = ['root']
+                    statetokens, openers = state_rules(lexer, 'root')
+                    starts.append(pos)
+                    tags.append(tag_name(Whitespace))
+                else:
+                    starts.append(pos)
+                    tags.append(tag_name(Error))
+                pos += 1
+        return starts, tags, cp_pos, cp_tok, cp_stack, opens, reaches, sync
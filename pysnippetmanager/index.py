@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import sqlite3
+from hashlib import sha1
+
+
+def cache_dir():
+    """
+    the user cache directory of pySnippetManager
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'pySnippetManager')
+
+
+class SnippetIndex(object):
+    """
+    persistent index of the snippet headers
+
+    keyed by path and validated by mtime, size and inode, so a crawl only has
+    to open the files that changed since the last run
+    """
+    filename = None
+    entries = {}  # path -> (mtime_ns, size, inode, lexer_alias, tags, label, group)
+    stats = {}
+
+    def __init__(self, base_dir, filename=None):
+        if filename is None:
+            key = sha1(os.path.abspath(os.path.expanduser(base_dir)).encode('utf-8')).hexdigest()
+            filename = os.path.join(cache_dir(), 'index_%s.sqlite' % key)
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS snippets ('
+                        'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, inode INTEGER, '
+                        'lexer_alias TEXT, tags TEXT, label TEXT, grp TEXT)')
+        self.entries = {}
+        for row in self.db.execute('SELECT path, mtime_ns, size, inode, lexer_alias, tags, label, grp '
+                                   'FROM snippets'):
+            self.entries[row[0]] = row[1:]
+        self.changed = {}
+        self.seen = set()
+        self.stats = dict(hits=0, misses=0)
+
+    def lookup(self, path, st):
+        """
+        the header stored for path, None if the file changed since it was indexed
+        """
+        self.seen.add(path)
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != st.st_mtime_ns or entry[1] != st.st_size or entry[2] != st.st_ino:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        if entry[4]:
+            return '%s, %s' % (entry[3], entry[4])
+        return entry[3]
+
+    def store(self, path, st, snippet):
+        """
+        remember the header of a snippet
+        """
+        self.seen.add(path)
+        entry = (st.st_mtime_ns, st.st_size, st.st_ino, snippet.lexer_alias, ', '.join(snippet.tags),
+                 snippet.label, snippet.group)
+        self.entries[path] = entry
+        self.changed[path] = entry
+
+    def commit(self, prune=True):
+        """
+        write the changes, with prune the entries of files that were not seen are dropped
+        """
+        with self.db:
+            if prune:
+                removed = [(path,) for path in self.entries if path not in self.seen]
+                self.db.executemany('DELETE FROM snippets WHERE path = ?', removed)
+                for path, in removed:
+                    del self.entries[path]
+            self.db.executemany('INSERT OR REPLACE INTO snippets VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                [(path,) + entry for path, entry in self.changed.items()])
+        self.changed = {}
+        self.seen = set()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import json
+import os
+
+from pysnippetmanager.index import cache_dir
+
+_instances = {}  # alias -> lexer instance
+_lexer_lists = {}  # plugins -> dict of all lexers
+_aliases = {}  # any alias -> first alias of its lexer
+
+
+def get_lexer(alias):
+    """
+    the lexer for alias, instances are shared, the lexer module is only imported on first use
+
+    raises ClassNotFound like get_lexer_by_name
+    """
+    key = alias.lower()
+    try:
+        return _instances[key]
+    except KeyError:
+        pass
+    # pygments.lexers pulls in the plugin machinery, so it is imported on first use
+    from pygments.lexers import get_lexer_by_name
+    lexer = get_lexer_by_name(key)
+    _instances[key] = lexer
+    _instances.setdefault(lexer.aliases[0], lexer)
+    return lexer
+
+
+def _plugin_entry_points():
+    """
+    [name, value, distribution, version] of the installed pygments.lexers entry points, listing them does not
+    import the plugins
+    """
+    from importlib.metadata import entry_points
+    groups = entry_points()
+    if hasattr(groups, 'select'):
+        found = groups.select(group='pygments.lexers')
+    else:
+        found = groups.get('pygments.lexers', [])
+    plugins = []
+    for entry_point in found:
+        dist = getattr(entry_point, 'dist', None)
+        if dist is None:
+            plugins.append([entry_point.name, entry_point.value, None, None])
+        else:
+            plugins.append([entry_point.name, entry_point.value, dist.metadata['Name'], dist.version])
+    plugins.sort(key=repr)
+    return plugins
+
+
+def _plugin_lexers():
+    """
+    the lexers of pygments plugins, loading the plugins is slow, so they are cached per pygments
+    version and set of installed plugin distributions
+    """
+    import pygments
+    filename = os.path.join(cache_dir(), 'plugin_lexers.json')
+    try:
+        plugins = _plugin_entry_points()
+    except Exception:
+        plugins = None
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if plugins is not None and cache['pygments'] == pygments.__version__ and cache['plugins'] == plugins:
+            return [tuple(entry) for entry in cache['lexers']]
+    except (OSError, ValueError, KeyError):
+        pass
+    from pygments.plugin import find_plugin_lexers
+    lexers = []
+    try:
+        for cls in find_plugin_lexers():
+            lexers.append((cls.name, list(cls.aliases), list(cls.filenames), list(cls.mimetypes)))
+    except Exception:
+        # a broken plugin must not keep the app from starting
+        return lexers
+    try:
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(dict(pygments=pygments.__version__, plugins=plugins, lexers=lexers), f)
+    except OSError:
+        pass
+    return lexers
+
+
+def all_lexers(plugins=True):
+    """
+    all available lexers as dict first alias -> (name, aliases, filenames, mimetypes)
+
+    built from the static pygments mapping without importing any lexer module
+    """
+    if plugins not in _lexer_lists:
+        from pygments.lexers._mapping import LEXERS
+        lexers = {}
+        for module, name, aliases, filenames, mimetypes in LEXERS.values():
+            if aliases:
+                lexers[aliases[0]] = (name, aliases, filenames, mimetypes)
+        if plugins:
+            for name, aliases, filenames, mimetypes in _plugin_lexers():
+                if aliases:
+                    lexers[aliases[0]] = (name, tuple(aliases), tuple(filenames), tuple(mimetypes))
+        _lexer_lists[plugins] = lexers
+    return _lexer_lists[plugins]
+
+
+def canonical_alias(alias):
+    """
+    the first alias of the lexer known as alias, None for unknown aliases
+    """
+    if not alias:
+        return None
+    if not _aliases:
+        for first, (name, lexer_aliases, filenames, mimetypes) in all_lexers().items():
+            for lexer_alias in lexer_aliases:
+                _aliases.setdefault(lexer_alias.lower(), first)
+    return _aliases.get(alias.lower())
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+from pysnippetmanager.profiling import STATS
+
+HEADER_SIZE = 4096  # max number of bytes read for a header
+
+
+def read_header(filename, max_bytes=HEADER_SIZE):
+    """
+    the header line of a snippet file, reads at most max_bytes and never the body
+    """
+    prefix = b''
+    step = min(256, max_bytes)
+    with open(filename, 'rb', buffering=0) as f:
+        while len(prefix) < max_bytes:
+            chunk = f.read(min(step, max_bytes - len(prefix)))
+            prefix += chunk
+            if not chunk or b'\n' in chunk:
+                break
+            step *= 2
+    STATS.count('io.header_reads')
+    STATS.count('io.read_bytes', len(prefix))
+    return prefix.split(b'\n', 1)[0].rstrip(b'\r').decode('utf-8', errors='replace')
+
+
+def parse_header(header):
+    """
+    the lexer alias and the tags of a header line, structure: lexer, tag, tag, tag
+    """
+    parts = [part.strip() for part in header.split(',')]
+    return parts[0], [tag for tag in parts[1:] if tag]
+
+
+def read_body(filename, max_size=None):
+    """
+    the body of a snippet file, everything behind the header line, at most max_size chars
+    """
+    with open(filename, 'r', encoding='utf-8', errors='replace') as f:
+        f.readline()
+        body = f.read(-1 if max_size is None else max_size)
+        if STATS.enabled:
+            STATS.count('io.body_reads')
+            STATS.count('io.read_bytes', f.tell())
+        return body
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import mmap
+import os
+
+
+class Pager(object):
+    """
+    hands out the body of a large snippet file in chunks of whole lines
+
+    the file is memory mapped, only the chunks that are asked for are decoded,
+    so opening costs the same for any file size, chunks can be read from any
+    line on, e.g. at a fraction of the body
+    """
+    chunk_size = 256 * 1024  # bytes per chunk, extended to the end of the line
+    size = 0
+    start = 0  # offset of the body
+    position = 0
+
+    def __init__(self, filename, skip_header=True, chunk_size=None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.file = open(filename, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.position = 0
+        if skip_header and self.map is not None:
+            end = self.map.find(b'\n')
+            self.position = self.size if end == -1 else end + 1
+        self.start = self.position
+
+    @property
+    def done(self):
+        return self.position >= self.size
+
+    def next_chunk(self):
+        """
+        the next chunk of text, None at the end of the file
+        """
+        if self.done:
+            return None
+        chunk, self.position = self.chunk_at(self.position)
+        return chunk
+
+    def line_start(self, offset):
+        """
+        the offset of the line that holds offset, not before the body
+        """
+        offset = max(self.start, min(offset, self.size - 1))
+        if offset == self.start:
+            return offset
+        return max(self.start, self.map.rfind(b'\n', self.start, offset) + 1)
+
+    def chunk_at(self, offset):
+        """
+        (text, end offset) of the chunk from the line start offset on, None at the end of the file
+        """
+        if offset >= self.size:
+            return None
+        end = min(offset + self.chunk_size, self.size)
+        if end < self.size:
+            newline = self.map.find(b'\n', end)
+            end = self.size if newline == -1 else newline + 1
+        return self.map[offset:end].decode('utf-8', errors='replace'), end
+
+    def chunk_before(self, offset):
+        """
+        (text, start offset) of the chunk that ends at the line start offset, None at the start of the body
+        """
+        if offset <= self.start:
+            return None
+        start = self.line_start(offset - self.chunk_size)
+        return self.map[start:offset].decode('utf-8', errors='replace'), start
+
+    def offset_at(self, fraction):
+        """
+        the start of the line at fraction of the body
+        """
+        return self.line_start(self.start + int(fraction * (self.size - self.start)))
+
+    def fraction_of(self, offset):
+        """
+        the fraction of the body before offset
+        """
+        return (offset - self.start) / max(1, self.size - self.start)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
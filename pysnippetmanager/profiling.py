@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import json
+import sys
+import threading
+from bisect import bisect_left
+from collections import deque
+from time import perf_counter, time
+
+
+class PhaseTimer(object):
+    """
+    records the end of named phases, report prints the duration of every phase
+    """
+    enabled = False
+    phases = []  # list of (name, seconds since start)
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = perf_counter()
+        self.phases = []
+        self.reported = False
+
+    def phase(self, name):
+        """
+        the phase name ends now
+        """
+        self.phases.append((name, perf_counter() - self.start))
+
+    def report(self, file=None):
+        """
+        print the phase timings once, only if the timer is enabled
+        """
+        if not self.enabled or self.reported:
+            return None
+        self.reported = True
+        file = file or sys.stderr
+        last = 0.
+        file.write('startup profile:\n')
+        for name, t in self.phases:
+            file.write('  %-24s %8.1f ms  (at %8.1f ms)\n' % (name, (t - last) * 1000., t * 1000.))
+            last = t
+        file.flush()
+
+
+class _Timer(object):
+    """
+    context manager adding the duration of its block to a timer of Stats
+    """
+    __slots__ = ('stats', 'name', 't0')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.t0 = 0.
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add(self.name, perf_counter() - self.t0)
+        return False
+
+
+class _NullTimer(object):
+    """
+    the timer of disabled Stats, does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _WorkerProfile(object):
+    """
+    context manager profiling its block in a worker thread for the running capture of a section
+    """
+    __slots__ = ('stats', 'name', 'profiler')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.profiler = None
+
+    def __enter__(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # only one profiler can be active at a time on newer pythons, it sees all threads already
+            self.profiler = None
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.create_stats()
+            self.stats.add_profile(self.name, self.profiler.stats)
+        return False
+
+
+class _ProfileStats(object):
+    """
+    the cProfile stats of a worker in the form pstats.Stats.add takes
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def run_profiled(func, *args):
+    """
+    func(*args) under cProfile, returns (result, cProfile stats) for Stats.add_profile, for worker processes
+    """
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is active, it sees this call already
+        return func(*args), {}
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+class Stats(object):
+    """
+    timers and counters around the hot paths
+
+    every timer keeps its last window samples for the percentiles and the
+    histogram, plus the count, sum and max since the last reset. disabled (the
+    default) all calls return right away, so the instrumentation stays in the code
+
+    a single run of a named section (e.g. 'highlight' or 'rescan') can be
+    captured with cProfile, see profile_next. the profiler runs on the thread
+    that starts the section, the work the section hands to other threads or
+    processes is added through profile_worker or add_profile
+    """
+    enabled = False
+    window = 1000  # samples kept per timer
+    buckets = (0.1, 0.3, 1., 3., 10., 30., 100., 300., 1000.)  # upper bounds of the histogram bins in ms
+    profile_target = None  # the section the next cProfile capture is armed for
+    profiles = {}  # section -> (filename of the .prof file, text report) of the last capture
+
+    def __init__(self, enabled=False, window=None):
+        self.enabled = enabled
+        if window is not None:
+            self.window = window
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.profiling = None
+        self.worker_profiles = []  # cProfile stats of the workers of the running capture
+        self.profiles = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}  # timer -> deque of the last seconds
+            self.totals = {}  # timer -> [count, seconds, max seconds]
+            self.counters = {}
+            self.since = time()
+
+    def start(self):
+        """
+        the start of a measurement that spans several calls, None when disabled
+        """
+        return perf_counter() if self.enabled else None
+
+    def stop(self, name, t0):
+        """
+        end a measurement begun with start
+        """
+        if t0 is not None:
+            self.add(name, perf_counter() - t0)
+
+    def add(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+                self.totals[name] = [0, 0., 0.]
+            samples.append(seconds)
+            total = self.totals[name]
+            total[0] += 1
+            total[1] += seconds
+            if seconds > total[2]:
+                total[2] = seconds
+
+    def timer(self, name):
+        """
+        a context manager timing its block as name
+        """
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return None
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def histogram(self, name):
+        """
+        the number of samples of the window per bin, the last bin holds the samples above buckets[-1]
+        """
+        counts = [0] * (len(self.buckets) + 1)
+        with self.lock:
+            samples = list(self.samples.get(name, ()))
+        for seconds in samples:
+            counts[bisect_left(self.buckets, seconds * 1000.)] += 1
+        return counts
+
+    def summary(self):
+        """
+        the timers and counters as a dict that can be dumped to JSON, times in ms
+        """
+        timers = {}
+        with self.lock:
+            items = [(name, sorted(samples), list(self.totals[name])) for name, samples in self.samples.items()]
+            counters = dict(self.counters)
+        for name, samples, (count, total, longest) in items:
+            timers[name] = dict(count=count, total_ms=total * 1000., mean_ms=total * 1000. / count,
+                                max_ms=longest * 1000.,
+                                p50_ms=_percentile(samples, 0.5) * 1000., p90_ms=_percentile(samples, 0.9) * 1000.,
+                                p99_ms=_percentile(samples, 0.99) * 1000., histogram=self.histogram(name))
+        return dict(since=self.since, seconds=time() - self.since, enabled=self.enabled,
+                    buckets_ms=list(self.buckets), timers=timers, counters=counters,
+                    profiles=dict((name, filename) for name, (filename, text) in self.profiles.items()))
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=1, sort_keys=True)
+
+    def profile_next(self, name):
+        """
+        capture the next run of the section name with cProfile
+        """
+        self.profile_target = name
+
+    def start_profile(self, name):
+        """
+        a section starts, the profiler runs if a capture is armed for it
+        """
+        if self.profile_target != name or self.profiler is not None:
+            return False
+        import cProfile
+        self.profiler = cProfile.Profile()
+        with self.lock:
+            self.profiling = name
+            self.worker_profiles = []
+        self.profiler.enable()
+        return True
+
+    def capturing(self, name):
+        """
+        True while a capture of the section name runs
+        """
+        return self.profiling == name
+
+    def profile_worker(self, name):
+        """
+        a context manager that adds its block to the running capture of the section name, for the
+        threads the section hands its work to
+        """
+        return _WorkerProfile(self, name) if self.profiling == name else _NULL_TIMER
+
+    def add_profile(self, name, stats):
+        """
+        add the cProfile stats of a worker thread or process (see run_profiled) to the running capture of name
+        """
+        with self.lock:
+            if self.profiling == name:
+                self.worker_profiles.append(stats)
+
+    def stop_profile(self, name):
+        """
+        a section ends, finishes its capture and returns the filename of the .prof file
+        """
+        if self.profiler is None or self.profiling != name:
+            return None
+        import io
+        import os
+        import pstats
+        from pysnippetmanager.index import cache_dir
+        self.profiler.disable()
+        with self.lock:
+            self.profiling = None
+            workers = self.worker_profiles
+            self.worker_profiles = []
+        report = io.StringIO()
+        profile = pstats.Stats(self.profiler, stream=report)
+        for stats in workers:
+            profile.add(_ProfileStats(stats))
+        profile.sort_stats('cumulative').print_stats(30)
+        filename = os.path.join(cache_dir(), 'profile_%s_%d.prof' % (name, time()))
+        try:
+            if not os.path.exists(cache_dir()):
+                os.makedirs(cache_dir())
+            profile.dump_stats(filename)
+        except OSError:
+            filename = None
+        self.profiles[name] = (filename, report.getvalue())
+        self.profiler = None
+        self.profile_target = None
+        return filename
+
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+STATS = Stats()  # the shared instance the instrumented code reports to
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import re
+from time import perf_counter
+
+
+def ngrams(text, n):
+    return set(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class QuickOpenIndex(object):
+    """
+    fuzzy lookup of snippet paths (group/label)
+
+    results are collected in three tiers until the limit is reached: labels
+    starting with the query, paths containing the query (found through the
+    uni-, bi- and trigram indices) and paths containing the characters of the
+    query in order, the fuzzy candidates of the last query are reused while
+    the user keeps typing
+
+    every tier looks at its candidates shortest paths first and stops at the
+    limit, add only queues the n-grams of a path, index_pending adds them in
+    batches, queued paths are candidates of every query until then
+    """
+    paths = {}  # key -> path
+    prefix_index = {}  # first one, two and three characters of the label -> set of keys
+    ngram_index = {}  # character, bigram or trigram -> set of keys
+    length_index = {}  # path length -> set of keys
+    unindexed = set()  # keys whose n-grams are not in ngram_index yet
+    batch_size = 256  # keys indexed between two looks at the clock
+    fuzzy_budget = 3  # max time in ms the fuzzy tier of a query may take, None for no limit
+
+    def __init__(self):
+        self.paths = {}
+        self.prefix_index = {}
+        self.ngram_index = {}
+        self.length_index = {}
+        self.unindexed = set()
+        self._last_query = None
+        self._last_candidates = None
+
+    @staticmethod
+    def _grams(path):
+        grams = set(path)
+        grams.update(map(''.join, zip(path, path[1:])))
+        grams.update(map(''.join, zip(path, path[1:], path[2:])))
+        return grams
+
+    @staticmethod
+    def _label(path):
+        return path.rsplit('/', 1)[-1]
+
+    def add(self, key, path):
+        """
+        add or replace the path of key, its n-grams are indexed by index_pending
+        """
+        if key in self.paths:
+            self.remove(key)
+        path = path.lower()
+        self.paths[key] = path
+        label = self._label(path)
+        for n in (1, 2, 3):
+            self.prefix_index.setdefault(label[:n], set()).add(key)
+        self.length_index.setdefault(len(path), set()).add(key)
+        self.unindexed.add(key)
+        self._last_query = None
+
+    def index_pending(self, budget=None):
+        """
+        add the n-grams of the queued paths for at most budget seconds, returns True once all are indexed
+        """
+        deadline = None if budget is None else perf_counter() + budget
+        ngram_index = self.ngram_index
+        paths = self.paths
+        unindexed = self.unindexed
+        while unindexed:
+            for i in range(min(self.batch_size, len(unindexed))):
+                key = unindexed.pop()
+                for gram in self._grams(paths[key]):
+                    keys = ngram_index.get(gram)
+                    if keys is None:
+                        ngram_index[gram] = {key}
+                    else:
+                        keys.add(key)
+            if deadline is not None and perf_counter() > deadline:
+                break
+        self._last_query = None
+        return not unindexed
+
+    def remove(self, key):
+        path = self.paths.pop(key, None)
+        if path is None:
+            return None
+        label = self._label(path)
+        for n in (1, 2, 3):
+            self.prefix_index[label[:n]].discard(key)
+        self.length_index[len(path)].discard(key)
+        if key in self.unindexed:
+            self.unindexed.discard(key)
+        else:
+            for gram in self._grams(path):
+                self.ngram_index[gram].discard(key)
+        self._last_query = None
+
+    def clear(self):
+        self.__init__()
+
+    def _gram_sets(self, grams):
+        return [self.ngram_index.get(gram, set()) for gram in grams]
+
+    def _shortest(self, sets, match, limit, min_length, seen=(), deadline=None):
+        """
+        up to limit keys in all sets whose path matches, by length and path, returns (keys, all
+        matches found)
+
+        the sets are intersected bucket by bucket of the length index, shortest paths first, so
+        only the buckets up to the limit or the deadline are looked at, keys that are not indexed
+        yet are always candidates
+        """
+        sets = sorted(dict((id(keys_with), keys_with) for keys_with in sets).values(), key=len)
+        paths = self.paths
+        unindexed = self.unindexed
+        keys = []
+        for length in sorted(self.length_index):
+            if length < min_length:
+                continue
+            bucket = self.length_index[length]
+            candidates = bucket
+            for keys_with in sets:
+                candidates = candidates & keys_with
+                if not candidates:
+                    break
+            if unindexed:
+                candidates = candidates | (bucket & unindexed)
+            found = sorted((key for key in candidates if key not in seen and match(paths[key])),
+                           key=paths.__getitem__)
+            keys.extend(found[:limit - len(keys)])
+            if len(keys) >= limit:
+                return keys, False
+            if deadline is not None and perf_counter() > deadline:
+                return keys, False
+        return keys, True
+
+    def search(self, query, limit=50):
+        """
+        the keys whose path matches query, best matches first
+        """
+        query = query.lower().replace(' ', '')
+        if not query:
+            return []
+        results = []
+        seen = set()
+
+        def take(sets, match):
+            keys = self._shortest(sets, match, limit - len(results), len(query), seen)[0]
+            results.extend(keys)
+            seen.update(keys)
+            return len(results) >= limit
+
+        # labels starting with the query, the paths of both tiers contain the n-grams of the query
+        sets = self._gram_sets(ngrams(query, min(len(query), 3)))
+        if take(sets + [self.prefix_index.get(query[:3], set())], lambda path: self._label(path).startswith(query)):
+            return results
+        # paths containing the query
+        if take(sets, lambda path: query in path):
+            return results
+        # paths containing the characters of the query in order
+        sets = self._gram_sets(set(query))
+        if self._last_query is not None and query.startswith(self._last_query):
+            sets.extend(self._last_candidates)
+        pattern = re.compile(re.escape(query[0]) +
+                             ''.join('[^%s]*%s' % (re.escape(c), re.escape(c)) for c in query[1:]))
+        deadline = None if self.fuzzy_budget is None else perf_counter() + self.fuzzy_budget / 1000.
+        keys, complete = self._shortest(sets, pattern.search, limit - len(results), len(query), seen, deadline)
+        results.extend(keys)
+        if complete:
+            # all matches are known, the next query only has to look at them
+            sets = [set(keys) | seen]
+        self._last_query = query
+        self._last_candidates = sets
+        return results
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import logging
+import os
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+from queue import Queue, Empty
+
+from pysnippetmanager.backup import get_store
+from pysnippetmanager.profiling import STATS
+
+logger = logging.getLogger(__name__)
+# the mode of new files, mkstemp creates them as 0600
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def atomic_write(filename, content):
+    """
+    write content as utf-8 to a temp file next to filename and rename it over filename,
+    a crash leaves either the old or the new file but never a truncated one,
+    the mode and, where permitted, the owner of an existing filename are kept
+    """
+    directory, name = os.path.split(filename)
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        st = None
+    t0 = STATS.start()
+    # a unique name, two writers of the same file must not share the temp file
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % name, suffix='.tmp', dir=directory or '.')
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+            STATS.count('io.written_bytes', f.tell())
+        if st is not None:
+            copy_owner(st, tmp)
+        else:
+            os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        # directories can not be opened on every platform
+        STATS.stop('save.write', t0)
+        return None
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+        STATS.stop('save.write', t0)
+
+
+def copy_owner(st, filename):
+    """
+    give filename the permission bits and the owner of the stat result st, changing the
+    owner needs privileges and is skipped if it fails
+    """
+    os.chmod(filename, stat.S_IMODE(st.st_mode))
+    if hasattr(os, 'chown') and (st.st_uid, st.st_gid) != (os.getuid(), os.getgid()):
+        try:
+            os.chown(filename, st.st_uid, st.st_gid)
+        except OSError:
+            # keep at least the group if the user may not give the file away
+            try:
+                os.chown(filename, -1, st.st_gid)
+            except OSError:
+                pass
+
+
+def write_snippet(filename, content):
+    """
+    back up content and write it to filename, a failing backup is logged but does not stop the write
+    """
+    try:
+        store = get_store(os.path.dirname(filename))
+        with STATS.timer('save.backup'):
+            store.backup(filename, content)
+    except Exception:
+        logger.exception('backing up %s failed', filename)
+        store = None
+    atomic_write(filename, content)
+    if store is not None:
+        store.written(filename)
+
+
+class SaveQueue(object):
+    """
+    writes snippets in a background thread
+
+    a snippet that is saved again while its previous save is still queued is
+    written only once with the latest content, everything queued for one
+    backend is handed to its write_many as one batch, the outcome of every
+    write is handed back to the Tk thread through get_results
+    """
+    thread = None
+    failed = {}  # filename -> error message of the last failed write
+
+    def __init__(self):
+        self.queue = OrderedDict()  # filename -> (snippet, content) waiting to be written
+        self.writing = set()  # filenames of the batch in progress
+        self.failed = {}
+        self.results = Queue()
+        self.stats = dict(submitted=0, coalesced=0, written=0, failed=0)
+        self.condition = threading.Condition()
+        self._stop = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='save-queue', daemon=True)
+        self.thread.start()
+
+    @property
+    def pending(self):
+        """
+        the filenames that are queued or being written
+        """
+        with self.condition:
+            return set(self.queue) | self.writing
+
+    def submit(self, snippet, content):
+        with self.condition:
+            self.stats['submitted'] += 1
+            if snippet.filename in self.queue:
+                self.stats['coalesced'] += 1
+                del self.queue[snippet.filename]
+            self.queue[snippet.filename] = (snippet, content)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self._stop:
+                    self.condition.wait()
+                if not self.queue:
+                    return None
+                batch = list(self.queue.items())
+                self.queue.clear()
+                self.writing = set(filename for filename, item in batch)
+            backends = OrderedDict()
+            for filename, (snippet, content) in batch:
+                backends.setdefault(snippet.backend, []).append((filename, snippet, content))
+            for backend, items in backends.items():
+                try:
+                    failed = backend.write_many([(filename, content) for filename, snippet, content in items])
+                except Exception as e:
+                    # the thread has to survive, otherwise pending never drains
+                    logger.exception('writing %d snippets failed', len(items))
+                    failed = dict((filename, str(e) or e.__class__.__name__) for filename, snippet, content in items)
+                with self.condition:
+                    for filename, snippet, content in items:
+                        error = failed.get(filename)
+                        self.writing.discard(filename)
+                        if error is None:
+                            self.stats['written'] += 1
+                            self.failed.pop(filename, None)
+                        else:
+                            self.stats['failed'] += 1
+                            self.failed[filename] = error
+                        self.results.put((snippet, error))
+                    self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        wait until everything queued is written, returns False on timeout
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.writing, timeout)
+
+    def stop(self, timeout=None):
+        """
+        write what is queued and end the thread
+        """
+        with self.condition:
+            self._stop = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def get_results(self):
+        """
+        (snippet, error) of the writes finished since the last call, error is None on success,
+        call from the Tk thread
+        """
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except Empty:
+                return results
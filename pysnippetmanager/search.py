@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import math
+import os
+import pickle
+import re
+import threading
+from bisect import bisect_left, insort
+from hashlib import sha1
+
+from pygments.token import Comment, Name, String
+from pygments.util import ClassNotFound
+
+from pysnippetmanager.index import cache_dir
+from pysnippetmanager.lexers import get_lexer
+from pysnippetmanager.metadata import read_body
+
+KINDS = ('name', 'comment', 'string', 'code')
+KIND_WEIGHTS = (2., 1., 1., 1.5)
+WORD = re.compile(r'\w+', re.UNICODE)
+FILTER = re.compile(r'^(tag|lang|in):(.*)$')
+
+
+def token_kind(token):
+    """
+    the index of the kind of a pygments token in KINDS
+    """
+    if token in Name:
+        return 0
+    if token in Comment:
+        return 1
+    if token in String:
+        return 2
+    return 3
+
+
+def extract_terms(text, lexer_alias):
+    """
+    the terms of a snippet body, returns a dict term -> list of counts per kind
+    """
+    terms = {}
+    try:
+        lexer = get_lexer(lexer_alias)
+        tokens = ((token_kind(token), value) for _, token, value in lexer.get_tokens_unprocessed(text))
+    except ClassNotFound:
+        tokens = [(3, text)]
+    for kind, value in tokens:
+        for word in WORD.findall(value.lower()):
+            counts = terms.get(word)
+            if counts is None:
+                counts = terms[word] = [0, 0, 0, 0]
+            counts[kind] += 1
+    return terms
+
+
+class SearchIndex(object):
+    """
+    inverted index over the snippet bodies
+
+    the terms come from the pygments token stream, so a query can be limited to
+    identifiers, comments, strings or code, supports exact, prefix (foo*) and
+    substring (*foo*) terms and tag:, lang: and in: filters
+    """
+    filename = None
+    max_body_size = 4000000  # only the beginning of larger bodies is indexed
+    backend = None  # the storage backend the snippets are read from, plain files if None
+    docs = {}  # doc id -> (mtime_ns, size, lexer_alias, tags, label, group, terms)
+    postings = {}  # term -> {doc id: counts per kind}
+    stats = {}
+
+    def __init__(self, base_dir=None, filename=None):
+        if filename is None and base_dir is not None:
+            key = sha1(os.path.abspath(os.path.expanduser(base_dir)).encode('utf-8')).hexdigest()
+            filename = os.path.join(cache_dir(), 'search_%s.pickle' % key)
+        self.filename = filename
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.postings = {}
+        self.tag_docs = {}
+        self.lexer_docs = {}
+        self._vocabulary = None
+        self._trigrams = None
+        self.stats = dict(indexed=0, queries=0)
+        self.load()
+
+    def load(self):
+        """
+        read the persisted documents
+        """
+        if self.filename is None or not os.path.exists(self.filename):
+            return None
+        try:
+            with open(self.filename, 'rb') as f:
+                docs = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        with self.lock:
+            for doc_id, doc in docs.items():
+                self._add(doc_id, doc)
+
+    def dump(self):
+        """
+        persist the documents
+        """
+        if self.filename is None:
+            return None
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self.lock:
+            data = pickle.dumps(self.docs, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self.filename + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def is_current(self, doc_id, st):
+        """
+        True if the document was indexed from a file with this stat
+        """
+        doc = self.docs.get(doc_id)
+        return doc is not None and doc[0] == st.st_mtime_ns and doc[1] == st.st_size
+
+    def add(self, doc_id, text, lexer_alias, tags=(), label='', group='', st=None):
+        """
+        (re)index a snippet body
+        """
+        terms = extract_terms(text, lexer_alias)
+        doc = (st.st_mtime_ns if st else 0, st.st_size if st else 0, lexer_alias, tuple(tags), label, group,
+               terms)
+        with self.lock:
+            self._remove(doc_id)
+            self._add(doc_id, doc)
+            self.stats['indexed'] += 1
+
+    def add_file(self, doc_id, filename, lexer_alias, tags=(), label='', group=''):
+        """
+        index a snippet file unless it is already indexed in its current version
+        """
+        st = os.stat(filename) if self.backend is None else self.backend.stat(filename)
+        if self.is_current(doc_id, st):
+            return False
+        if self.backend is None:
+            body = read_body(filename, self.max_body_size)
+        else:
+            body = self.backend.read_body(filename, self.max_body_size)
+        self.add(doc_id, body, lexer_alias, tags, label, group, st)
+        return True
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._remove(doc_id)
+
+    def prune(self, doc_ids):
+        """
+        drop all documents that are not in doc_ids
+        """
+        with self.lock:
+            for doc_id in [doc_id for doc_id in self.docs if doc_id not in doc_ids]:
+                self._remove(doc_id)
+
+    def _add(self, doc_id, doc):
+        self.docs[doc_id] = doc
+        for term, counts in doc[6].items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self._add_term(term)
+            self.postings[term][doc_id] = counts
+        for tag in doc[3]:
+            self.tag_docs.setdefault(tag, set()).add(doc_id)
+        self.lexer_docs.setdefault(doc[2], set()).add(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return None
+        for term in doc[6]:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+                    self._remove_term(term)
+        for tag in doc[3]:
+            self.tag_docs.get(tag, set()).discard(doc_id)
+        self.lexer_docs.get(doc[2], set()).discard(doc_id)
+
+    def _add_term(self, term):
+        if self._vocabulary is not None:
+            insort(self._vocabulary, term)
+        if self._trigrams is not None:
+            for i in range(len(term) - 2):
+                self._trigrams.setdefault(term[i:i + 3], set()).add(term)
+
+    def _remove_term(self, term):
+        if self._vocabulary is not None:
+            i = bisect_left(self._vocabulary, term)
+            if i < len(self._vocabulary) and self._vocabulary[i] == term:
+                del self._vocabulary[i]
+        if self._trigrams is not None:
+            for i in range(len(term) - 2):
+                self._trigrams.get(term[i:i + 3], set()).discard(term)
+
+    def expand(self, pattern):
+        """
+        the terms matching pattern, "foo" exact, "foo*" prefix, "*foo*" substring
+        """
+        if pattern.startswith('*') and pattern.endswith('*') and len(pattern) > 2:
+            return self._substring_terms(pattern.strip('*'))
+        if pattern.endswith('*') and len(pattern) > 1:
+            prefix = pattern[:-1]
+            vocabulary = self.vocabulary()
+            terms = []
+            i = bisect_left(vocabulary, prefix)
+            while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+                terms.append(vocabulary[i])
+                i += 1
+            return terms
+        return [pattern] if pattern in self.postings else []
+
+    def vocabulary(self):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+
+    def _substring_terms(self, part):
+        if len(part) < 3:
+            return [term for term in self.vocabulary() if part in term]
+        if self._trigrams is None:
+            trigrams = {}
+            for term in self.postings:
+                for i in range(len(term) - 2):
+                    trigrams.setdefault(term[i:i + 3], set()).add(term)
+            self._trigrams = trigrams
+        candidates = None
+        for i in range(len(part) - 2):
+            terms = self._trigrams.get(part[i:i + 3], set())
+            candidates = terms if candidates is None else candidates & terms
+            if not candidates:
+                return []
+        return [term for term in candidates if part in term]
+
+    def search(self, query, limit=50):
+        """
+        ranked search, returns a list of (score, doc id)
+
+        all words of the query have to match, "tag:x" and "lang:x" restrict the
+        documents, "in:name", "in:comment", "in:string" or "in:code" the kinds of tokens
+        """
+        words = []
+        tags = []
+        lexers = []
+        kinds = []
+        for part in query.split():
+            m = FILTER.match(part)
+            if m is None:
+                if part.strip('*'):
+                    words.append(part.lower())
+            elif m.group(1) == 'tag':
+                tags.append(m.group(2))
+            elif m.group(1) == 'lang':
+                lexers.append(m.group(2))
+            elif m.group(2) in KINDS:
+                kinds.append(KINDS.index(m.group(2)))
+        if not kinds:
+            kinds = range(len(KINDS))
+        with self.lock:
+            self.stats['queries'] += 1
+            allowed = None
+            for tag in tags:
+                docs = self.tag_docs.get(tag, set())
+                allowed = docs if allowed is None else allowed & docs
+            if lexers:
+                docs = set()
+                for alias in lexers:
+                    docs |= self.lexer_docs.get(alias, set())
+                allowed = docs if allowed is None else allowed & docs
+            if not words:
+                return [(0., doc_id) for doc_id in sorted(allowed or [])][:limit]
+            n_docs = float(len(self.docs)) or 1.
+            scores = None
+            for word in words:
+                word_scores = {}
+                for term in self.expand(word):
+                    posting = self.postings[term]
+                    idf = math.log(1. + n_docs / len(posting))
+                    for doc_id, counts in posting.items():
+                        if allowed is not None and doc_id not in allowed:
+                            continue
+                        tf = sum(counts[k] * KIND_WEIGHTS[k] for k in kinds)
+                        if tf:
+                            word_scores[doc_id] = word_scores.get(doc_id, 0.) + (1. + math.log(tf)) * idf
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {doc_id: score + word_scores[doc_id] for doc_id, score in scores.items()
+                              if doc_id in word_scores}
+                if not scores:
+                    return []
+            ranked = sorted(((score, doc_id) for doc_id, score in scores.items()), key=lambda r: (-r[0], r[1]))
+            return ranked[:limit]
+
+
+class SearchIndexer(object):
+    """
+    indexes snippet files in a background thread
+    """
+    index = None
+
+    def __init__(self, index):
+        self.index = index
+        self.jobs = []
+        self.thread = None
+        self.done = True
+
+    def start(self, jobs):
+        """
+        jobs is a list of (doc id, filename, lexer_alias, tags, label, group)
+        """
+        self.jobs = list(jobs)
+        self.done = False
+        self.thread = threading.Thread(target=self.run, name='search-indexer', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.index.prune(set(job[0] for job in self.jobs))
+            for job in self.jobs:
+                try:
+                    self.index.add_file(*job)
+                except OSError:
+                    self.index.remove(job[0])
+            self.index.dump()
+        finally:
+            self.done = True
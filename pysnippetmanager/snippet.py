@@ -3,24 +3,13 @@ __author__ = "Martin Schröder"
 __copyright__ = "Copyright 2019, Martin Schröder"
 __email__ = "m.schroeder@tu-berlin.de"
 
-from pygments.lexers import get_lexer_by_name
-from pygments.lexer import Lexer
+from pysnippetmanager.lexers import get_lexer
 from pygments.util import ClassNotFound
 
-try:
-    from tkinter import *
-    from tkinter import messagebox
-    from tkinter.filedialog import askopenfilename, asksaveasfilename, askdirectory
-    from tkinter import ttk
-except ImportError:
-    raise ModuleNotFoundError
 import os
-from shutil import copy2
 
-from datetime import datetime
-
-DIR_IMG = os.path.dirname(os.path.abspath(__file__)) + '/../img/folder.png'
-FILE_IMG = os.path.dirname(os.path.abspath(__file__)) + '/../img/file.png'
+from pysnippetmanager.metadata import parse_header
+from pysnippetmanager.storage import open_backend
 
 
 class Snippet(object):
@@ -35,54 +24,106 @@ class Snippet(object):
     attachments = []  # a list of attachments
     _raw_snippet = ''  # 
     filename = None  # name and location of the file holding the  snippet
+    backend = None  # the storage backend holding the snippet
     events = {}
     parse_header_done = False
     parse_snippet_done = False
     snippet_changed = False
+    detect_lexer = False  # the lexer was not picked yet and is detected from the content
+    large_file_size = 16 * 1024 * 1024  # files above this many bytes are opened read only through a Pager
 
-    def __init__(self, filename, lexer_alias=None, create=False, base_dir='~/'):
+    def __init__(self, filename, lexer_alias=None, create=False, base_dir='~/', header=None, backend=None):
         """
         constructor of the  snippet object
+
+        header: the already known header line, the file is not read in that case
+        backend: the storage backend, defaults to the one of base_dir
         """
-        self.filename = os.path.expanduser(filename)
-        self.label = os.path.splitext(os.path.split(self.filename)[-1])[0]
-        self.group = os.path.split(self.filename)[0].replace(os.path.expanduser(base_dir), '')
-        self.events = dict(lexer_after_change=[], lexer_before_change=[])
+        self.backend = backend if backend is not None else open_backend(base_dir)
+        self.set_filename(filename, base_dir)
+        self.events = dict(lexer_after_change=[], lexer_before_change=[], after_save=[])
         if create and lexer_alias is not None:
             self.lexer_alias = lexer_alias
-            self.lexer = get_lexer_by_name(self.lexer_alias)
+            self.lexer = get_lexer(self.lexer_alias)
             self.tags = []
             self.save()
+        elif header is not None:
+            self.header = header
         else:
             self.parse_file(header_only=True)
 
+    def set_filename(self, filename, base_dir='~/'):
+        """
+        set the location of the file, label and group follow from it
+        """
+        self.filename = os.path.expanduser(filename)
+        self.label = os.path.splitext(os.path.split(self.filename)[-1])[0]
+        self.group = os.path.split(self.filename)[0].replace(os.path.expanduser(base_dir), '')
+
+    def reload(self):
+        """
+        read the header again, the body is read on the next access
+        """
+        self.parse_snippet_done = False
+        self._raw_snippet = ''
+        self.parse_file(header_only=True)
+
     def parse_file(self, header_only=False):
         """
-        parse the file
+        parse the file, with header_only only a bounded prefix of the file is read
+        """
+        if header_only or not self.parse_header_done:
+            self.header = self.backend.read_header(self.filename)
+        if not header_only:
+            self.snippet = self.backend.read_body(self.filename)
+
+    def is_large(self):
+        """
+        True if the file is too large to be loaded as a whole
         """
-        with open(self.filename, 'r') as f:
-            _header = f.readline()  # extract header
-            self.header = _header
-            if not header_only:
-                self.snippet = f.read()
+        if not self.backend.on_disk:
+            return False
+        try:
+            return os.path.getsize(self.filename) > self.large_file_size
+        except OSError:
+            return False
+
+    def open_pager(self):
+        """
+        a Pager over the body of the file
+        """
+        return self.backend.open_pager(self.filename)
 
-    def save(self):
+    def save(self, save_queue=None):
         """
         save snippet to file
+
+        save_queue: a SaveQueue that writes the file in the background, its owner
+        triggers after_save once the write is done
         """
         if not self.snippet_changed:
             return False
-        backup_dir = os.path.expanduser(os.path.join(os.path.dirname(self.filename), '.backup'))
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-
-        copy2(self.filename, os.path.join(backup_dir,
-                                          self.label + '%s' % datetime.strftime(datetime.now(),
-                                                                                '_%Y%m%d_%H%M%S') + '.pycsm'))
-        with open(self.filename, 'w') as f:
-            f.write(self.header + '\n')
-            f.write(self.snippet)
+        content = self.header + '\n' + self.snippet
         self.snippet_changed = False
+        if save_queue is not None:
+            save_queue.submit(self, content)
+            return True
+        self.backend.write(self.filename, content)
+        self.trigger_event("after_save")
+        return True
+
+    def versions(self):
+        """
+        the backed up versions of the snippet, newest first
+        """
+        return self.backend.versions(self.filename)
+
+    def restore(self, version):
+        """
+        replace the file with a backed up version, the current content is backed up before
+        """
+        self.backend.restore(self.filename, version.digest)
+        self.reload()
 
     @property
     def header(self):
@@ -90,7 +131,7 @@ class Snippet(object):
         get header
         """
         if not self.parse_header_done:
-            self.parse_file()
+            self.parse_file(header_only=True)
         _header = self.lexer_alias
         for tag in self.tags:
             _header += ', %s' % tag
@@ -101,19 +142,15 @@ class Snippet(object):
         """ parse header
         structure: lexer, tag, tag, tag
         """
-        _header = value.split(',')
-        self.tags = []
-        if len(_header) == 0:
-            self.lexer = None
-        else:
-            self.lexer = _header.pop(0).strip()
-            self.tags = []
-            for tag in _header:
-                self.tags.append(tag.strip())
+        lexer_alias, self.tags = parse_header(value)
+        self.lexer = lexer_alias
         self.parse_header_done = True
 
     @property
     def snippet(self):
+        """
+        the body, it is read from the file on first access
+        """
         if not self.parse_snippet_done:
             self.parse_file()
         return self._raw_snippet
@@ -131,14 +168,15 @@ class Snippet(object):
 
     @lexer.setter
     def lexer(self, value):
+        from pygments.lexer import Lexer
         self.trigger_event("lexer_before_change")
         if value is None:
-            self._lexer = get_lexer_by_name("text")
+            self._lexer = get_lexer("text")
         elif type(value) is str:
             try:
-                self._lexer = get_lexer_by_name(value)
+                self._lexer = get_lexer(value)
             except ClassNotFound:
-                self._lexer = get_lexer_by_name('text')
+                self._lexer = get_lexer('text')
             self.lexer_alias = self._lexer.aliases[0]
         elif isinstance(value, Lexer):
             self._lexer = value
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+from bisect import bisect_right
+
+
+class TextIndex(object):
+    """
+    converts character offsets inside a region of a text to Tk "line.col" indices
+    """
+    start = 0
+    first_line = 1
+    line_starts = []
+
+    def __init__(self, text, start=0, end=None, first_line=None):
+        if end is None:
+            end = len(text)
+        self.start = start
+        self.first_line = text.count('\n', 0, start) + 1 if first_line is None else first_line
+        line_start = text.rfind('\n', 0, start) + 1
+        self.line_starts = [line_start]
+        pos = text.find('\n', start, end)
+        while pos != -1:
+            self.line_starts.append(pos + 1)
+            pos = text.find('\n', pos + 1, end)
+
+    def index(self, offset):
+        """
+        the Tk index of the character offset
+        """
+        i = bisect_right(self.line_starts, offset) - 1
+        return '%d.%d' % (self.first_line + i, offset - self.line_starts[i])
+
+
+def merge_spans(spans):
+    """
+    merge adjacent (start, end, tag) spans that have the same tag
+    """
+    merged = []
+    for start, end, tag in spans:
+        if merged and merged[-1][2] == tag and merged[-1][1] == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end, tag])
+    return merged
+
+
+def group_spans(spans):
+    """
+    group the (start, end, tag) spans by tag
+    """
+    groups = {}
+    for start, end, tag in spans:
+        if tag in groups:
+            groups[tag].append((start, end))
+        else:
+            groups[tag] = [(start, end)]
+    return groups
+
+
+def apply_spans(widget, text, start, end, spans, clear_tags=(), first_line=None):
+    """
+    retag the region start:end of a Text widget
+
+    every tag in clear_tags is removed from the region with one tag_remove call,
+    then every tag of the (start, end, tag) spans is added with one multi-range
+    tag_add call, returns the set of applied tags, first_line is the line of
+    start if the caller knows it
+    """
+    index = TextIndex(text, start, end, first_line)
+    region_start = index.index(start)
+    region_end = index.index(end)
+    for tag in clear_tags:
+        widget.tag_remove(tag, region_start, region_end)
+    groups = group_spans(merge_spans(spans))
+    for tag, ranges in groups.items():
+        indices = []
+        for span_start, span_end in ranges:
+            indices.append(index.index(max(span_start, start)))
+            indices.append(index.index(min(span_end, end)))
+        widget.tag_add(tag, *indices)
+    return set(groups)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+try:
+    from tkinter import *
+    from tkinter import messagebox
+    from tkinter.filedialog import asksaveasfilename
+except ImportError:
+    raise ModuleNotFoundError
+
+from pysnippetmanager.profiling import STATS
+
+BAR_WIDTH = 20  # chars of the histogram bar of a timer
+
+
+def format_stats(summary):
+    """
+    the timers and counters of STATS.summary() as a fixed width table
+    """
+    lines = ['%-20s %7s %9s %9s %9s %9s %9s  %s' % ('timer', 'n', 'mean ms', 'p50', 'p90', 'p99', 'max',
+                                                     'histogram')]
+    for name, timer in sorted(summary['timers'].items()):
+        histogram = timer['histogram']
+        peak = max(histogram) or 1
+        bar = ''.join(' .:-=+*#%@'[int(9 * n / peak + 0.99)] for n in histogram)
+        lines.append('%-20s %7d %9.2f %9.2f %9.2f %9.2f %9.2f  |%s|' % (
+            name, timer['count'], timer['mean_ms'], timer['p50_ms'], timer['p90_ms'], timer['p99_ms'],
+            timer['max_ms'], bar[:BAR_WIDTH]))
+    lines.append('')
+    lines.append('%-20s %12s' % ('counter', 'value'))
+    for name, value in sorted(summary['counters'].items()):
+        lines.append('%-20s %12d' % (name, value))
+    lines.append('')
+    lines.append('histogram bins (ms): %s, more' % ', '.join('%g' % bound for bound in summary['buckets_ms']))
+    lines.append('collected for %.1f s' % summary['seconds'])
+    return '\n'.join(lines)
+
+
+class StatsWindow(object):
+    """
+    the timers and counters of STATS, refreshed every refresh_interval ms while the window is open
+
+    the profile buttons capture the next highlight pass or rescan with cProfile, on the
+    Tk thread as well as in the crawler threads and the tokenizer workers, the report of
+    the last capture is shown below the table
+    """
+    root = None
+    text = None
+    refresh_interval = 1000  # ms
+    _timer = None
+
+    def __init__(self, master, app):
+        self.master = master
+        self.app = app
+        self.root = Toplevel(master)
+        self.root.title("Stats")
+        self.enabled = BooleanVar(self.root, value=STATS.enabled)
+        toolbar = Frame(self.root)
+        Checkbutton(toolbar, text="enabled", variable=self.enabled, command=self.toggle).pack(side=LEFT, padx=2)
+        Button(toolbar, text="RESET", width=6, command=self.reset).pack(side=LEFT, padx=2, pady=2)
+        Button(toolbar, text="DUMP JSON", width=10, command=self.dump).pack(side=LEFT, padx=2, pady=2)
+        Button(toolbar, text="PROFILE HIGHLIGHT", width=16,
+               command=self.profile_highlight).pack(side=LEFT, padx=2, pady=2)
+        Button(toolbar, text="PROFILE RESCAN", width=14, command=self.profile_rescan).pack(side=LEFT, padx=2, pady=2)
+        Button(toolbar, text="CLOSE", width=6, command=self.close).pack(side=LEFT, padx=2, pady=2)
+        toolbar.pack(side=TOP, fill=X)
+        self.text = Text(self.root, width=110, height=40, font='TkFixedFont', wrap=NONE)
+        self.text.pack(side=TOP, fill=BOTH, expand=YES)
+        self.root.bind("<Escape>", self.close)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.refresh()
+
+    def refresh(self):
+        content = format_stats(STATS.summary())
+        if STATS.profile_target is not None:
+            content += '\n\nprofiling the next %s ...' % STATS.profile_target
+        for name, (filename, report) in sorted(STATS.profiles.items()):
+            content += '\n\nprofile of %s, %s\n%s' % (name, filename, report)
+        position = self.text.yview()[0]
+        self.text.configure(state=NORMAL)
+        self.text.delete("1.0", END)
+        self.text.insert("1.0", content)
+        self.text.configure(state=DISABLED)
+        self.text.yview_moveto(position)
+        self._timer = self.root.after(self.refresh_interval, self.refresh)
+
+    def toggle(self):
+        STATS.enabled = self.enabled.get()
+
+    def reset(self):
+        STATS.reset()
+
+    def dump(self):
+        filename = asksaveasfilename(parent=self.root, defaultextension='.json', initialfile='stats.json',
+                                     filetypes=[('JSON', '*.json')])
+        if not filename:
+            return None
+        try:
+            STATS.dump(filename)
+        except OSError as e:
+            messagebox.showerror("Stats", "Dumping the stats failed:\n%s" % e, parent=self.root)
+
+    def profile_highlight(self):
+        """
+        capture a full highlight pass of the open snippet
+        """
+        if self.app.text.snippet is None:
+            messagebox.showinfo("Stats", "Open a snippet first", parent=self.root)
+            return None
+        STATS.profile_next('highlight')
+        self.app.text.update_highlight()
+
+    def profile_rescan(self):
+        STATS.profile_next('rescan')
+        self.app.crawler()
+
+    def close(self, event=None):
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = None
+        self.root.destroy()
+        self.app.stats_window = None
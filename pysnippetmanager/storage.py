@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+where the snippets are stored
+
+snippets are addressed by their filename below the base directory of a backend,
+group and label follow from it as for the files. the FileBackend keeps one .pycsm
+file per snippet and one directory per group, the SqliteBackend keeps headers,
+bodies, groups and the backup history in a single database file, its snippets
+have virtual filenames below the database file, <database>/<group>/<label>.pycsm
+"""
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import sqlite3
+import threading
+import zlib
+from collections import namedtuple
+from time import time, time_ns
+
+from pysnippetmanager.backup import Version, content_hash, get_store, select_versions
+from pysnippetmanager.crawler import Crawler
+from pysnippetmanager.metadata import read_header, read_body, HEADER_SIZE
+from pysnippetmanager.pager import Pager
+from pysnippetmanager.profiling import STATS
+from pysnippetmanager.saver import write_snippet
+
+DB_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+
+# the fields of os.stat_result the indices look at
+Stat = namedtuple('Stat', 'st_mtime_ns st_size st_ino st_mtime')
+
+
+class Backend(object):
+    """
+    base class of the storage backends
+
+    on_disk is True if the snippets are real files, only then they can be paged,
+    watched and picked in file dialogs
+    """
+    base_dir = ''
+    on_disk = True
+
+    def __init__(self, base_dir):
+        self.base_dir = os.path.abspath(os.path.expanduser(base_dir))
+
+    def read_header(self, filename, max_bytes=HEADER_SIZE):
+        raise NotImplementedError
+
+    def read_body(self, filename, max_size=None):
+        raise NotImplementedError
+
+    def stat(self, filename):
+        raise NotImplementedError
+
+    def exists(self, filename):
+        raise NotImplementedError
+
+    def write(self, filename, content):
+        """
+        back up content and store it as filename, content is the header line and the body
+        """
+        raise NotImplementedError
+
+    def write_many(self, items):
+        """
+        store a list of (filename, content), returns filename -> error message of the failed ones
+        """
+        failed = {}
+        for filename, content in items:
+            try:
+                self.write(filename, content)
+            except Exception as e:
+                failed[filename] = str(e) or e.__class__.__name__
+        return failed
+
+    def delete(self, filename):
+        raise NotImplementedError
+
+    def make_group(self, directory):
+        raise NotImplementedError
+
+    def crawler(self, index=None):
+        """
+        a Crawler or an object with the same interface over all groups and snippets
+        """
+        raise NotImplementedError
+
+    def versions(self, filename):
+        """
+        the backed up versions of a snippet, newest first
+        """
+        raise NotImplementedError
+
+    def read_version(self, filename, digest):
+        raise NotImplementedError
+
+    def record(self, filename, text, when):
+        """
+        add text as a version saved at time when, used to carry the history over on migration
+        """
+        raise NotImplementedError
+
+    def restore(self, filename, digest):
+        """
+        write a version back, the current content is backed up before
+        """
+        text = self.read_version(filename, digest)
+        self.write(filename, text)
+        return text
+
+    def open_pager(self, filename):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileBackend(Backend):
+    """
+    one .pycsm file per snippet and one directory per group, the default
+    """
+
+    def read_header(self, filename, max_bytes=HEADER_SIZE):
+        return read_header(filename, max_bytes)
+
+    def read_body(self, filename, max_size=None):
+        return read_body(filename, max_size)
+
+    def stat(self, filename):
+        return os.stat(filename)
+
+    def exists(self, filename):
+        return os.path.isfile(filename)
+
+    def write(self, filename, content):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        write_snippet(filename, content)
+
+    def delete(self, filename):
+        os.remove(filename)
+
+    def make_group(self, directory):
+        os.makedirs(directory, exist_ok=True)
+
+    def crawler(self, index=None):
+        return Crawler(self.base_dir, index=index)
+
+    def versions(self, filename):
+        return get_store(os.path.dirname(filename)).versions(os.path.basename(filename))
+
+    def read_version(self, filename, digest):
+        return get_store(os.path.dirname(filename)).read(digest)
+
+    def record(self, filename, text, when):
+        return get_store(os.path.dirname(filename)).record(os.path.basename(filename), text, when)
+
+    def restore(self, filename, digest):
+        return get_store(os.path.dirname(filename)).restore(filename, digest)
+
+    def open_pager(self, filename):
+        return Pager(filename, skip_header=True)
+
+
+class SqliteCrawler(Crawler):
+    """
+    the Crawler interface over a SqliteBackend, one query instead of a walk, the
+    headers come from the database and are never stored in the header index
+    """
+    backend = None
+
+    def __init__(self, backend, batch_size=None):
+        super(SqliteCrawler, self).__init__(backend.base_dir, batch_size=batch_size)
+        self.backend = backend
+
+    def crawl(self):
+        # a connection of its own, in WAL mode it reads while the app writes
+        db = sqlite3.connect(self.backend.database)
+        try:
+            for (group,) in db.execute('SELECT path FROM groups ORDER BY path'):
+                if self._stop.is_set():
+                    return None
+                yield 'group', self.backend.path_of(group)
+            cursor = db.execute('SELECT path, header, mtime_ns, size FROM snippets ORDER BY path')
+            while not self._stop.is_set():
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                for key, header, mtime_ns, size in rows:
+                    st = Stat(mtime_ns, size, 0, mtime_ns / 1e9)
+                    yield 'snippet', self.backend.path_of(key), st, header, True
+        finally:
+            db.close()
+
+
+class SqliteBackend(Backend):
+    """
+    all snippets in one SQLite database in WAL mode
+
+    lookups go through the primary key and the group index, write_many stores a
+    batch in a single transaction, every distinct content of a snippet is kept
+    zlib compressed in objects and listed in history, thinned out like the
+    .backup folders of the FileBackend
+    """
+    on_disk = False
+    database = ''
+    keep_last = 10
+    keep_daily = 7
+    keep_weekly = 8
+
+    def __init__(self, database):
+        super(SqliteBackend, self).__init__(database)
+        self.database = self.base_dir
+        directory = os.path.dirname(self.database)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock = threading.RLock()
+        # transactions are started explicitly
+        self.db = sqlite3.connect(self.database, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS snippets ('
+                        'path TEXT PRIMARY KEY, grp TEXT NOT NULL, header TEXT NOT NULL, body TEXT NOT NULL, '
+                        'mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS snippets_grp ON snippets (grp)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS groups (path TEXT PRIMARY KEY)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, data BLOB NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS history ('
+                        'path TEXT NOT NULL, time REAL NOT NULL, digest TEXT NOT NULL, size INTEGER NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS history_path ON history (path, time)')
+
+    def key_of(self, filename):
+        """
+        the database key of a virtual filename, its path below the database file
+        """
+        key = os.path.relpath(os.path.abspath(os.path.expanduser(filename)), self.database)
+        if key.startswith('..'):
+            raise FileNotFoundError('%s is not in %s' % (filename, self.database))
+        return key.replace(os.sep, '/')
+
+    def path_of(self, key):
+        return os.path.join(self.database, *key.split('/'))
+
+    def _row(self, filename, columns):
+        with self.lock:
+            row = self.db.execute('SELECT %s FROM snippets WHERE path = ?' % columns,
+                                  (self.key_of(filename),)).fetchone()
+        if row is None:
+            raise FileNotFoundError('no snippet %s' % filename)
+        return row
+
+    def read_header(self, filename, max_bytes=HEADER_SIZE):
+        return self._row(filename, 'header')[0]
+
+    def read_body(self, filename, max_size=None):
+        if max_size is None:
+            body = self._row(filename, 'body')[0]
+        else:
+            body = self._row(filename, 'substr(body, 1, %d)' % int(max_size))[0]
+        STATS.count('io.body_reads')
+        STATS.count('io.read_bytes', len(body))
+        return body
+
+    def stat(self, filename):
+        mtime_ns, size = self._row(filename, 'mtime_ns, size')
+        return Stat(mtime_ns, size, 0, mtime_ns / 1e9)
+
+    def exists(self, filename):
+        try:
+            self._row(filename, 'size')
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _add_groups(self, key):
+        parts = key.split('/')[:-1]
+        self.db.executemany('INSERT OR IGNORE INTO groups (path) VALUES (?)',
+                            [('/'.join(parts[:i]),) for i in range(1, len(parts) + 1)])
+
+    def _add_version(self, key, text, when):
+        """
+        list text as the newest version of key unless it is that already
+        """
+        digest = content_hash(text)
+        latest = self.db.execute('SELECT digest FROM history WHERE path = ? ORDER BY time DESC LIMIT 1',
+                                 (key,)).fetchone()
+        if latest is not None and latest[0] == digest:
+            return None
+        self.db.execute('INSERT OR IGNORE INTO objects (digest, data) VALUES (?, ?)',
+                        (digest, zlib.compress(text.encode('utf-8'))))
+        self.db.execute('INSERT INTO history (path, time, digest, size) VALUES (?, ?, ?, ?)',
+                        (key, when, digest, len(text)))
+        return key
+
+    def _prune(self, key):
+        versions = [Version(*row) for row in self.db.execute(
+            'SELECT time, digest, size FROM history WHERE path = ? ORDER BY time DESC', (key,))]
+        if len(versions) <= 2 * (self.keep_last + self.keep_daily + self.keep_weekly):
+            return None
+        keep = select_versions(versions, self.keep_last, self.keep_daily, self.keep_weekly)
+        self.db.executemany('DELETE FROM history WHERE path = ? AND time = ? AND digest = ?',
+                            [(key, version.time, version.digest) for version in set(versions) - set(keep)])
+        self.db.execute('DELETE FROM objects WHERE digest NOT IN (SELECT digest FROM history)')
+
+    def write(self, filename, content):
+        failed = self.write_many([(filename, content)])
+        if failed:
+            raise OSError(failed[filename])
+
+    def write_many(self, items):
+        """
+        store a batch of (filename, content) in one transaction, all or none of them are written
+        """
+        t0 = STATS.start()
+        with self.lock:
+            try:
+                keys = [(self.key_of(filename), filename, content) for filename, content in items]
+                self.db.execute('BEGIN IMMEDIATE')
+                changed = []
+                for key, filename, content in keys:
+                    header, _, body = content.partition('\n')
+                    self.db.execute('INSERT OR REPLACE INTO snippets (path, grp, header, body, mtime_ns, size) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)',
+                                    (key, key.rpartition('/')[0], header, body, time_ns(), len(content)))
+                    self._add_groups(key)
+                    if self._add_version(key, content, time()):
+                        changed.append(key)
+                for key in changed:
+                    self._prune(key)
+                self.db.execute('COMMIT')
+            except Exception as e:
+                # BEGIN itself may have failed, e.g. the database is locked by another process
+                if self.db.in_transaction:
+                    self.db.execute('ROLLBACK')
+                return dict((filename, str(e) or e.__class__.__name__) for filename, content in items)
+        STATS.stop('save.write', t0)
+        STATS.count('io.written_bytes', sum(len(content) for filename, content in items))
+        return {}
+
+    def delete(self, filename):
+        with self.lock:
+            self.db.execute('DELETE FROM snippets WHERE path = ?', (self.key_of(filename),))
+
+    def make_group(self, directory):
+        key = self.key_of(directory)
+        if key == '.':
+            return None
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            self._add_groups(key + '/')
+            self.db.execute('COMMIT')
+
+    def crawler(self, index=None):
+        return SqliteCrawler(self)
+
+    def versions(self, filename):
+        with self.lock:
+            return [Version(*row) for row in self.db.execute(
+                'SELECT time, digest, size FROM history WHERE path = ? ORDER BY time DESC',
+                (self.key_of(filename),))]
+
+    def read_version(self, filename, digest):
+        with self.lock:
+            row = self.db.execute('SELECT data FROM objects WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            raise FileNotFoundError('no version %s' % digest)
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def record(self, filename, text, when):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            self._add_version(self.key_of(filename), text, when)
+            self.db.execute('COMMIT')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def is_database(base_dir):
+    """
+    True if base_dir names a snippet database instead of a directory
+    """
+    path = os.path.expanduser(base_dir)
+    return path.endswith(DB_SUFFIXES) and not os.path.isdir(path)
+
+
+def open_backend(base_dir):
+    """
+    the shared backend of base_dir, a SqliteBackend for .sqlite, .sqlite3 and .db files
+    """
+    path = os.path.abspath(os.path.expanduser(base_dir))
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = SqliteBackend(path) if is_database(path) else FileBackend(path)
+        return _backends[path]
+
+
+def migrate(source, target, history=True, batch_size=500):
+    """
+    copy all groups and snippets of the backend source to the backend target,
+    with history the backed up versions are carried over as well
+
+    yields (filename in target, error message or None) for every snippet
+    """
+    batch = []
+    for item in source.crawler().crawl():
+        new_filename = os.path.join(target.base_dir, os.path.relpath(item[1], source.base_dir))
+        if item[0] == 'group':
+            target.make_group(new_filename)
+            continue
+        try:
+            if history:
+                for version in reversed(source.versions(item[1])):
+                    target.record(new_filename, source.read_version(item[1], version.digest), version.time)
+            batch.append((new_filename, item[3] + '\n' + source.read_body(item[1])))
+        except (OSError, UnicodeError, sqlite3.Error) as e:
+            yield new_filename, str(e)
+        if len(batch) >= batch_size:
+            for result in _write_batch(target, batch):
+                yield result
+            batch = []
+    for result in _write_batch(target, batch):
+        yield result
+
+
+def _write_batch(target, batch):
+    failed = target.write_many(batch)
+    return [(filename, failed.get(filename)) for filename, content in batch]
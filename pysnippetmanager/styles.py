@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import json
+import os
+
+# every tag gets all of these options, so a style switch also clears what the old style set
+TAG_OPTIONS = dict(foreground='', background='', font='', underline='')
+
+
+def format_options(format_dict, font_name, font_size):
+    """
+    the Tk tag options of a pygments style format dict
+    """
+    options = {}
+    if format_dict['color'] is not None:
+        options['foreground'] = '#' + format_dict['color']
+    if format_dict['bgcolor'] is not None:
+        options['background'] = '#' + format_dict['bgcolor']
+    if format_dict['bold'] and format_dict['italic']:
+        options['font'] = '%s %d bold italic' % (font_name, font_size)
+    elif format_dict['bold']:
+        options['font'] = '%s %d bold' % (font_name, font_size)
+    elif format_dict['italic']:
+        options['font'] = '%s %d italic' % (font_name, font_size)
+    if format_dict['underline']:
+        options['underline'] = True
+    return options
+
+
+def style_tags(style_name, font_name, font_size):
+    """
+    the background color and a dict tag name -> complete Tk tag options of a pygments style
+    """
+    from pygments.styles import get_style_by_name
+    style = get_style_by_name(style_name)
+    tags = {}
+    for token, format_dict in style.list_styles():
+        options = dict(TAG_OPTIONS)
+        options.update(format_options(format_dict, font_name, font_size))
+        tags[str(token)] = options
+    return style.background_color, tags
+
+
+class StyleCache(object):
+    """
+    the tag options of every (style, font, size) are computed once
+
+    with a filename the computed styles are kept on disk, so a known style can
+    be applied without importing pygments.styles at all
+    """
+    filename = None
+    styles = {}  # 'style|font|size' -> (background, {tag: options})
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.styles = {}
+        self.version = None
+        self.load()
+
+    @staticmethod
+    def _key(style_name, font_name, font_size):
+        return '%s|%s|%d' % (style_name, font_name, font_size)
+
+    def _pygments_version(self):
+        if self.version is None:
+            import pygments
+            self.version = pygments.__version__
+        return self.version
+
+    def load(self):
+        if self.filename is None or not os.path.exists(self.filename):
+            return None
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+            if data['pygments'] == self._pygments_version():
+                self.styles = {key: tuple(value) for key, value in data['styles'].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def dump(self):
+        if self.filename is None:
+            return None
+        try:
+            directory = os.path.dirname(self.filename)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(self.filename + '.tmp', 'w') as f:
+                json.dump(dict(pygments=self._pygments_version(), styles=self.styles), f)
+            os.replace(self.filename + '.tmp', self.filename)
+        except OSError:
+            pass
+
+    def get(self, style_name, font_name, font_size):
+        """
+        (background, {tag: options}) of a style, raises ClassNotFound for an unknown style
+        """
+        key = self._key(style_name, font_name, font_size)
+        entry = self.styles.get(key)
+        if entry is None:
+            entry = self.styles[key] = style_tags(style_name, font_name, font_size)
+            self.dump()
+        return entry
+
+
+def lookup_tag(tags, tag):
+    """
+    the options of tag, token types the style does not know inherit from their parent
+    """
+    while tag not in tags and '.' in tag:
+        tag = tag.rsplit('.', 1)[0]
+    return tags.get(tag, TAG_OPTIONS)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+try:
+    from tkinter import *
+    from tkinter import ttk
+except ImportError:
+    raise ModuleNotFoundError
+
+
+class TagBrowser(Frame):
+    """
+    the tag sidebar, lists all tags with the number of their snippets
+
+    selecting tags calls filter_callback(tags, mode) with the selected tags and
+    'and' or 'or', an empty selection means no filter
+    """
+    tags = []
+    filter_callback = None
+
+    def __init__(self, master, filter_callback, **kwargs):
+        super(TagBrowser, self).__init__(master, **kwargs)
+        self.filter_callback = filter_callback
+        self.tags = []
+        self.mode = StringVar(self, value='and')
+        modes = Frame(self)
+        Label(modes, text="Tags").pack(side=LEFT, padx=2)
+        Radiobutton(modes, text="all", variable=self.mode, value='and',
+                    command=self.changed).pack(side=LEFT)
+        Radiobutton(modes, text="any", variable=self.mode, value='or',
+                    command=self.changed).pack(side=LEFT)
+        modes.pack(side=TOP, fill=X)
+        self.listbox = Listbox(self, selectmode=MULTIPLE, exportselection=False, width=20)
+        self.listbox.pack(side=TOP, fill=BOTH, expand=YES)
+        self.listbox.bind("<<ListboxSelect>>", self.changed)
+        Button(self, text="CLEAR", command=self.clear_selection).pack(side=TOP, fill=X)
+
+    def set_counts(self, counts):
+        """
+        show a list of (tag, count), the selected tags stay selected
+        """
+        selected = set(self.selected_tags())
+        self.tags = [tag for tag, count in counts]
+        self.listbox.delete(0, END)
+        if counts:
+            self.listbox.insert(END, *['%s (%d)' % (tag, count) for tag, count in counts])
+        for i, tag in enumerate(self.tags):
+            if tag in selected:
+                self.listbox.selection_set(i)
+
+    def selected_tags(self):
+        return [self.tags[i] for i in self.listbox.curselection() if i < len(self.tags)]
+
+    def changed(self, event=None):
+        self.filter_callback(self.selected_tags(), self.mode.get())
+
+    def clear_selection(self):
+        self.listbox.selection_clear(0, END)
+        self.changed()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+
+class TagIndex(object):
+    """
+    tag -> set of snippet ids, one dict lookup per tag of a query
+    """
+    tag_ids = {}  # tag -> set of ids
+    item_tags = {}  # id -> tuple of the tags of the snippet
+
+    def __init__(self):
+        self.tag_ids = {}
+        self.item_tags = {}
+
+    def add(self, key, tags):
+        """
+        add or replace the tags of key
+        """
+        self.remove(key)
+        tags = tuple(sorted(set(tags)))
+        self.item_tags[key] = tags
+        for tag in tags:
+            self.tag_ids.setdefault(tag, set()).add(key)
+
+    def remove(self, key):
+        for tag in self.item_tags.pop(key, ()):
+            ids = self.tag_ids[tag]
+            ids.discard(key)
+            if not ids:
+                del self.tag_ids[tag]
+
+    def clear(self):
+        self.__init__()
+
+    def counts(self):
+        """
+        list of (tag, number of snippets) sorted by tag
+        """
+        return sorted((tag, len(ids)) for tag, ids in self.tag_ids.items())
+
+    def match(self, tags, mode='and'):
+        """
+        the ids of the snippets that have all (mode 'and') or any (mode 'or') of tags
+        """
+        sets = [self.tag_ids.get(tag, set()) for tag in tags]
+        if not sets:
+            return set()
+        if mode == 'or':
+            return set().union(*sets)
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
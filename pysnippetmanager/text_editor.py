@@ -3,7 +3,12 @@ __author__ = "Martin Schröder"
 __copyright__ = "Copyright 2019, Martin Schröder"
 __email__ = "m.schroeder@tu-berlin.de"
 
-from pygments.styles import get_style_by_name
+from pysnippetmanager.highlighter import Highlighter, changed_region
+from pysnippetmanager.spans import apply_spans
+from pysnippetmanager.styles import StyleCache, format_options, lookup_tag
+from pysnippetmanager.index import cache_dir
+from pysnippetmanager.tokenizer import SpanCache, TokenSpans
+from pysnippetmanager.profiling import STATS
 
 try:
     from tkinter import *
@@ -13,6 +18,7 @@ try:
 except ImportError:
     raise ModuleNotFoundError
 import os
+from time import perf_counter
 
 DIR_IMG = os.path.dirname(os.path.abspath(__file__)) + '/../img/folder.png'
 FILE_IMG = os.path.dirname(os.path.abspath(__file__)) + '/../img/file.png'
@@ -28,47 +34,85 @@ class TextEditor(Text):
     row = '0'
     _snippet = None
     _style = None
+    highlighter = None
+    highlight_tags = set()  # tag names currently applied to the text
+    highlight_delay = 50  # debounce interval in ms between the last edit and the highlight pass
+    highlight_budget = 8  # max time in ms a highlight slice may block the main loop
+    highlight_stats = {}
+    _highlight_timer = None
+    _highlight_pass = None
+    _highlight_t0 = None  # STATS start of the running pass
+    _retag_all = False  # the tags do not match the highlighter, the next pass retags the whole text
+    _retag_rest = None  # (start, end, text) of a region a dropped pass did not retag, the next pass does
+    retag_chunk = 16384  # characters retagged at once, a slice retags chunks until its budget is used
+    tokenizer = None  # TokenizerPool for large texts, optional
+    span_cache = None  # SpanCache of recently shown snippets, shared by all editors
+    tokenize_threshold = 100000  # texts above this many chars are tokenized by the tokenizer
+    highlight_limit = 4000000  # texts above this many chars are not highlighted, None for no limit
+    pager = None  # Pager of a large snippet, its content is inserted while scrolling
+    page_ahead = 0.9  # load the next chunk once the view reaches this fraction of the loaded text
+    page_window = 3  # chunks of a large snippet kept in the text, the one farthest from the view is dropped
+    pages = []  # (start offset, end offset, lines) of the chunks in the text, in order
+    pager_scrollcommand = None  # called with the view as fractions of the whole file, e.g. Scrollbar.set
+    _page_timer = None
+    text_version = 0
+    _tokenize_job = None
+    _tokenize_timer = None
     font_size = 10
     font_name = 'monospace'
     style_name = 'colorful'
+    style_cache = None  # StyleCache, shared by all editors
+    style_tags = {}  # tag name -> Tk options of the current style
+    tag_options = {}  # tag name -> options the tag is currently configured with
 
     def __init__(self, *args, **kwargs):
         if 'snippet' in kwargs:
             self.snippet = kwargs['snippet']
             del (kwargs['snippet'])
         super(TextEditor, self).__init__(*args, **kwargs)
+        self.highlight_tags = set()
+        self.style_tags = {}
+        self.tag_options = {}
+        self.highlight_stats = dict(scheduled=0, coalesced=0, cancelled=0, passes=0, slices=0)
 
-        self.bind("<KeyRelease>", self.default_highlight)
+        self.bind("<KeyRelease>", self.schedule_highlight)
         self.bind("<Control-Key-a>", self.select_all)
         self.bind("<1>", lambda event: self.focus_set())
-        self.style = self.style_name
+        # the style is loaded with load_style once the window is up
 
         self.tag_configure("Same", background="#ffff00")
         self.tag_configure(SEL, background="#ffff00")
 
-    def configure_style(self):
-        self.config(background=self._style.background_color,
+    def configure_style(self, style_name=None):
+        """
+        apply a style, only the tags in use whose options change are reconfigured
+        """
+        if TextEditor.style_cache is None:
+            TextEditor.style_cache = StyleCache(os.path.join(cache_dir(), 'styles.json'))
+        style_name = style_name or self.style_name
+        background, self.style_tags = self.style_cache.get(style_name, self.font_name, self.font_size)
+        self.style_name = style_name
+        self.config(background=background,
                     font='%s %d' % (self.font_name, self.font_size))  # set background
-
-        for token, format_dict in self._style.list_styles():
-            self.tag_configure(str(token), **self.parse_pygments_style_format_dict(format_dict))
+        self.configure_tags(self.highlight_tags)
 
         self.tag_configure("Same", background="#ffff00")
         self.tag_configure(SEL, background="#ffff00")
 
+    def configure_tags(self, tags):
+        """
+        bring the options of tags in line with the current style
+        """
+        for tag in tags:
+            options = lookup_tag(self.style_tags, tag)
+            if self.tag_options.get(tag) is not options:
+                if self.tag_options.get(tag) != options:
+                    self.tag_configure(tag, **options)
+                    STATS.count('tcl.calls')
+                self.tag_options[tag] = options
+
     def parse_pygments_style_format_dict(self, format_dict):
-        options = {}
-        if format_dict['color'] is not None:
-            options['foreground'] = '#' + format_dict['color']
-        if format_dict['bgcolor'] is not None:
-            options['background'] = '#' + format_dict['bgcolor']
-        if format_dict['bold']:
-            options['font'] = '%s %d bold' % (self.font_name, self.font_size)
-        if format_dict['italic']:
-            options['font'] = '%s %d italic' % (self.font_name, self.font_size)
-        if format_dict['underline']:
-            options['underline'] = True
-        return options
+        return format_options(format_dict, self.font_name, self.font_size)
 
     def parse_pygments_style_format_str(self, format_str):
         if format_str == '':
@@ -102,6 +146,7 @@ class TextEditor(Text):
         """
         self.delete("1.0", END)
         self.insert(*args, **kwargs)
+        STATS.count('tcl.calls', 2)
 
     def insert(self, *args, **kwargs):
         super(TextEditor, self).insert(*args, **kwargs)
@@ -109,36 +154,256 @@ class TextEditor(Text):
         self.update_highlight()
 
     def default_highlight(self, event=None):
+        """
+        run a complete highlight pass right away
+        """
+        self.cancel_highlight()
+        if self.snippet is None:
+            return None
+        self._start_highlight(step=False)
+        self._highlight_step(budget=None)
+
+    def schedule_highlight(self, event=None, delay=None):
+        """
+        highlight the text once the edits have settled for highlight_delay ms,
+        edits arriving in the meantime are coalesced into a single pass
+        """
+        if self.snippet is None or self.pager is not None:
+            return None
+        self.highlight_stats['scheduled'] += 1
+        self.text_version += 1
+        if self._highlight_timer is not None:
+            self.after_cancel(self._highlight_timer)
+            self.highlight_stats['coalesced'] += 1
+        if self._highlight_pass is not None:
+            # the text changed while the pass was running
+            self._highlight_pass.close()
+            self._highlight_pass = None
+            self.highlight_stats['cancelled'] += 1
+        self._highlight_timer = self.after(self.highlight_delay if delay is None else delay,
+                                           self._start_highlight)
+
+    def cancel_highlight(self):
+        """
+        drop the pending and the running highlight pass
+        """
+        if self._highlight_timer is not None:
+            self.after_cancel(self._highlight_timer)
+            self._highlight_timer = None
+        if self._highlight_pass is not None:
+            self._highlight_pass.close()
+            self._highlight_pass = None
+            self.highlight_stats['cancelled'] += 1
+        if self._tokenize_job is not None:
+            future, snippet_id, version, text = self._tokenize_job
+            self.after_cancel(self._tokenize_timer)
+            self._tokenize_timer = None
+            future.cancel()
+            self.tokenizer.discard(snippet_id, future)
+            self._tokenize_job = None
+
+    def flush_highlight(self):
+        """
+        finish a pending highlight pass, so that the snippet holds the current text
+        """
+        if self._highlight_timer is not None or self._highlight_pass is not None or \
+                self._tokenize_job is not None:
+            self.default_highlight()
+
+    def _start_highlight(self, step=True, offload=True):
+        self._highlight_timer = None
         if self.snippet is None:
             return None
         self.content = self.get("1.0", END)
-        # self.lines = self.content.split("\n")
-        if self.snippet.snippet != self.content:
-            self.mark_set("range_start", self.row + ".0")
-            # data = self.text.get(self.row + ".0", self.row + "." + str(len(self.lines[int(self.row) - 1])))
-            for token, content in self.snippet.lexer.get_tokens(self.content):
-                self.mark_set("range_end", "range_start + %dc" % len(content))
-                self.tag_add(str(token), "range_start", "range_end")
-                self.mark_set("range_start", "range_end")
-        self.snippet.snippet = self.get("1.0", END)
+        self.edit_modified(False)
+        STATS.count('tcl.calls', 2)
+        if self.highlight_limit is not None and len(self.content) > self.highlight_limit:
+            # too large to highlight, just keep the snippet up to date
+            self.remove_highlight()
+            self.snippet.snippet = self.content
+            return None
+        if self.highlighter is None or self.highlighter.lexer is not self.snippet.lexer:
+            self.highlighter = Highlighter(self.snippet.lexer)
+        if self._tokenize_job is not None:
+            # the edits are picked up once the running job is done
+            return None
+        self._highlight_t0 = STATS.start()
+        STATS.start_profile('highlight')
+        if step and offload and self.tokenizer is not None and not self.highlighter.text and \
+                len(self.content) > self.tokenize_threshold:
+            self._tokenize_job = (self.tokenizer.submit(self.snippet.filename, self.text_version,
+                                                        self.snippet.lexer_alias, self.content),
+                                  self.snippet.filename, self.text_version, self.content)
+            self._tokenize_timer = self.after(25, self._poll_tokenizer)
+            return None
+        self.highlight_stats['passes'] += 1
+        self._highlight_pass = self._highlight_run()
+        if step:
+            self._highlight_timer = self.after_idle(self._highlight_step)
+
+    def _highlight_run(self):
+        """
+        the running pass, lexes the text in slices, then retags the changed region, returns the number
+        of tokens lexed
+        """
+        start, end = yield from self.highlighter.run(self.content)
+        if self._retag_all:
+            start, end = 0, len(self.highlighter.text)
+            self._retag_all = False
+        yield from self._retag_run(start, end)
+        return self.highlighter.lexed
+
+    def _retag_run(self, start, end):
+        """
+        retag the region start:end of the highlighter text one retag_chunk at a time, yields after every
+        chunk, the region a dropped run did not get to is taken over by the next one
+        """
+        text = self.highlighter.text
+        if self._retag_rest is not None:
+            rest_start, rest_end, rest_text = self._retag_rest
+            self._retag_rest = None
+            changed, old_end, new_end = changed_region(rest_text, text)
+            if rest_start > changed:
+                rest_start = max(new_end, rest_start + new_end - old_end)
+            if rest_end > changed:
+                rest_end = max(new_end, rest_end + new_end - old_end)
+            if end > start:
+                start, end = min(start, rest_start), max(end, rest_end)
+            else:
+                start, end = rest_start, rest_end
+        if end <= start:
+            return None
+        first_line = text.count('\n', 0, start) + 1
+        try:
+            while start < end:
+                chunk_end = text.find('\n', start + self.retag_chunk, end) + 1 or end
+                self.retag(start, chunk_end, first_line)
+                first_line += text.count('\n', start, chunk_end)
+                start = chunk_end
+                if start < end:
+                    yield
+        finally:
+            if start < end:
+                # dropped, the tags of the rest are out of date
+                self._retag_rest = (start, end, text)
+
+    def _highlight_step(self, budget=-1):
+        """
+        advance the running pass for at most budget ms (highlight_budget if -1, unlimited if None)
+        """
+        self._highlight_timer = None
+        if self._highlight_pass is None:
+            return None
+        if self.edit_modified():
+            # edited since the pass began, its offsets do not fit the widget anymore
+            self.schedule_highlight()
+            return None
+        if budget == -1:
+            budget = self.highlight_budget
+        deadline = None if budget is None else perf_counter() + budget / 1000.
+        self.highlight_stats['slices'] += 1
+        t0 = STATS.start()
+        try:
+            while True:
+                next(self._highlight_pass)
+                if deadline is not None and perf_counter() > deadline:
+                    self._highlight_timer = self.after_idle(self._highlight_step)
+                    STATS.stop('highlight.slice', t0)
+                    return None
+        except StopIteration as result:
+            tokens = result.value
+        STATS.stop('highlight.slice', t0)
+        self._highlight_pass = None
+        self.snippet.snippet = self.content
+        if tokens is not None:
+            self.highlight_done(tokens)
+
+    def highlight_done(self, tokens):
+        """
+        a highlight pass is complete, report it to STATS
+        """
+        STATS.stop('highlight.pass', self._highlight_t0)
+        STATS.count('highlight.passes')
+        STATS.count('highlight.tokens', tokens)
+        STATS.count('highlight.chars', len(self.content))
+        self._highlight_t0 = None
+        STATS.stop_profile('highlight')
+
+    def _poll_tokenizer(self):
+        """
+        wait for the tokenizer job and apply its result if the text did not change meanwhile
+        """
+        self._tokenize_timer = None
+        if self._tokenize_job is None:
+            return None
+        future, snippet_id, version, text = self._tokenize_job
+        if not future.done():
+            self._tokenize_timer = self.after(25, self._poll_tokenizer)
+            return None
+        self._tokenize_job = None
+        self.tokenizer.discard(snippet_id, future)
+        if self.snippet is None or snippet_id != self.snippet.filename:
+            return None
+        spans = None if future.cancelled() or future.exception() is not None else future.result()
+        if spans is None or spans.lexer_alias != self.snippet.lexer_alias:
+            # highlight on the Tk thread instead
+            self.highlight_stats['cancelled'] += 1
+            self._start_highlight(offload=False)
+            return None
+        if spans.profile is not None:
+            STATS.add_profile('highlight', spans.profile)
+            spans.profile = None
+        if self.highlighter is None or self.highlighter.lexer is not self.snippet.lexer:
+            self.highlighter = Highlighter(self.snippet.lexer)
+        spans.apply(self.highlighter, text)
+        if version == self.text_version:
+            self._highlight_pass = self._tokenized_run(text)
+            self._highlight_step()
+        else:
+            # outdated, use it as the base for an incremental pass over the current text, nothing
+            # of it is painted yet, so that pass has to retag everything
+            self._retag_all = True
+            self._start_highlight()
+
+    def _tokenized_run(self, text):
+        """
+        the pass over the result of the tokenizer, only retags the text
+        """
+        self.content = text
+        yield from self._retag_run(0, len(text))
+        return len(self.highlighter.starts)
+
+    def retag(self, start, end, first_line=None):
+        """
+        replace the highlight tags between the character offsets start and end, first_line is the
+        line of start if it is known
+        """
+        t0 = STATS.start()
+        cleared = len(self.highlight_tags)
+        tags = apply_spans(self, self.highlighter.text, start, end,
+                           self.highlighter.spans(start, end), self.highlight_tags, first_line)
+        # one tag_remove per cleared tag and one tag_add per applied tag
+        STATS.count('tcl.calls', cleared + len(tags))
+        STATS.stop('highlight.retag', t0)
+        if not tags <= self.highlight_tags:
+            self.highlight_tags |= tags
+            self.configure_tags(tags)
 
     def update_highlight(self):
         if self.snippet is None:
             return None
-        self.snippet.snippet = ''
-        self.default_highlight()
+        self.highlighter = None
+        self.schedule_highlight(delay=0)
 
     def remove_highlight(self):
-        if self.snippet is None:
-            return None
-        self.content = self.get("1.0", END)
-        # self.lines = self.content.split("\n")
-        self.mark_set("range_start", self.row + ".0")
-        # data = self.text.get(self.row + ".0", self.row + "." + str(len(self.lines[int(self.row) - 1])))
-        for token, content in self.snippet.lexer.get_tokens(self.content):
-            self.mark_set("range_end", "range_start + %dc" % len(content))
-            self.tag_remove(str(token), "range_start", "range_end")
-            self.mark_set("range_start", "range_end")
+        self.cancel_highlight()
+        self._retag_rest = None
+        self._retag_all = False
+        self.text_version += 1
+        for tag in self.highlight_tags:
+            self.tag_remove(tag, "1.0", END)
+        self.highlight_tags = set()
+        self.highlighter = None
 
     def select_all(self, event=None):
         self.tag_add(SEL, "1.0", END)
@@ -152,12 +417,177 @@ class TextEditor(Text):
 
     @snippet.setter
     def snippet(self, cs):
+        if TextEditor.span_cache is None:
+            TextEditor.span_cache = SpanCache()
+        if self._snippet is not None:
+            self.flush_highlight()
+            self.cache_spans()
         self.remove_highlight()
+        self.close_pager()
         self._snippet = cs
         if cs is not None:
+            if cs.is_large():
+                self.open_pager(cs.open_pager())
+                return None
             self._snippet.bind("lexer_before_change", self.remove_highlight)
             self._snippet.bind("lexer_after_change", self.update_highlight)
             self.replace_text("1.0", self._snippet.snippet)
+            self.restore_spans()
+
+    def open_pager(self, pager):
+        """
+        show a large snippet read only and without highlighting, only a window of
+        page_window chunks is in the text, it moves along while scrolling
+        """
+        self.pager = pager
+        self.pages = []
+        self.delete("1.0", END)
+        self.load_page()
+        self.config(state=DISABLED, yscrollcommand=self._pager_scrolled)
+
+    def _insert_page(self, index, chunk):
+        state = self.cget('state')
+        self.config(state=NORMAL)
+        super(TextEditor, self).insert(index, chunk)
+        self.config(state=state)
+
+    def _delete_page(self, first, last):
+        state = self.cget('state')
+        self.config(state=NORMAL)
+        super(TextEditor, self).delete(first, last)
+        self.config(state=state)
+
+    def _top_line(self):
+        return int(self.index('@0,0').split('.')[0])
+
+    def load_page(self):
+        """
+        insert the chunk after the window and drop the first one if the window is full, returns False at the end
+        of the file
+        """
+        offset = self.pages[-1][1] if self.pages else self.pager.start
+        chunk = self.pager.chunk_at(offset)
+        if chunk is None:
+            return False
+        chunk, end = chunk
+        self._insert_page(END, chunk)
+        self.pages.append((offset, end, chunk.count('\n')))
+        if len(self.pages) > self.page_window:
+            top = self._top_line()
+            lines = self.pages.pop(0)[2]
+            self._delete_page("1.0", "%d.0" % (lines + 1))
+            super(TextEditor, self).yview("%d.0" % max(1, top - lines))
+        return True
+
+    def load_previous_page(self):
+        """
+        insert the chunk before the window and drop the last one if the window is full, returns False at the
+        start of the file
+        """
+        chunk = self.pager.chunk_before(self.pages[0][0]) if self.pages else None
+        if chunk is None:
+            return False
+        chunk, start = chunk
+        top = self._top_line()
+        self._insert_page("1.0", chunk)
+        lines = chunk.count('\n')
+        self.pages.insert(0, (start, self.pages[0][0], lines))
+        if len(self.pages) > self.page_window:
+            self.pages.pop()
+            self._delete_page("%d.0" % (1 + sum(page[2] for page in self.pages)), END)
+        super(TextEditor, self).yview("%d.0" % (top + lines))
+        return True
+
+    def page_to(self, fraction):
+        """
+        show the line at fraction of the file, the window is read again from the memory map
+        """
+        self.pages = []
+        self._delete_page("1.0", END)
+        offset = self.pager.offset_at(fraction)
+        chunk = self.pager.chunk_at(offset)
+        if chunk is not None:
+            self._insert_page("1.0", chunk[0])
+            self.pages.append((offset, chunk[1], chunk[0].count('\n')))
+        super(TextEditor, self).yview("1.0")
+
+    def yview(self, *args):
+        """
+        with a pager, moveto takes a fraction of the whole file
+        """
+        if self.pager is not None and args and args[0] == MOVETO:
+            return self.page_to(float(args[1]))
+        return super(TextEditor, self).yview(*args)
+
+    def _pager_scrolled(self, first, last):
+        if self.pager is None or not self.pages:
+            return None
+        first, last = float(first), float(last)
+        if self.pager_scrollcommand is not None:
+            start, end = self.pages[0][0], self.pages[-1][1]
+            self.pager_scrollcommand(self.pager.fraction_of(start + first * (end - start)),
+                                     self.pager.fraction_of(start + last * (end - start)))
+        if self._page_timer is None and (
+                (last >= self.page_ahead and self.pages[-1][1] < self.pager.size) or
+                (first <= 1 - self.page_ahead and self.pages[0][0] > self.pager.start)):
+            self._page_timer = self.after_idle(self._load_next_page)
+
+    def _load_next_page(self):
+        self._page_timer = None
+        if self.pager is None or not self.pages:
+            return None
+        first, last = super(TextEditor, self).yview()
+        if last >= self.page_ahead:
+            self.load_page()
+        elif first <= 1 - self.page_ahead:
+            self.load_previous_page()
+
+    def close_pager(self):
+        if self.pager is None:
+            return None
+        if self._page_timer is not None:
+            self.after_cancel(self._page_timer)
+            self._page_timer = None
+        self.pager.close()
+        self.pager = None
+        self.pages = []
+        self.config(state=NORMAL, yscrollcommand='')
+
+    def cache_spans(self):
+        """
+        keep the tokens of the current text for a later re-open
+        """
+        highlighter = self.highlighter
+        if highlighter is None or not highlighter.text or self._snippet is None:
+            return None
+        key = self.span_cache.key(self._snippet.lexer_alias, highlighter.text)
+        if key not in self.span_cache.entries:
+            self.span_cache.put(key, TokenSpans.from_highlighter(self._snippet.filename, self.text_version,
+                                                                 self._snippet.lexer_alias, highlighter))
+
+    def restore_spans(self):
+        """
+        tag the text from the span cache without lexing, returns False if it is not cached
+        """
+        text = self.get("1.0", END)
+        spans = self.span_cache.get(self.span_cache.key(self._snippet.lexer_alias, text))
+        if spans is None:
+            return False
+        self.cancel_highlight()
+        self.content = text
+        self.edit_modified(False)
+        self.highlighter = Highlighter(self._snippet.lexer)
+        spans.apply(self.highlighter, text)
+        self._highlight_pass = self._retag_run(0, len(text))
+        self._highlight_step()
+        return True
+
+    def load_style(self):
+        """
+        apply the style style_name unless a style was set already
+        """
+        if self._style is None:
+            self.style = self.style_name
 
     @property
     def style(self):
@@ -167,6 +597,5 @@ class TextEditor(Text):
     def style(self, style_name):
         if style_name == '':
             style_name = 'default'
-        self._style = get_style_by_name(style_name)
-        self.style_name = style_name
-        self.configure_style()
+        self.configure_style(style_name)
+        self._style = style_name
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import sys
+from array import array
+from collections import OrderedDict
+from hashlib import sha1
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+
+from pysnippetmanager.highlighter import Highlighter
+from pysnippetmanager.lexers import get_lexer
+from pysnippetmanager.profiling import STATS, run_profiled
+
+
+class TokenSpans(object):
+    """
+    compact token spans of a tokenizer run
+
+    token start offsets and checkpoints are kept in arrays, the token types
+    as indices into a small table of tag names
+    """
+    snippet_id = None
+    version = 0
+    lexer_alias = ''
+    opens = ()
+    reaches = ()
+    profile = None  # cProfile stats of the worker run while a highlight capture runs
+
+    def __init__(self, snippet_id, version, lexer_alias, starts, tags, cp_pos=(), cp_tok=(), cp_stack=(),
+                 opens=(), reaches=()):
+        self.snippet_id = snippet_id
+        self.version = version
+        self.lexer_alias = lexer_alias
+        self.table = sorted(set(tags))
+        index = {tag: i for i, tag in enumerate(self.table)}
+        self.starts = array('I', starts)
+        self.types = array('H', [index[tag] for tag in tags])
+        self.cp_pos = array('I', cp_pos)
+        self.cp_tok = array('I', cp_tok)
+        self.cp_stack = list(cp_stack)
+        self.opens = array('I', opens)
+        self.reaches = array('I', reaches)
+
+    @property
+    def tags(self):
+        """
+        tag name of every token
+        """
+        table = self.table
+        return [table[i] for i in self.types]
+
+    @classmethod
+    def from_highlighter(cls, snippet_id, version, lexer_alias, highlighter):
+        return cls(snippet_id, version, lexer_alias, highlighter.starts, highlighter.tags,
+                   highlighter.cp_pos, highlighter.cp_tok, highlighter.cp_stack, highlighter.opens,
+                   highlighter.reaches)
+
+    @property
+    def nbytes(self):
+        """
+        approximate memory used by the spans, the state stacks share their strings with the lexer
+        """
+        size = sum(a.itemsize * len(a) for a in (self.starts, self.types, self.cp_pos, self.cp_tok, self.opens,
+                                                  self.reaches))
+        size += sum(sys.getsizeof(stack) for stack in self.cp_stack)
+        return size + sys.getsizeof(self.cp_stack) + sys.getsizeof(self.table)
+
+    def apply(self, highlighter, text):
+        """
+        load the spans into a Highlighter, text is the text that was tokenized
+        """
+        highlighter.adopt(text, self.starts, self.tags, self.cp_pos, self.cp_tok, self.cp_stack, self.opens,
+                          self.reaches)
+
+
+def tokenize(snippet_id, version, lexer_alias, text, profile=False):
+    """
+    lex text with the lexer for lexer_alias, runs inside the worker, with profile the
+    cProfile stats of the run come back as the profile of the spans
+    """
+    if profile:
+        spans, stats = run_profiled(tokenize, snippet_id, version, lexer_alias, text)
+        spans.profile = stats
+        return spans
+    highlighter = Highlighter(get_lexer(lexer_alias))
+    highlighter.update(text)
+    return TokenSpans.from_highlighter(snippet_id, version, lexer_alias, highlighter)
+
+
+class SpanCache(object):
+    """
+    least recently used TokenSpans keyed by lexer and content hash, bounded by a memory budget
+    """
+    budget = 32 * 1024 * 1024  # bytes
+    entries = None  # (lexer_alias, digest) -> TokenSpans, least recently used first
+    size = 0
+    stats = {}
+
+    def __init__(self, budget=None):
+        if budget is not None:
+            self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stats = dict(hits=0, misses=0, evicted=0)
+
+    @staticmethod
+    def key(lexer_alias, text):
+        return lexer_alias, sha1(text.encode('utf-8', 'surrogatepass')).digest()
+
+    def get(self, key):
+        spans = self.entries.get(key)
+        if spans is None:
+            self.stats['misses'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return spans
+
+    def put(self, key, spans):
+        self.discard(key)
+        nbytes = spans.nbytes
+        if nbytes > self.budget:
+            return None
+        self.entries[key] = spans
+        self.size += nbytes
+        while self.size > self.budget:
+            _, old = self.entries.popitem(last=False)
+            self.size -= old.nbytes
+            self.stats['evicted'] += 1
+
+    def discard(self, key):
+        spans = self.entries.pop(key, None)
+        if spans is not None:
+            self.size -= spans.nbytes
+
+
+class TokenizerPool(object):
+    """
+    runs the tokenization of large texts off the Tk thread
+
+    the work runs in spawned worker processes, a thread would share the GIL with
+    the Tk main loop and stall it while lexing, use_processes=False keeps it in
+    threads where worker processes can not be started
+    """
+    executor = None
+    pending = {}  # snippet id -> future of the latest submission
+    stats = {}
+
+    def __init__(self, max_workers=2, use_processes=True):
+        if use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tokenizer')
+        self.pending = {}
+        self.stats = dict(submitted=0, cancelled=0)
+
+    def submit(self, snippet_id, version, lexer_alias, text):
+        """
+        queue a tokenizer run, a queued run for the same snippet that has not started yet is dropped
+        """
+        previous = self.pending.get(snippet_id)
+        if previous is not None and previous.cancel():
+            self.stats['cancelled'] += 1
+        future = self.executor.submit(tokenize, snippet_id, version, lexer_alias, text, STATS.capturing('highlight'))
+        self.pending[snippet_id] = future
+        self.stats['submitted'] += 1
+        return future
+
+    def discard(self, snippet_id, future):
+        """
+        forget a submission once its result was picked up
+        """
+        if self.pending.get(snippet_id) is future:
+            del self.pending[snippet_id]
+
+    def shutdown(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+        self.executor.shutdown(wait=False)
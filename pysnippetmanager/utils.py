@@ -75,3 +75,62 @@ class StringInputDialog(object):
 
     def wait_for_input(self):
         self.master.wait_window(self.root)
+
+
+class PaletteDialog(object):
+    """
+    a query entry above a list of results that is updated while typing
+
+    query_callback(query) returns a list of (label, key), select_callback(key)
+    is called for the chosen result
+    """
+    root = None
+    e = None
+    listbox = None
+    keys = []
+
+    def __init__(self, master, query_callback, select_callback, window_title="", query=""):
+        self.master = master
+        self.query_callback = query_callback
+        self.select_callback = select_callback
+        self.root = Toplevel(master)
+        self.root.title(window_title)
+        self.e = Entry(self.root, width=60)
+        self.e.pack(side=TOP, fill=X)
+        self.listbox = Listbox(self.root, width=80, height=20)
+        self.listbox.pack(side=TOP, fill=BOTH, expand=YES)
+        self.keys = []
+        self.e.bind("<KeyRelease>", self.update)
+        self.e.bind("<Return>", self.accept)
+        self.e.bind("<Down>", self.focus_list)
+        self.root.bind("<Escape>", self.cancel)
+        self.listbox.bind("<Return>", self.accept)
+        self.listbox.bind("<Double-Button-1>", self.accept)
+        self.e.insert(0, query)
+        self.e.focus_set()
+        self.update()
+
+    def update(self, event=None):
+        if event is not None and event.keysym in ('Return', 'Escape', 'Up', 'Down'):
+            return None
+        results = self.query_callback(self.e.get())
+        self.listbox.delete(0, END)
+        self.keys = [key for label, key in results]
+        if results:
+            self.listbox.insert(END, *[label for label, key in results])
+            self.listbox.selection_set(0)
+
+    def focus_list(self, event=None):
+        self.listbox.focus_set()
+        return 'break'
+
+    def accept(self, event=None):
+        selection = self.listbox.curselection()
+        index = selection[0] if selection else 0
+        if index < len(self.keys):
+            self.root.destroy()
+            self.select_callback(self.keys[index])
+        return 'break'
+
+    def cancel(self, event=None):
+        self.root.destroy()
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import os
+import re
+import select
+import struct
+import threading
+from queue import Queue, Empty
+
+from pysnippetmanager.backup import BACKUP_DIR
+
+SNIPPET_PATTERN = '*.pycsm'
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct('iIII')
+MOUNTS_FILE = '/proc/self/mounts'
+# file systems whose changes made by other machines never reach inotify, fuse covers fuse.sshfs and the like
+REMOTE_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', 'afs', 'ceph', 'glusterfs', '9p', 'fuse')
+
+
+class FileEvent(object):
+    """
+    a change of a snippet file or a directory
+
+    kind is one of 'add', 'modify', 'delete', 'move' (path moved to dest_path) and
+'rescan', events were lost and the whole tree below path has to be read again
+    """
+    kind = ''
+    path = ''
+    dest_path = None
+    is_dir = False
+
+    def __init__(self, kind, path, dest_path=None, is_dir=False):
+        self.kind = kind
+        self.path = path
+        self.dest_path = dest_path
+        self.is_dir = is_dir
+
+    def __repr__(self):
+        return 'FileEvent(%r, %r, %r, is_dir=%r)' % (self.kind, self.path, self.dest_path, self.is_dir)
+
+
+def is_snippet(name):
+    return fnmatch.fnmatch(name, SNIPPET_PATTERN)
+
+
+def scan(directory):
+    """
+    all snippet files and directories below directory, skips the backup folders
+
+    returns a dict path -> (is_dir, inode, mtime_ns, size)
+    """
+    entries = {}
+    stack = [directory]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name == BACKUP_DIR:
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                        entries[entry.path] = (True, st.st_ino, 0, 0)
+                        stack.append(entry.path)
+                    elif is_snippet(entry.name):
+                        st = entry.stat()
+                        entries[entry.path] = (False, st.st_ino, st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+    return entries
+
+
+def mounts(mounts_file=MOUNTS_FILE):
+    """
+    (mount point, file system type) of the mounted file systems, empty where that is unknown
+    """
+    try:
+        with open(mounts_file, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    result = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            # blanks in the mount point are octal escapes (\040)
+            result.append((re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[1]), fields[2]))
+    return result
+
+
+def is_remote(directory, mounts_file=MOUNTS_FILE):
+    """
+    True if directory or a file system mounted below it is a network or fuse file system
+    """
+    directory = os.path.realpath(directory)
+    own = ('', '')
+    below = []
+    for mount_point, fs_type in mounts(mounts_file):
+        if directory == mount_point or directory.startswith(mount_point.rstrip(os.sep) + os.sep):
+            if len(mount_point) >= len(own[0]):
+                own = (mount_point, fs_type)
+        elif mount_point.startswith(directory + os.sep):
+            below.append(fs_type)
+    return any(fs_type.split('.')[0] in REMOTE_FILESYSTEMS for fs_type in [own[1]] + below)
+
+
+class Watcher(object):
+    """
+    base class of the watchers, runs in a thread and puts FileEvents into a queue
+    """
+    base_dir = ''
+    events = None
+    thread = None
+
+    def __init__(self, base_dir):
+        self.base_dir = os.path.abspath(os.path.expanduser(base_dir))
+        self.events = Queue()
+        self._stop = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.__class__.__name__, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        raise NotImplementedError
+
+    def get_events(self):
+        """
+        all events that arrived since the last call, call from the Tk thread
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except Empty:
+                return events
+
+
+class PollingWatcher(Watcher):
+    """
+    detects changes by comparing stat snapshots of the tree every interval seconds,
+    a delete and an add of the same inode are reported as a move
+    """
+    interval = 5.
+
+    def __init__(self, base_dir, interval=None):
+        super(PollingWatcher, self).__init__(base_dir)
+        if interval is not None:
+            self.interval = interval
+        self.snapshot = None
+
+    def run(self):
+        if self.snapshot is None:
+            self.snapshot = scan(self.base_dir)
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        """
+        compare the tree with the last snapshot
+        """
+        current = scan(self.base_dir)
+        previous = self.snapshot
+        self.snapshot = current
+        removed = {}
+        for path, info in previous.items():
+            if path not in current or current[path][0] != info[0]:
+                removed[(info[0], info[1])] = path
+        moved_dirs = []  # (source, destination) of moved directories
+        for path in sorted(current):
+            info = current[path]
+            old = previous.get(path)
+            if old is not None and old[0] == info[0]:
+                if not info[0] and old[1:] != info[1:]:
+                    self.events.put(FileEvent('modify', path))
+                continue
+            if any(path.startswith(dest + os.sep) for source, dest in moved_dirs):
+                continue
+            source = removed.pop((info[0], info[1]), None)
+            if source is not None:
+                self.events.put(FileEvent('move', source, path, is_dir=info[0]))
+                if info[0]:
+                    moved_dirs.append((source, path))
+            else:
+                self.events.put(FileEvent('add', path, is_dir=info[0]))
+        for path, is_dir in sorted((path, key[0]) for key, path in removed.items()):
+            if any(path.startswith(source + os.sep) for source, dest in moved_dirs):
+                continue
+            self.events.put(FileEvent('delete', path, is_dir=is_dir))
+
+
+class InotifyWatcher(Watcher):
+    """
+    uses the Linux inotify API, every directory of the tree gets its own watch
+
+    once a directory can not be watched (e.g. fs.inotify.max_user_watches is used up)
+    the thread goes on as a PollingWatcher
+    """
+    libc = None
+    interval = None  # of the PollingWatcher that takes over
+
+    def __init__(self, base_dir, interval=None):
+        super(InotifyWatcher, self).__init__(base_dir)
+        self.interval = interval
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}  # watch descriptor -> directory
+        self.add_watch(self.base_dir)
+        for path, info in scan(self.base_dir).items():
+            if info[0]:
+                self.add_watch(path)
+
+    def add_watch(self, directory):
+        """
+        watch directory, raises OSError if that fails for another reason than the directory being gone
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = directory
+            return None
+        error = ctypes.get_errno()
+        if error not in (errno.ENOENT, errno.ENOTDIR):
+            raise OSError(error, 'inotify_add_watch failed: %s' % os.strerror(error), directory)
+
+    def run(self):
+        failed = False
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self.fd], [], [], 0.5)
+                if ready:
+                    self.handle(os.read(self.fd, 64 * 1024))
+        except OSError:
+            failed = True
+        finally:
+            os.close(self.fd)
+        if failed:
+            self.poll_instead()
+
+    def poll_instead(self):
+        """
+        a directory could not be watched, report everything through a PollingWatcher from now on
+        """
+        poller = PollingWatcher(self.base_dir, interval=self.interval)
+        poller.events = self.events
+        poller._stop = self._stop
+        poller.snapshot = scan(self.base_dir)
+        # the events of the buffer that failed are lost
+        self.events.put(FileEvent('rescan', self.base_dir, is_dir=True))
+        poller.run()
+
+    def handle(self, data):
+        """
+        translate a buffer of raw inotify events
+        """
+        moved_from = {}  # cookie -> (path, is_dir)
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            is_dir = bool(mask & IN_ISDIR)
+            if name == BACKUP_DIR or not (is_dir or is_snippet(name)):
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_CREATE:
+                if is_dir:
+                    self.add_directory(path)
+                else:
+                    self.events.put(FileEvent('add', path))
+            elif mask & IN_CLOSE_WRITE:
+                self.events.put(FileEvent('modify', path))
+            elif mask & IN_DELETE:
+                self.events.put(FileEvent('delete', path, is_dir=is_dir))
+            elif mask & IN_MOVED_FROM:
+                moved_from[cookie] = (path, is_dir)
+            elif mask & IN_MOVED_TO:
+                source = moved_from.pop(cookie, None)
+                if source is None:
+                    if is_dir:
+                        self.add_directory(path)
+                    else:
+                        self.events.put(FileEvent('add', path))
+                    continue
+                self.events.put(FileEvent('move', source[0], path, is_dir=is_dir))
+                if is_dir:
+                    for wd_moved, watched in list(self.watches.items()):
+                        if watched == source[0] or watched.startswith(source[0] + os.sep):
+                            self.watches[wd_moved] = path + watched[len(source[0]):]
+        for path, is_dir in moved_from.values():
+            # moved out of the tree
+            self.events.put(FileEvent('delete', path, is_dir=is_dir))
+        if overflow:
+            self.resync()
+
+    def resync(self):
+        """
+        the kernel queue overflowed and events are lost, watch the directories created
+        meanwhile and ask for a rescan of the whole tree
+        """
+        for path, info in scan(self.base_dir).items():
+            if info[0]:
+                self.add_watch(path)
+        self.events.put(FileEvent('rescan', self.base_dir, is_dir=True))
+
+    def add_directory(self, path):
+        """
+        watch a new directory and report everything that is already in it
+        """
+        self.add_watch(path)
+        self.events.put(FileEvent('add', path, is_dir=True))
+        for sub_path, info in sorted(scan(path).items()):
+            if info[0]:
+                self.add_watch(sub_path)
+            self.events.put(FileEvent('add', sub_path, is_dir=info[0]))
+
+
+def create_watcher(base_dir, interval=None):
+    """
+    an InotifyWatcher where inotify is available and sees all changes, a PollingWatcher otherwise
+
+    inotify misses the changes other machines make on network file systems, and fails to
+    watch the tree when the watches run out
+    """
+    if is_remote(os.path.expanduser(base_dir)):
+        return PollingWatcher(base_dir, interval=interval)
+    try:
+        return InotifyWatcher(base_dir, interval=interval)
+    except (OSError, AttributeError, TypeError):
+        return PollingWatcher(base_dir, interval=interval)
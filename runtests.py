@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+run the tests in tests/, python runtests.py or python setup.py test
+"""
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import sys
+import unittest
+
+
+def main():
+    """
+    the test suite of the tests directory
+    """
+    return unittest.defaultTestLoader.discover(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests'),
+                                               top_level_dir=os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == "__main__":
+    result = unittest.TextTestRunner(verbosity=2).run(main())
+    sys.exit(not result.wasSuccessful())
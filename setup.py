@@ -27,6 +27,9 @@ setup(
         'pygments',
         'pillow'
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     packages=find_packages(exclude=["project", "project.*"]),
     include_package_data=True,
     test_suite='runtests.main',
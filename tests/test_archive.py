@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pysnippetmanager.archive import export_archive, import_archive, read_manifest
+from pysnippetmanager.storage import FileBackend
+
+SNIPPETS = {
+    'a/one.pycsm': 'python, x\nprint(1)\n',
+    'a/b/two.pycsm': 'sql\nSELECT 1;\n',
+    'three.pycsm': 'text, x, y\nplain\n',
+}
+
+
+def formats():
+    names = ['x.zip', 'x.tar', 'x.tar.gz', 'x.tgz', 'x.tar.xz', 'x.tar.bz2']
+    try:
+        import zstandard
+    except ImportError:
+        return names
+    return names + ['x.tar.zst']
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.backend = FileBackend(os.path.join(self.tmp, 'snippets'))
+        for rel, content in SNIPPETS.items():
+            self.backend.write(os.path.join(self.backend.base_dir, rel), content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_manifest_round_trip(self):
+        for name in formats():
+            with self.subTest(name):
+                filename = os.path.join(self.tmp, name)
+                self.assertEqual(export_archive(self.backend, filename), len(SNIPPETS))
+                manifest = read_manifest(filename)
+                self.assertEqual(sorted(entry['path'] for entry in manifest), sorted(SNIPPETS))
+                entry = [entry for entry in manifest if entry['path'] == 'three.pycsm'][0]
+                self.assertEqual((entry['lexer'], entry['tags']), ('text', ['x', 'y']))
+
+    def test_import(self):
+        for name in formats():
+            with self.subTest(name):
+                filename = os.path.join(self.tmp, name)
+                export_archive(self.backend, filename)
+                target = FileBackend(os.path.join(self.tmp, 'import_' + name))
+                results = list(import_archive(target, filename))
+                self.assertEqual(sorted(status for path, status, error in results), ['added'] * len(SNIPPETS))
+                for rel, content in SNIPPETS.items():
+                    with open(os.path.join(target.base_dir, rel)) as f:
+                        self.assertEqual(f.read(), content)
+                results = list(import_archive(target, filename))
+                self.assertEqual(sorted(status for path, status, error in results), ['skipped'] * len(SNIPPETS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pysnippetmanager import backup
+from pysnippetmanager.backup import BackupStore, apply_delta, make_delta
+from pysnippetmanager.saver import write_snippet
+
+
+class DeltaTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        rnd = random.Random(0)
+        for i in range(300):
+            base = ''.join(rnd.choice('ab\n') for _ in range(rnd.randint(0, 20)))
+            text = ''.join(rnd.choice('abc\n') for _ in range(rnd.randint(0, 20)))
+            self.assertEqual(apply_delta(base, make_delta(base, text)), text, (base, text))
+
+
+class BackupStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'a.pycsm')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_restore_utf8(self):
+        write_snippet(self.filename, 'text\nä\n')
+        write_snippet(self.filename, 'text\n→ ✓\n')
+        store = backup.get_store(self.tmp)
+        first = store.versions('a.pycsm')[-1]
+        self.assertEqual(store.restore(self.filename, first.digest), 'text\nä\n')
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), 'text\nä\n'.encode('utf-8'))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['.backup', 'a.pycsm'])
+        self.assertEqual(len(store.versions('a.pycsm')), 3)
+
+    def test_unchanged_file_not_read(self):
+        write_snippet(self.filename, 'text\none\n')
+        store = BackupStore(self.tmp)
+        # a new session trusts the file that holds the latest logged version
+        with mock.patch.object(backup, 'open', create=True, side_effect=open) as opened:
+            store.backup(self.filename, 'text\ntwo\n')
+        self.assertNotIn(self.filename, [call[0][0] for call in opened.call_args_list])
+        self.assertEqual(len(store.versions('a.pycsm')), 1)
+        # changed outside of the app, the file is backed up before
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write('text\nedited\n')
+        mtime = store.versions('a.pycsm')[0].time + 1
+        os.utime(self.filename, (mtime, mtime))
+        store.backup(self.filename, 'text\nthree\n')
+        self.assertEqual([store.read(version.digest) for version in store.versions('a.pycsm')],
+                         ['text\nedited\n', 'text\none\n'])
+
+    def test_prune_keeps_shared_objects(self):
+        store = BackupStore(self.tmp)
+        store.keep_last, store.keep_daily, store.keep_weekly = 2, 0, 0
+        other = os.path.join(self.tmp, 'b.pycsm')
+        for i in range(10):
+            text = 'text\n' * 50 + '%d\n' % i
+            for filename in (self.filename, other):
+                store.backup(filename, text)
+                with open(filename, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.utime(filename, ns=(i * 10 ** 9, (i + 1) * 10 ** 9))
+                store.written(filename)
+        for name in ('a.pycsm', 'b.pycsm'):
+            versions = store.versions(name)
+            self.assertLessEqual(len(versions), 4)
+            self.assertEqual(store.read(versions[0].digest), 'text\n' * 50 + '9\n')
+        fresh = BackupStore(self.tmp)
+        for version in fresh.versions('a.pycsm') + fresh.versions('b.pycsm'):
+            fresh.read(version.digest)
+        objects = sum(len(files) for _, _, files in os.walk(os.path.join(store.backup_dir, backup.OBJECTS_DIR)))
+        fresh.collect_garbage()
+        self.assertEqual(
+            sum(len(files) for _, _, files in os.walk(os.path.join(store.backup_dir, backup.OBJECTS_DIR))), objects)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from pysnippetmanager.cli import main
+
+
+class CliTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp, 'g'))
+        self.filename = os.path.join(self.tmp, 'g', 'a.pycsm')
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write('foolang, x\nbody\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_cli(self, *argv):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            self.assertEqual(main(list(argv)), 0)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_tag_keeps_unknown_lexer(self):
+        self.run_cli('--base-dir', self.tmp, 'tag', 'g/a', '--add', 'new')
+        with open(self.filename, encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'foolang, x, new\nbody\n')
+        self.run_cli('--base-dir', self.tmp, 'tag', 'g/a', '--remove', 'x')
+        with open(self.filename, encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'foolang, new\nbody\n')
+
+    def test_base_dir_after_command(self):
+        before = self.run_cli('--base-dir', self.tmp, 'list', '--no-index')
+        after = self.run_cli('list', '--no-index', '--base-dir', self.tmp)
+        self.assertEqual(before, after)
+        self.assertEqual([item['lexer'] for item in after], ['foolang'])
+
+    def test_group_with_trailing_slash(self):
+        os.makedirs(os.path.join(self.tmp, 'g', 'tmp'))
+        with open(os.path.join(self.tmp, 'g', 'tmp', 'b.pycsm'), 'w', encoding='utf-8') as f:
+            f.write('text\nbody\n')
+        for base_dir in (self.tmp, self.tmp + '/'):
+            items = self.run_cli('list', '--no-index', '--base-dir', base_dir)
+            self.assertEqual(sorted(item['group'] for item in items), ['g', 'g/tmp'])
+            for group in ('g/tmp', '/g/tmp', 'g/tmp/', './g//tmp'):
+                items = self.run_cli('list', '--no-index', '--base-dir', base_dir, '--group', group)
+                self.assertEqual([item['label'] for item in items], ['b'])
+            items = self.run_cli('list', '--no-index', '--base-dir', base_dir, '--group', '/')
+            self.assertEqual(len(items), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
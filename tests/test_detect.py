@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import Future
+
+from pysnippetmanager.detect import LexerDetector
+
+
+class LazyFuture(Future):
+    """
+    a guess that is finished once somebody waits for it
+    """
+
+    def exception(self, timeout=None):
+        if not self.done():
+            self.set_result('python')
+        return super(LazyFuture, self).exception(timeout)
+
+
+class ManualDetector(LexerDetector):
+    """
+    a detector without worker processes that records the guesses in flight
+    """
+
+    def __init__(self):
+        super(ManualDetector, self).__init__()
+        self.futures = []
+        self.most_in_flight = 0
+
+    def submit(self, text, name=None):
+        self.most_in_flight = max(self.most_in_flight, sum(not future.done() for future in self.futures))
+        self.futures.append(LazyFuture())
+        return self.futures[-1]
+
+
+class DetectFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filenames = []
+        for i in range(20):
+            self.filenames.append(os.path.join(self.tmp, 's%02d.pycsm' % i))
+            with open(self.filenames[-1], 'w', encoding='utf-8') as f:
+                f.write('text\nbody %d\n' % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_limits_futures_in_flight(self):
+        detector = ManualDetector()
+        detector.max_pending = 4
+        results = list(detector.detect_files(self.filenames + [os.path.join(self.tmp, 'missing.pycsm')]))
+        self.assertEqual(results, [(filename, 'python') for filename in self.filenames] +
+                         [(os.path.join(self.tmp, 'missing.pycsm'), None)])
+        self.assertEqual(detector.most_in_flight, 4)
+
+    def test_stops_after_shutdown(self):
+        detector = ManualDetector()
+        detector.max_pending = 4
+        results = detector.detect_files(self.filenames)
+        next(results)
+        detector.shutdown()
+        self.assertEqual(list(results), [])
+        self.assertLess(len(detector.futures), len(self.filenames))
+
+    def test_stops_on_cancelled_guess(self):
+        detector = ManualDetector()
+        detector.max_pending = 4
+        results = detector.detect_files(self.filenames)
+        next(results)
+        # the pool cancels the pending guesses on shutdown
+        for future in detector.futures:
+            future.cancel()
+        self.assertEqual(list(results), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
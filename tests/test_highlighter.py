@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import random
+import unittest
+
+from pygments.lexers import get_lexer_by_name
+
+from pysnippetmanager.highlighter import Highlighter, tag_name
+from pysnippetmanager.spans import apply_spans
+from pysnippetmanager.tokenizer import TokenSpans
+
+PIECES = ["'", '"', '`', '\n', '\n', '#', 'x', 'a b', '<!--', '-->', '/*', '*/', '<a>', '</a>', '\\', ' ', '--',
+          '$(', ')', '{', '}', '=', ';', '"""', '//']
+
+
+def full_tokens(lexer, text):
+    """
+    (starts, tags) of a complete pass of the pygments lexer
+    """
+    starts = []
+    tags = []
+    for pos, token, value in lexer.get_tokens_unprocessed(text):
+        if value:
+            starts.append(pos)
+            tags.append(tag_name(token))
+    return starts, tags
+
+
+class TagRecorder(object):
+    """
+    records the ranges of a Text widget tag by tag
+    """
+
+    def __init__(self):
+        self.added = {}
+
+    def tag_remove(self, tag, *ranges):
+        pass
+
+    def tag_add(self, tag, *ranges):
+        self.added.setdefault(tag, []).extend(ranges)
+
+
+class HighlighterTest(unittest.TestCase):
+
+    def assertIncremental(self, name, old, new):
+        lexer = get_lexer_by_name(name)
+        highlighter = Highlighter(lexer)
+        highlighter.update(old)
+        highlighter.update(new)
+        self.assertEqual((highlighter.starts, highlighter.tags), full_tokens(lexer, new), (name, old, new))
+
+    def test_close_string_further_down(self):
+        old = "x = 'first line\n" + "echo a\n" * 10
+        self.assertIncremental('bash', old, old + "'")
+        self.assertIncremental('bash', "'#x\n\n", "'#x\n\n'\n")
+
+    def test_close_comment_further_down(self):
+        old = "/* open\n" + "int a = 1;\n" * 10
+        self.assertIncremental('c', old, old + "*/")
+        self.assertIncremental('go', old, old + "*/")
+        self.assertIncremental('xml', "<!-- x\n" + "<a>b</a>\n" * 10, "<!-- x\n" + "<a>b</a>\n" * 10 + "-->")
+
+    def test_function_name_further_down(self):
+        self.assertIncremental('java', '\\ </a>\n\n\n`', '\\ </a>\n\nx$(<!--`')
+
+    def test_random_edits(self):
+        rnd = random.Random(0)
+        for name in ('bash', 'sql', 'javascript', 'xml', 'python', 'c', 'java', 'go', 'perl', 'r'):
+            lexer = get_lexer_by_name(name)
+            for i in range(200):
+                text = ''.join(rnd.choice(PIECES) for _ in range(rnd.randint(0, 12)))
+                highlighter = Highlighter(lexer)
+                highlighter.update(text)
+                for j in range(3):
+                    start = rnd.randint(0, len(text))
+                    end = min(len(text), start + rnd.randint(0, 3))
+                    new = text[:start] + ''.join(rnd.choice(PIECES) for _ in range(rnd.randint(0, 3))) + text[end:]
+                    highlighter.update(new)
+                    self.assertEqual((highlighter.starts, highlighter.tags), full_tokens(lexer, new),
+                                     (name, text, new))
+                    text = new
+
+    def test_spans_keep_opens(self):
+        lexer = get_lexer_by_name('c')
+        old = "/* open\n" + "int a = 1;\n" * 10
+        lexed = Highlighter(lexer)
+        lexed.update(old)
+        spans = TokenSpans.from_highlighter(1, 1, 'c', lexed)
+        highlighter = Highlighter(lexer)
+        spans.apply(highlighter, old)
+        highlighter.update(old + "*/")
+        self.assertEqual((highlighter.starts, highlighter.tags), full_tokens(lexer, old + "*/"))
+
+    def test_apply_spans_in_chunks(self):
+        text = '"""doc\nstring"""\n' + 'def f(a):\n    return a  # ä\n' * 20
+        highlighter = Highlighter(get_lexer_by_name('python'))
+        highlighter.update(text)
+        whole = TagRecorder()
+        apply_spans(whole, text, 0, len(text), highlighter.spans(0, len(text)))
+        chunked = TagRecorder()
+        start, line = 0, 1
+        while start < len(text):
+            end = text.find('\n', start + 40) + 1 or len(text)
+            apply_spans(chunked, text, start, end, highlighter.spans(start, end), first_line=line)
+            line += text.count('\n', start, end)
+            start = end
+        # a token crossing a chunk border is added by both chunks
+        self.assertEqual({tag: sorted(set(zip(ranges[::2], ranges[1::2]))) for tag, ranges in whole.added.items()},
+                         {tag: sorted(set(zip(ranges[::2], ranges[1::2]))) for tag, ranges in chunked.added.items()})
+
+
+if __name__ == '__main__':
+    unittest.main()
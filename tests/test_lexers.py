@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pysnippetmanager import lexers
+
+
+class FooLexer(object):
+    name = 'Foo'
+    aliases = ['foo']
+    filenames = ['*.foo']
+    mimetypes = []
+
+
+class BarLexer(FooLexer):
+    name = 'Bar'
+    aliases = ['bar']
+
+
+class PluginLexersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.patch = mock.patch.dict(os.environ, XDG_CACHE_HOME=self.tmp)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.tmp)
+
+    def scan(self, plugins, classes):
+        with mock.patch.object(lexers, '_plugin_entry_points', return_value=plugins), \
+                mock.patch('pygments.plugin.find_plugin_lexers', return_value=iter(classes)) as find:
+            names = [entry[0] for entry in lexers._plugin_lexers()]
+        return names, find.called
+
+    def test_rescan_on_new_plugin(self):
+        foo = [['foo', 'foo:FooLexer', 'pygments-foo', '1.0']]
+        self.assertEqual(self.scan(foo, [FooLexer]), (['Foo'], True))
+        self.assertEqual(self.scan(foo, []), (['Foo'], False))
+        # installed, upgraded or removed plugins are loaded again
+        bar = foo + [['bar', 'bar:BarLexer', 'pygments-bar', '0.1']]
+        self.assertEqual(self.scan(bar, [FooLexer, BarLexer]), (['Foo', 'Bar'], True))
+        upgraded = [['foo', 'foo:FooLexer', 'pygments-foo', '1.1']]
+        self.assertEqual(self.scan(upgraded, [FooLexer]), (['Foo'], True))
+        self.assertEqual(self.scan([], []), ([], True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import builtins
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+from pysnippetmanager.crawler import Crawler
+from pysnippetmanager.metadata import HEADER_SIZE, read_body, read_header
+from pysnippetmanager.snippet import Snippet
+from pysnippetmanager.storage import FileBackend
+
+BODY_SIZE = 256 * 1024
+
+
+class CountingFile(object):
+    """
+    a file object that adds the size of everything read from it to a Counter
+    """
+
+    def __init__(self, f, counter, name):
+        self.f = f
+        self.counter = counter
+        self.name = name
+
+    def read(self, *args):
+        data = self.f.read(*args)
+        self.counter[self.name] += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self.f.readline(*args)
+        self.counter[self.name] += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, self.f.read(0))
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+
+class ReadRecorder(object):
+    """
+    patches open and records how often every snippet file is opened and how much is read from it
+    """
+
+    def __init__(self):
+        self.opened = Counter()
+        self.read = Counter()
+        self._open = builtins.open
+        self.patch = mock.patch('builtins.open', self.open)
+
+    def open(self, file, *args, **kwargs):
+        f = self._open(file, *args, **kwargs)
+        if isinstance(file, str) and file.endswith('.pycsm'):
+            self.opened[file] += 1
+            return CountingFile(f, self.read, file)
+        return f
+
+    def __enter__(self):
+        self.patch.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.patch.stop()
+
+
+class HeaderReadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filenames = []
+        for i in range(20):
+            directory = os.path.join(self.tmp, 'group%d' % (i % 4))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            filename = os.path.join(directory, 'snippet%d.pycsm' % i)
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write('python, tag%d\n' % i)
+                f.write(('x = %d\n' % i) * (BODY_SIZE // 6))
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_crawl_reads_headers_only(self):
+        with ReadRecorder() as recorder:
+            items = [item for item in Crawler(self.tmp).crawl() if item[0] == 'snippet']
+        self.assertEqual(sorted(item[1] for item in items), sorted(self.filenames))
+        self.assertEqual(set(recorder.opened), set(self.filenames))
+        for filename in self.filenames:
+            self.assertEqual(recorder.opened[filename], 1)
+            self.assertLessEqual(recorder.read[filename], HEADER_SIZE)
+        self.assertEqual(sorted(item[3] for item in items), sorted('python, tag%d' % i for i in range(20)))
+
+    def test_long_header_is_bounded(self):
+        filename = os.path.join(self.tmp, 'long.pycsm')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('python, ' + 'x' * (4 * HEADER_SIZE) + '\nbody\n')
+        with ReadRecorder() as recorder:
+            header = read_header(filename)
+        self.assertEqual(len(header.encode('utf-8')), HEADER_SIZE)
+        self.assertLessEqual(recorder.read[filename], HEADER_SIZE)
+
+    def test_body_read_on_access(self):
+        backend = FileBackend(self.tmp)
+        items = dict((item[1], item[3]) for item in Crawler(self.tmp).crawl() if item[0] == 'snippet')
+        filename = self.filenames[0]
+        with ReadRecorder() as recorder:
+            snippet = Snippet(filename=filename, base_dir=self.tmp, header=items[filename], backend=backend)
+            self.assertEqual(snippet.lexer_alias, 'python')
+            self.assertEqual(snippet.tags, ['tag0'])
+            self.assertEqual(recorder.opened[filename], 0)
+            body = snippet.snippet
+            self.assertEqual(recorder.opened[filename], 1)
+            self.assertGreater(recorder.read[filename], BODY_SIZE // 2)
+        self.assertTrue(body.startswith('x = 0\n'))
+
+    def test_snippet_without_header_reads_header_only(self):
+        with ReadRecorder() as recorder:
+            snippet = Snippet(filename=self.filenames[1], base_dir=self.tmp, backend=FileBackend(self.tmp))
+        self.assertEqual(snippet.tags, ['tag1'])
+        self.assertLessEqual(recorder.read[self.filenames[1]], HEADER_SIZE)
+
+    def test_utf8(self):
+        filename = os.path.join(self.tmp, 'utf8.pycsm')
+        with open(filename, 'wb') as f:
+            f.write('python, ä\nprint("€")\n'.encode('utf-8'))
+        self.assertEqual(read_header(filename), 'python, ä')
+        self.assertEqual(read_body(filename), 'print("€")\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
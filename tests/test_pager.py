@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pysnippetmanager.pager import Pager
+
+
+class PagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'a.pycsm')
+        self.body = ''.join('line %d ä\n' % i for i in range(1000))
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write('text\n' + self.body)
+        self.pager = Pager(self.filename, chunk_size=100)
+
+    def tearDown(self):
+        self.pager.close()
+        shutil.rmtree(self.tmp)
+
+    def test_chunks_both_ways(self):
+        chunks = []
+        offset = self.pager.start
+        while self.pager.chunk_at(offset) is not None:
+            chunk, offset = self.pager.chunk_at(offset)
+            self.assertTrue(chunk.endswith('\n'))
+            chunks.append(chunk)
+        self.assertEqual(''.join(chunks), self.body)
+        chunks = []
+        while self.pager.chunk_before(offset) is not None:
+            chunk, offset = self.pager.chunk_before(offset)
+            chunks.insert(0, chunk)
+        self.assertEqual(offset, self.pager.start)
+        self.assertEqual(''.join(chunks), self.body)
+
+    def test_fractions(self):
+        self.assertEqual(self.pager.offset_at(0), self.pager.start)
+        middle = self.pager.offset_at(0.5)
+        self.assertTrue(self.pager.chunk_at(middle)[0].startswith('line 5'))
+        self.assertAlmostEqual(self.pager.fraction_of(middle), 0.5, places=2)
+        self.assertEqual(self.pager.line_start(middle + 3), middle)
+        self.assertEqual(self.pager.chunk_at(self.pager.offset_at(1))[0], 'line 999 ä\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
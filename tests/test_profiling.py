@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pysnippetmanager.crawler import Crawler
+from pysnippetmanager.profiling import STATS
+from pysnippetmanager.tokenizer import TokenizerPool
+
+
+def profiled_functions(filename):
+    return set(function for path, line, function in pstats.Stats(filename).stats)
+
+
+class WorkerProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.patch = mock.patch.dict(os.environ, XDG_CACHE_HOME=os.path.join(self.tmp, 'cache'))
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_crawler_threads(self):
+        for i in range(3):
+            with open(os.path.join(self.tmp, 's%d.pycsm' % i), 'w', encoding='utf-8') as f:
+                f.write('python\nx = 1\n')
+        STATS.profile_next('rescan')
+        self.assertTrue(STATS.start_profile('rescan'))
+        crawler = Crawler(self.tmp)
+        crawler.start()
+        crawler.thread.join()
+        filename = STATS.stop_profile('rescan')
+        self.assertLessEqual({'walk', 'read_header'}, profiled_functions(filename))
+
+    def test_tokenizer_worker(self):
+        pool = TokenizerPool()
+        try:
+            STATS.profile_next('highlight')
+            self.assertTrue(STATS.start_profile('highlight'))
+            spans = pool.submit('a', 1, 'python', 'x = 1\n' * 100).result()
+            self.assertIsNotNone(spans.profile)
+            STATS.add_profile('highlight', spans.profile)
+            filename = STATS.stop_profile('highlight')
+            self.assertLessEqual({'tokenize', 'from_highlighter'}, profiled_functions(filename))
+            # without a capture the workers are not profiled
+            self.assertIsNone(pool.submit('a', 2, 'python', 'x = 1\n').result().profile)
+        finally:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import unittest
+import warnings
+
+from pysnippetmanager.quick_open import QuickOpenIndex
+
+
+class QuickOpenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = QuickOpenIndex()
+        for key, path in enumerate(['grp/a(b).py', 'grp/axb.py', 'c++/x.py', 'a[1]/q.py']):
+            self.index.add(key, path)
+
+    def test_fuzzy(self):
+        self.assertEqual(self.index.search('gaxb'), [1])
+
+    def test_special_characters(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.assertEqual(self.index.search('(b'), [0])
+            self.assertEqual(self.index.search('+x'), [2])
+            self.assertEqual(self.index.search('[1'), [3])
+            self.assertEqual(self.index.search('*'), [])
+            self.assertEqual(self.index.search('?q'), [])
+            # a dot is no wildcard
+            self.assertEqual(self.index.search('a.b'), [])
+
+    def test_pending_paths(self):
+        index = QuickOpenIndex()
+        index.batch_size = 2
+        for key in range(10):
+            index.add(key, 'grp/x%d' % key)
+        index.remove(3)
+        before = [index.search(query) for query in ('x', 'x5', 'gx7', 'rp/')]
+        self.assertEqual(before[1:3], [[5], [7]])
+        self.assertFalse(index.index_pending(budget=0))
+        self.assertTrue(index.index_pending())
+        self.assertEqual([index.search(query) for query in ('x', 'x5', 'gx7', 'rp/')], before)
+        self.assertNotIn(3, index.search('x'))
+
+    def test_shortest_first(self):
+        index = QuickOpenIndex()
+        for key, path in enumerate(['a/longer_label', 'b/lab', 'lab', 'c/x/label']):
+            index.add(key, path)
+        index.index_pending()
+        self.assertEqual(index.search('lab'), [2, 1, 3, 0])
+        self.assertEqual(index.search('lab', limit=2), [2, 1])
+        # fuzzy matches
+        self.assertEqual(index.search('cxl'), [3])
+        self.assertEqual(index.search('cxla'), [3])
+
+
+if __name__ == "__main__":
+    unittest.main()
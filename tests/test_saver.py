@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from pysnippetmanager import saver
+from pysnippetmanager.saver import atomic_write
+
+
+class AtomicWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'a.pycsm')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_utf8(self):
+        atomic_write(self.filename, 'text\nä → ✓\n')
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), 'text\nä → ✓\n'.encode('utf-8'))
+        self.assertEqual(os.listdir(self.tmp), ['a.pycsm'])
+
+    def test_keeps_mode(self):
+        atomic_write(self.filename, 'text\n')
+        # the mode of a new file, not the 0600 of the temp file
+        self.assertEqual(stat.S_IMODE(os.stat(self.filename).st_mode), 0o666 & ~saver._UMASK)
+        os.chmod(self.filename, 0o640)
+        atomic_write(self.filename, 'text\nnew\n')
+        self.assertEqual(stat.S_IMODE(os.stat(self.filename).st_mode), 0o640)
+
+
+if __name__ == "__main__":
+    unittest.main()
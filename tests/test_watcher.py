@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+__author__ = "Martin Schröder"
+__copyright__ = "Copyright 2019, Martin Schröder"
+__email__ = "m.schroeder@tu-berlin.de"
+
+import ctypes
+import errno
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pysnippetmanager.watcher import IN_Q_OVERFLOW, InotifyWatcher, _EVENT_HEADER, is_remote
+
+
+class OutOfWatches(object):
+    """
+    a libc whose inotify_add_watch fails like with fs.inotify.max_user_watches used up
+    """
+
+    @staticmethod
+    def inotify_add_watch(fd, path, mask):
+        ctypes.set_errno(errno.ENOSPC)
+        return -1
+
+
+class InotifyWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        try:
+            self.watcher = InotifyWatcher(self.tmp)
+        except (OSError, AttributeError, TypeError):
+            shutil.rmtree(self.tmp)
+            self.skipTest('inotify is not available')
+
+    def tearDown(self):
+        if self.watcher.thread is None:
+            os.close(self.watcher.fd)
+        else:
+            self.watcher.stop()
+            self.watcher.thread.join()
+        shutil.rmtree(self.tmp)
+
+    def test_overflow_asks_for_rescan(self):
+        # a directory the watcher missed while the queue was full
+        os.makedirs(os.path.join(self.tmp, 'missed'))
+        self.watcher.handle(_EVENT_HEADER.pack(-1, IN_Q_OVERFLOW, 0, 0))
+        events = self.watcher.get_events()
+        self.assertEqual([(event.kind, event.path) for event in events], [('rescan', self.tmp)])
+        self.assertIn(os.path.join(self.tmp, 'missed'), self.watcher.watches.values())
+
+    def test_out_of_watches(self):
+        self.watcher.libc = OutOfWatches()
+        self.assertRaises(OSError, self.watcher.add_watch, self.tmp)
+        self.watcher.interval = 0.05
+        self.watcher.start()
+        os.makedirs(os.path.join(self.tmp, 'new'))
+        events = []
+        deadline = time.time() + 5
+        while time.time() < deadline and ('add', os.path.join(self.tmp, 'new', 'a.pycsm')) not in events:
+            if ('rescan', self.tmp) in events:
+                # the PollingWatcher took over
+                with open(os.path.join(self.tmp, 'new', 'a.pycsm'), 'w') as f:
+                    f.write('text\n')
+            time.sleep(0.05)
+            events += [(event.kind, event.path) for event in self.watcher.get_events()]
+        self.assertIn(('rescan', self.tmp), events)
+        self.assertIn(('add', os.path.join(self.tmp, 'new', 'a.pycsm')), events)
+
+
+class RemoteTest(unittest.TestCase):
+
+    def test_is_remote(self):
+        with tempfile.NamedTemporaryFile('w', suffix='mounts', delete=False) as f:
+            f.write('/dev/sda1 / ext4 rw 0 0\n'
+                    'server:/export /mnt/nfs\\040share nfs4 rw 0 0\n'
+                    'me@host:/ /home/me/remote fuse.sshfs rw 0 0\n')
+        try:
+            self.assertFalse(is_remote('/home/me/snippets', f.name))
+            self.assertTrue(is_remote('/mnt/nfs share/snippets', f.name))
+            # a remote file system mounted inside the tree
+            self.assertTrue(is_remote('/home/me', f.name))
+        finally:
+            os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    unittest.main()